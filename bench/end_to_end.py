@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+Benchmark whole tail-parse-send pipeline: real Config and Worker process.
+
+Writer appends generated nginx 'gossip' log lines to file in bursts (at
+'--rate' lines per second or as fast as possible), worker tails it and
+sends stats to local UDP statsd and TCP graphite sinks (statsd stats are
+aggregated for '--flush-interval' seconds, 0 - sent for every line). StatsD
+sink sums 'request_length' counters, so it knows when every burst is
+processed:
+
+ - lines/s: lines divided by time from first write to last line sent;
+ - CPU per line: worker process CPU time divided by lines;
+ - latency: time from burst write till its stats are received;
+ - RSS: worker process max resident set size.
+
+Results are printed as table or JSON ('--json'), JSON of previous run (e.g.
+of another commit) may be compared with '--baseline'.
+
+Usage:
+    python bench/end_to_end.py [--lines 200000] [--rate 0] [--burst 1000]
+                               [--flush-interval 1.0] [--json]
+                               [--baseline results.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import resource
+import argparse
+import tempfile
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gossip.config import Config  # noqa
+from gossip.parsers import batch_of  # noqa
+from gossip.worker import Worker, worker_setup  # noqa
+from parser_tree import generate_lines  # noqa
+
+
+CONFIG = """
+setup
+    statsd(host = '127.0.0.1',
+           port = %(statsd_port)d,
+           prefix = 'stats'%(statsd_extra)s)
+    graphite(host = '127.0.0.1',
+             port = %(graphite_port)d,
+             prefix = 'stats')
+
+file %(path)s as nginx
+    base.skip_empty_string
+        nginx.access_log.skip_empty_requests
+            nginx.access_log.parse
+                nginx.access_log.send_to_statsd(prefix='nginx')
+                end_to_end.send_requests(prefix='nginx')
+"""
+
+# counter, which sink sums to track processed lines
+METRIC = 'stats.nginx.request_length'
+GRAPHITE_METRIC = 'stats.nginx.requests '
+
+
+def send_requests(data, graphite, prefix=None, **kwargs):
+    """
+    Parser: send number of requests to graphite.
+    """
+    graphite.send('requests', 1, prefix=prefix)
+    return data
+
+
+@batch_of(send_requests)
+def send_requests_batch(data, graphite, prefix=None, **kwargs):
+    """
+    Batch version of 'send_requests'.
+    """
+    graphite.send('requests', len(data), prefix=prefix)
+    return data
+
+
+class StatsDSink(threading.Thread):
+    """
+    UDP statsd stand-in: sums 'METRIC' counter and records time when every
+    expected sum (milestone) is reached.
+    """
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.total = 0
+        self.packets = 0
+        self.milestones = []
+        self.reached = {}
+        self.stopped = False
+        super(StatsDSink, self).__init__()
+        self.daemon = True
+
+    def run(self):
+        prefix = METRIC + ':'
+        while not self.stopped:
+            try:
+                packet = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            self.packets += 1
+            for line in packet.split('\n'):
+                if line.startswith(prefix):
+                    self.total += int(line[len(prefix):].split('|')[0])
+            now = time.time()
+            for milestone in self.milestones:
+                if milestone > self.total:
+                    break
+                self.reached.setdefault(milestone, now)
+
+
+class GraphiteSink(threading.Thread):
+    """
+    TCP graphite stand-in: counts received metrics and requests.
+    """
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.metrics = 0
+        self.requests = 0
+        super(GraphiteSink, self).__init__()
+        self.daemon = True
+
+    def run(self):
+        while True:
+            conn, _ = self.sock.accept()
+            buf = ''
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                self.metrics += data.count('\n')
+                # metric lines may be split between reads, count whole ones
+                buf = buf + data
+                lines = buf.split('\n')
+                buf = lines.pop()
+                for line in lines:
+                    if line.startswith(GRAPHITE_METRIC):
+                        self.requests += int(line.split()[1])
+
+
+def children_usage():
+    """
+    Get CPU time and max RSS (KB) of finished children.
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+def git_commit():
+    """
+    Get current commit of repo, None if unknown.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return None
+    return values[int(round(p / 100.0 * (len(values) - 1)))]
+
+
+def run(args):
+    """
+    Run benchmark, return results dict.
+    """
+    statsd_sink = StatsDSink()
+    graphite_sink = GraphiteSink()
+    statsd_sink.start()
+    graphite_sink.start()
+
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'gossip.log')
+    open(path, 'w').close()
+    config_path = os.path.join(tmpdir, 'gossip.conf')
+    statsd_extra = ''
+    if args.flush_interval:
+        statsd_extra = ',\n           flush_interval = %s' % (
+            args.flush_interval)
+    with open(config_path, 'w') as f:
+        f.write(CONFIG % {
+            'statsd_port': statsd_sink.port,
+            'statsd_extra': statsd_extra,
+            'graphite_port': graphite_sink.port,
+            'path': path,
+        })
+
+    lines = generate_lines(args.lines)
+    bursts = [lines[i:i + args.burst]
+              for i in xrange(0, len(lines), args.burst)]
+    total = 0
+    for burst in bursts:
+        total += sum(int(line.split()[2]) for line in burst)
+        statsd_sink.milestones.append(total)
+
+    config = Config(config_path)
+    worker = Worker(config.config, **worker_setup(config.setup))
+    worker.start()
+    time.sleep(0.5)
+
+    written = []
+    started = time.time()
+    with open(path, 'a') as f:
+        for i, burst in enumerate(bursts):
+            f.write('\n'.join(burst) + '\n')
+            f.flush()
+            written.append(time.time())
+            if args.rate:
+                pause = started + (i + 1) * args.burst / args.rate - \
+                    time.time()
+                if pause > 0:
+                    time.sleep(pause)
+
+    deadline = time.time() + args.timeout
+    while statsd_sink.total < total and time.time() < deadline:
+        time.sleep(0.01)
+    finished = max(statsd_sink.reached.values() or [time.time()])
+
+    worker.terminate()
+    worker.join()
+    time.sleep(0.2)
+    statsd_sink.stopped = True
+    cpu, rss = children_usage()
+    os.unlink(path)
+    os.unlink(config_path)
+    os.rmdir(tmpdir)
+
+    latencies = sorted(
+        statsd_sink.reached[milestone] - written[i]
+        for i, milestone in enumerate(statsd_sink.milestones)
+        if milestone in statsd_sink.reached)
+    elapsed = finished - started
+    return {
+        'commit': git_commit(),
+        'lines': args.lines,
+        'rate': args.rate,
+        'burst': args.burst,
+        'complete': (statsd_sink.total == total and
+                     graphite_sink.requests == args.lines),
+        'elapsed': round(elapsed, 3),
+        'lines_per_sec': round(args.lines / elapsed),
+        'cpu_per_line_us': round(cpu / args.lines * 1e6, 2),
+        'latency_ms': dict(
+            ('p%d' % p, round(percentile(latencies, p) * 1000, 2)
+             if latencies else None)
+            for p in (50, 95, 99, 100)),
+        'rss_kb': rss,
+        'statsd_packets': statsd_sink.packets,
+        'graphite_metrics': graphite_sink.metrics,
+    }
+
+
+def compare(results, baseline):
+    """
+    Print results against baseline.
+    """
+    print '%-16s %12s %12s %8s' % ('metric', 'baseline', 'current',
+                                   'change')
+    for key in ('lines_per_sec', 'cpu_per_line_us', 'rss_kb'):
+        old, new = baseline.get(key), results.get(key)
+        if not old or new is None:
+            continue
+        print '%-16s %12s %12s %+7.1f%%' % (key, old, new,
+                                            (new - old) * 100.0 / old)
+    for key, new in sorted(results['latency_ms'].iteritems()):
+        old = baseline.get('latency_ms', {}).get(key)
+        if not old or new is None:
+            continue
+        print '%-16s %12s %12s %+7.1f%%' % ('latency_' + key, old, new,
+                                            (new - old) * 100.0 / old)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Benchmark tail-parse-send pipeline')
+    argparser.add_argument('--lines', type=int, default=200000)
+    argparser.add_argument('--rate', type=float, default=0,
+                           help='lines per second, 0 - as fast as possible')
+    argparser.add_argument('--burst', type=int, default=1000,
+                           help='lines per write')
+    argparser.add_argument('--flush-interval', type=float, default=1.0,
+                           help='statsd flush interval, 0 - no aggregation')
+    argparser.add_argument('--timeout', type=float, default=60.0)
+    argparser.add_argument('--json', action='store_true',
+                           help='print results as JSON')
+    argparser.add_argument('--baseline', default=None,
+                           help='JSON results to compare with')
+    args = argparser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print json.dumps(results, indent=2, sort_keys=True)
+    else:
+        for key, value in sorted(results.iteritems()):
+            print '%-18s %s' % (key, value)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    sys.exit(0 if results['complete'] else 1)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Compare per-line and columnar processing of nginx 'gossip' log.
+
+ - 'per-line': 'nginx.access_log.parse' + 'send_to_statsd' batch versions;
+ - 'columns-numpy': 'nginx.access_log.send_columns' with NumPy;
+ - 'columns-array': 'nginx.access_log.send_columns' with 'array' module.
+
+Stats are aggregated in memory, so network is not measured. Request times
+are counted in statsd quantile sketches by all runners.
+
+Usage:
+    python bench/nginx_columns.py [--lines 200000] [--batch 10000]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gossip.stats import StaticticStatsD  # noqa
+from gossip.parsers.nginx import access_log, columns  # noqa
+from parser_tree import generate_lines  # noqa
+
+
+def per_line(lines, statsd):
+    """
+    Parse every line into dict and send it.
+    """
+    access_log.send_to_statsd_batch(access_log.parse_batch(lines),
+                                    statsd, None, prefix='nginx')
+
+
+def columns_numpy(lines, statsd):
+    """
+    Split lines into NumPy columns.
+    """
+    access_log.send_columns_batch(lines, statsd, None, prefix='nginx')
+
+
+def columns_array(lines, statsd):
+    """
+    Split lines into 'array' module columns.
+    """
+    access_log.send_columns_batch(lines, statsd, None, prefix='nginx',
+                                  use_numpy=False)
+
+
+RUNNERS = [
+    ('per-line', per_line),
+    ('columns-numpy', columns_numpy),
+    ('columns-array', columns_array),
+]
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Compare per-line and columnar processing')
+    argparser.add_argument('--lines', type=int, default=200000)
+    argparser.add_argument('--batch', type=int, default=10000)
+    args = argparser.parse_args()
+
+    lines = generate_lines(args.lines)
+
+    print '%-14s %10s %12s %14s %10s' % ('runner', 'time, s', 'lines/s',
+                                         'bytes_sent', 'p99')
+    for name, runner in RUNNERS:
+        if name == 'columns-numpy' and columns.load_numpy() is None:
+            print '%-14s %10s' % (name, 'no numpy')
+            continue
+
+        statsd = StaticticStatsD(None, '127.0.0.1', 8125, aggregate=True,
+                                 percentiles=(50, 95, 99))
+        started = time.time()
+        for i in xrange(0, len(lines), args.batch):
+            runner(lines[i:i + args.batch], statsd)
+        elapsed = time.time() - started
+
+        counters, _, timers = statsd.take()
+        print '%-14s %10.3f %12.0f %14d %10.3f' % (
+            name, elapsed, len(lines) / elapsed,
+            counters['nginx.bytes_sent'],
+            timers['nginx.request_time'].quantile(0.99))
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+Compare parsers tree runners on README config: lines per second.
+
+ - 'walk': recursive walk of parsers tree for every line (as it was before
+   reading by batches);
+ - 'batch_walk': recursive walk of parsers tree for every batch of lines,
+   arguments are merged with context on every call (as it was before
+   parsers tree compilation);
+ - 'pipeline': compiled pipeline, runs on batches of lines.
+
+'batch_walk' and 'pipeline' get the same batches, so their difference is
+what compilation changed: it doesn't make parsing faster (runners are
+within 10% of each other, either may win), the gain over 'walk' comes from
+batches. Runners are run in turns for '--rounds' rounds, the
+best time of every runner is reported.
+
+Usage:
+    python bench/parser_tree.py [--lines 200000] [--batch 2000] [--rounds 3]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gossip.config import Config  # noqa
+from gossip.worker import worker_setup  # noqa
+
+
+CONFIG = """
+setup
+    statsd(host = '127.0.0.1',
+           port = 8125,
+           prefix = 'stats',
+           flush_interval = 1.0)
+
+file /var/log/nginx/gossip.log as nginx_gossip
+    base.skip_empty_string
+        nginx.access_log.skip_empty_requests
+            nginx.access_log.parse
+                nginx.access_log.send_to_statsd(prefix='nginx')
+        base.print_data
+"""
+
+
+def generate_lines(count):
+    """
+    Generate nginx 'gossip' log lines.
+    """
+    urls = ['/', '/index.html', '/static/app.js', '/static/logo.png',
+            '/static/style.css', '/api/items?page=2', '/search?q=gossip']
+    lines = []
+    for i in xrange(count):
+        lines.append('2013-06-01T12:00:%02d+04:00 10.0.%d.%d %d %.3f %d %d '
+                     '%d %s %s HTTP/1.1' % (
+                         i % 60, i % 7, i % 250, random.randint(200, 900),
+                         random.random(), random.randint(200, 90000),
+                         random.randint(100, 89000),
+                         random.choice((200, 200, 200, 304, 404, 500)),
+                         random.choice(('GET', 'GET', 'POST', 'HEAD')),
+                         random.choice(urls)))
+    return lines
+
+
+def walk(data, parser, context):
+    """
+    Run parsers tree for one line by recursive walk.
+    """
+    if 'cmd' in parser:
+        kwargs = dict(context)
+        kwargs.update(parser.get('args', {}))
+        data = parser['cmd'](data=data, **kwargs)
+    if data is None:
+        return
+    for p in parser.get('parsers', ()):
+        walk(data, p, context)
+
+
+def batch_walk(data, parser, context):
+    """
+    Run parsers tree for batch of lines by recursive walk: batch version of
+    parser is used if it's defined, parser is called for every item
+    otherwise.
+    """
+    if 'cmd' in parser:
+        kwargs = dict(context)
+        kwargs.update(parser.get('args', {}))
+        cmd = parser['cmd']
+        batch = getattr(cmd, 'batch', None)
+        if batch is not None:
+            data = batch(data=data, **kwargs)
+        else:
+            result = []
+            for item in data:
+                item = cmd(data=item, **kwargs)
+                if item is not None:
+                    result.append(item)
+            data = result
+    if not data:
+        return
+    for p in parser.get('parsers', ()):
+        batch_walk(data, p, context)
+
+
+def bench_walk(source, context, lines, batch):
+    """
+    Run 'walk' runner.
+    """
+    started = time.time()
+    for line in lines:
+        walk(line, source, context)
+    return time.time() - started
+
+
+def bench_batch_walk(source, context, lines, batch):
+    """
+    Run 'batch_walk' runner.
+    """
+    started = time.time()
+    for i in xrange(0, len(lines), batch):
+        batch_walk(lines[i:i + batch], source, context)
+    return time.time() - started
+
+
+def bench_pipeline(source, context, lines, batch):
+    """
+    Run 'pipeline' runner.
+    """
+    run = source['pipeline'].bind(**context)
+    started = time.time()
+    for i in xrange(0, len(lines), batch):
+        run(lines[i:i + batch])
+    return time.time() - started
+
+
+RUNNERS = [
+    ('walk', bench_walk),
+    ('batch_walk', bench_batch_walk),
+    ('pipeline', bench_pipeline),
+]
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Compare parsers tree runners')
+    argparser.add_argument('--lines', type=int, default=200000)
+    argparser.add_argument('--batch', type=int, default=2000)
+    argparser.add_argument('--rounds', type=int, default=3)
+    args = argparser.parse_args()
+
+    fd, filename = tempfile.mkstemp(prefix='gossip-bench-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(CONFIG)
+    config = Config(filename)
+    os.remove(filename)
+
+    worker_kwargs = worker_setup(config.setup)
+    source = config.config[0]
+    context = {
+        'logname': source['name'],
+        'hostname': worker_kwargs['hostname'],
+        'statsd': worker_kwargs.get('statsd'),
+        'graphite': worker_kwargs.get('graphite'),
+        'logger': None,
+    }
+    lines = generate_lines(args.lines)
+
+    # 'base.print_data' prints every line
+    stdout = sys.stdout
+    best = {}
+    for _ in xrange(args.rounds):
+        for name, runner in RUNNERS:
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                elapsed = runner(source, context, lines, args.batch)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            best[name] = min(best.get(name, elapsed), elapsed)
+
+    print '%-10s %10s %12s' % ('runner', 'time, s', 'lines/s')
+    for name, _ in RUNNERS:
+        elapsed = best[name]
+        print '%-10s %10.3f %12.0f' % (name, elapsed, len(lines) / elapsed)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Check quantile sketches accuracy and footprint against exact computation.
+
+For every distribution prints relative error of sketch percentiles and
+number of buckets used, then checks that memory stays bounded with high
+metric names cardinality. Exits with status 1 if error is more than
+sketch accuracy.
+
+Usage:
+    python bench/sketch_accuracy.py [--values 200000] [--accuracy 0.01]
+"""
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gossip.sketch import Sketch  # noqa
+from gossip.stats import StatsAggregate  # noqa
+
+
+DISTRIBUTIONS = [
+    ('uniform', lambda: random.uniform(0.001, 2.0)),
+    ('exponential', lambda: random.expovariate(10.0)),
+    ('lognormal', lambda: random.lognormvariate(-3.0, 1.5)),
+    ('pareto', lambda: random.paretovariate(1.2) / 100.0),
+]
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+def exact_quantile(values, q):
+    """
+    Exact quantile of sorted values (same rank as in sketch).
+    """
+    return values[int(q * (len(values) - 1))]
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Check quantile sketches accuracy')
+    argparser.add_argument('--values', type=int, default=200000)
+    argparser.add_argument('--accuracy', type=float, default=0.01)
+    argparser.add_argument('--max-buckets', type=int, default=2048)
+    args = argparser.parse_args()
+
+    failed = False
+    print '%-12s %8s %s' % ('distribution', 'buckets', ' '.join(
+        '%9s' % ('p%s' % p) for p in PERCENTILES))
+    for name, generate in DISTRIBUTIONS:
+        values = [generate() for _ in xrange(args.values)]
+
+        # two sketches merged must be the same as one
+        first = Sketch(args.accuracy, args.max_buckets)
+        second = Sketch(args.accuracy, args.max_buckets)
+        for i, value in enumerate(values):
+            (first if i % 2 else second).add(value)
+        first.merge(second)
+
+        values.sort()
+        errors = []
+        for p in PERCENTILES:
+            exact = exact_quantile(values, p / 100.0)
+            estimate = first.quantile(p / 100.0)
+            errors.append(abs(estimate - exact) / exact)
+        failed = failed or max(errors) > args.accuracy
+        print '%-12s %8d %s' % (name, first.size(), ' '.join(
+            '%8.4f%%' % (e * 100) for e in errors))
+
+    # high cardinality: number of sketches is bounded
+    stats = StatsAggregate(percentiles=(50, 95, 99), max_timers=100)
+    for i in xrange(args.values):
+        stats.timing('request_time.url.u%d' % i, random.random())
+    buckets = sum(sketch.size() for sketch in stats.timers.itervalues())
+    print 'cardinality: %d metrics -> %d sketches, %d buckets' % (
+        args.values, len(stats.timers), buckets)
+    failed = failed or len(stats.timers) > 101
+
+    sys.exit(1 if failed else 0)
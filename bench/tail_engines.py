@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Compare tail engines: latency and CPU usage on the same input.
+
+Writer appends lines with timestamps in bursts and sleeps between them,
+worker (real gossip Worker) tails file and measures latency of every line.
+
+Usage:
+    python bench/tail_engines.py [--bursts 20] [--burst-size 100]
+                                 [--pause 0.5] [--idle 5]
+"""
+import os
+import sys
+import time
+import resource
+import argparse
+import tempfile
+from multiprocessing import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gossip.worker import Worker  # noqa
+
+
+def record_latency(data, queue, **kwargs):
+    """
+    Parser: put line latency into queue.
+    """
+    queue.put(time.time() - float(data.split()[0]))
+    return data
+
+
+def children_cpu():
+    """
+    Get CPU time used by finished children.
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(engine, args):
+    """
+    Run benchmark for tail engine.
+    """
+    fd, filename = tempfile.mkstemp(prefix='gossip-bench-')
+    os.close(fd)
+
+    queue = Queue()
+    source = {
+        'type': 'file',
+        'name': 'bench',
+        'path': filename,
+        'parsers': [{'cmd': record_latency, 'args': {'queue': queue}}],
+    }
+    worker = Worker([source], tail={'engine': engine})
+
+    cpu = children_cpu()
+    worker.start()
+    time.sleep(0.5)
+
+    # idle: nothing is written, measure wakeups cost only
+    time.sleep(args.idle)
+
+    # bursts of lines
+    total = args.bursts * args.burst_size
+    with open(filename, 'a', 0) as f:
+        for _ in range(args.bursts):
+            for i in range(args.burst_size):
+                f.write('%.6f line %d\n' % (time.time(), i))
+            time.sleep(args.pause)
+
+    latencies = [queue.get(timeout=10) for _ in range(total)]
+
+    worker.terminate()
+    worker.join()
+    cpu = children_cpu() - cpu
+    os.remove(filename)
+
+    latencies.sort()
+    return {
+        'engine': engine,
+        'lines': total,
+        'cpu': cpu,
+        'avg': sum(latencies) / len(latencies),
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'max': latencies[-1],
+    }
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Compare tail engines')
+    argparser.add_argument('--bursts', type=int, default=20)
+    argparser.add_argument('--burst-size', type=int, default=100)
+    argparser.add_argument('--pause', type=float, default=0.5)
+    argparser.add_argument('--idle', type=float, default=5.0)
+    argparser.add_argument('engines', nargs='*', default=['poll', 'inotify'])
+    args = argparser.parse_args()
+
+    print ('%-8s %8s %8s %10s %10s %10s %10s' % (
+        'engine', 'lines', 'cpu, s', 'avg, ms', 'p50, ms', 'p99, ms',
+        'max, ms'))
+    for engine in args.engines:
+        result = run(engine, args)
+        print ('%-8s %8d %8.3f %10.3f %10.3f %10.3f %10.3f' % (
+            result['engine'], result['lines'], result['cpu'],
+            result['avg'] * 1000, result['p50'] * 1000,
+            result['p99'] * 1000, result['max'] * 1000))
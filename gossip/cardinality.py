@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Metric names cardinality control.
+
+ - 'SpaceSaving' tracks top-K heavy hitters of stream in fixed memory;
+ - 'CardinalityGuard' caps number of distinct metric names per parent, so
+   metric names built from data (e.g. 'request_method.%s') can't blow up
+   statsd and graphite: most frequent names are kept, others are folded.
+"""
+import re
+import time
+import heapq
+import fnmatch
+from collections import defaultdict
+
+
+class SpaceSaving(object):
+    """
+    Space-Saving heavy hitters: counts of most frequent items.
+
+    No more than 'capacity' items are counted. When new item comes and
+    there is no room, item with minimal count is replaced and new one gets
+    its count (so counts are overestimated by no more than 'error').
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        # item -> [count, error]
+        self.counters = {}
+        # (count, item) for every counted item, counts could be stale
+        self.heap = []
+
+    def add(self, item, count=1):
+        """
+        Count item.
+        """
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+            return
+
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+            heapq.heappush(self.heap, (count, item))
+            return
+
+        # find item with minimal count: heap counts could be stale (less
+        # than real ones), so push them back with real counts
+        heap = self.heap
+        while True:
+            min_count, min_item = heap[0]
+            real_count = self.counters[min_item][0]
+            if real_count == min_count:
+                break
+            heapq.heapreplace(heap, (real_count, min_item))
+
+        del self.counters[min_item]
+        self.counters[item] = [min_count + count, min_count]
+        heapq.heapreplace(heap, (min_count + count, item))
+
+    def top(self, k=10):
+        """
+        Get 'k' most frequent items: [(item, count, error)].
+        """
+        items = heapq.nlargest(k, self.counters.iteritems(),
+                               key=lambda item: item[1][0])
+        return [(item, count, error) for item, (count, error) in items]
+
+    def clear(self):
+        """
+        Forget all items.
+        """
+        self.counters = {}
+        self.heap = []
+
+
+class CardinalityGuard(object):
+    """
+    Cap number of distinct metric names per parent.
+
+    Names of every parent are counted by 'SpaceSaving' ('capacity' counters
+    per parent, weighted by counter values). Metric 'parent.name' is sent
+    if 'name' is one of 'max_names' names allowed for 'parent', otherwise
+    it is folded into 'parent.other'. Every 'interval' seconds allowed
+    names are chosen again: top 'max_names' by counts of the last interval,
+    so heavy hitters get slots even if garbage names came first. Until set
+    of allowed names is full, new names are allowed as they come.
+
+    Metrics matching 'keep' patterns (shell-style, e.g.
+    '*.response_status.*') are never folded.
+    """
+    def __init__(self, max_names=50, interval=60.0, capacity=None,
+                 keep=('*.response_status.*',)):
+        self.max_names = max_names
+        self.interval = interval
+        self.capacity = capacity or 4 * max_names
+        if isinstance(keep, basestring):
+            keep = (keep,)
+        self.keep_re = None
+        if keep:
+            self.keep_re = re.compile(
+                '|'.join('(?:%s)' % fnmatch.translate(p) for p in keep))
+        # parent -> allowed names, parent -> names counts
+        self.allowed = defaultdict(set)
+        self.counts = {}
+        self.folded = 0
+        self.reset_time = time.time() + interval
+
+    def __call__(self, metric, count=1):
+        """
+        Get allowed metric name for 'metric' ('count' events of it).
+        """
+        parent, _, name = metric.rpartition('.')
+        if not parent:
+            return metric
+
+        counts = self.counts.get(parent)
+        if counts is None:
+            counts = self.counts[parent] = SpaceSaving(self.capacity)
+        counts.add(name, count)
+
+        allowed = self.allowed[parent]
+        if name in allowed:
+            return metric
+        if len(allowed) < self.max_names:
+            allowed.add(name)
+            return metric
+        if self.keep_re is not None and self.keep_re.match(metric):
+            return metric
+
+        self.folded += 1
+        return '%s.other' % parent
+
+    def tick(self, now=None):
+        """
+        Choose allowed names by counts of the last interval, if it's time
+        to.
+        """
+        if now is None:
+            now = time.time()
+        if now < self.reset_time:
+            return
+        self.reset_time = now + self.interval
+
+        allowed = defaultdict(set)
+        for parent, counts in self.counts.iteritems():
+            allowed[parent] = set(
+                name for name, _, _ in counts.top(self.max_names))
+        self.allowed = allowed
+        self.counts = {}
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Read offsets checkpoints.
+
+Position of every source is saved into '<path>/<name>.offset' file as
+'device inode offset', so worker can resume reading after restart instead
+of seeking to the end of file.
+"""
+import os
+import time
+
+
+class Checkpoint(object):
+    """
+    Read offset store for one source.
+
+    Position is updated in memory after every processed batch and written to
+    disk no more often than every 'interval' seconds.
+    """
+    def __init__(self, path, name, interval=5.0, max_backlog=None,
+                 logger=None):
+        self.filename = os.path.join(path, '%s.offset' % name)
+        self.interval = interval
+        self.max_backlog = max_backlog
+        self.logger = logger
+        self.position = None
+        self.saved = None
+        self.save_time = time.time() + interval
+
+    def load(self):
+        """
+        Load saved position: ((device, inode), offset) or None.
+        """
+        try:
+            with open(self.filename, 'r') as f:
+                device, inode, offset = [int(x) for x in f.read().split()]
+        except (IOError, ValueError):
+            return None
+
+        self.position = self.saved = ((device, inode), offset)
+        return self.position
+
+    def update(self, inode, offset):
+        """
+        Update position and save it if it's time to.
+        """
+        self.position = (inode, offset)
+
+        now = time.time()
+        if now >= self.save_time:
+            self.save_time = now + self.interval
+            self.save()
+
+    def save(self):
+        """
+        Write position to disk.
+        """
+        if self.position is None or self.position == self.saved:
+            return
+
+        (device, inode), offset = self.position
+        tmp_filename = '%s.tmp' % self.filename
+        try:
+            with open(tmp_filename, 'w') as f:
+                f.write('%d %d %d\n' % (device, inode, offset))
+            os.rename(tmp_filename, self.filename)
+        except (IOError, OSError), ex:
+            if self.logger is not None:
+                self.logger.error("can't save checkpoint '%s': %s" % (
+                    self.filename, ex))
+            else:
+                print ("ERROR: can't save checkpoint '%s': %s" % (
+                    self.filename, ex))
+            return
+
+        self.saved = self.position
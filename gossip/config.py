@@ -2,9 +2,19 @@
 """
 Parse gossip config file.
 """
+import os
 import re
+import time
 from importlib import import_module
 
+from gossip.pipeline import Pipeline
+
+
+# resolved parsers: {'module.function': function}. Parsers are resolved in
+# main process before workers are forked, so workers inherit imported
+# modules, and config reloads don't search modules again
+PARSERS = {}
+
 
 class ConfigError(Exception):
     """
@@ -24,10 +34,15 @@ class Config(object):
         self.parser_re = re.compile(r'^([a-zA-Z0-9_.]+)(.*)$')
 
         # internal variables
+        self.filename = filename
         self.config_file = None
         self.config = []
         self.setup = {}
         self.line_no = 0
+        # last error message, if config file wasn't parsed
+        self.error = None
+        # seconds spent to import parsers modules
+        self.import_time = 0.0
 
         if filename is not None:
             self.parse_file(filename)
@@ -69,7 +84,7 @@ class Config(object):
         params = line.rstrip().split(None, 4)
 
         # check for 'as' keyword for define source name
-        if params[2] != 'as':
+        if len(params) < 4 or params[2] != 'as':
             raise ConfigError(
                 "can't find 'as' keyword in source on line %d" % self.line_no)
 
@@ -88,6 +103,12 @@ class Config(object):
         # parse source args, depengs on source type
         if params[0] == 'file':
             source.update({'path': params[1]})
+        elif params[0] in ('glob', 'dir'):
+            # files are found at runtime, see 'gossip.worker.FileGlob'
+            source.update({'path': params[1]})
+        elif params[0] in ('udp', 'tcp', 'unix'):
+            # address to listen on, see 'gossip.listen'
+            source.update({'path': params[1]})
         else:
             raise ConfigError("unknown source on line %d" % self.line_no)
 
@@ -99,6 +120,10 @@ class Config(object):
 
         Try to import parse function from module.
         """
+        command = PARSERS.get(cmd)
+        if command is not None:
+            return command
+
         if not '.' in cmd:
             raise ConfigError(
                 "please, define 'module.function' on line %d" % cmd_line_no)
@@ -107,6 +132,7 @@ class Config(object):
         module_name, class_name = cmd.rsplit('.', 1)
 
         # try to import module
+        started = time.time()
         try:
             module = import_module(module_name)
         except ImportError:
@@ -115,6 +141,8 @@ class Config(object):
                 module = import_module('gossip.parsers.%s' % module_name)
             except ImportError, ex:
                 raise ConfigError("%s on line %d" % (ex.message, cmd_line_no))
+        finally:
+            self.import_time += time.time() - started
 
         # try to find class in imported module
         try:
@@ -124,6 +152,7 @@ class Config(object):
                 "can't import name '%s' from module '%s' on line %d" % (
                     class_name, module_name, cmd_line_no))
 
+        PARSERS[cmd] = command
         return command
 
     def parse_parser(self, line, source):
@@ -159,14 +188,36 @@ class Config(object):
 
         parser = {
             'cmd': parser_cmd,
+            'cmd_name': parser_cmd,
             'args': parser_args,
             'line': parsers_line_no,
         }
         if source['type'] != 'setup':
             parser['cmd'] = self.initialize_parser(parser['cmd'],
                                                    parsers_line_no)
+            self.compile_parser(parser)
         return parser
 
+    def compile_parser(self, parser):
+        """
+        Compile parser with its args if parser has compiler.
+        """
+        compiler = getattr(parser['cmd'], 'compile', None)
+        if compiler is None:
+            return
+
+        try:
+            parser['cmd'] = compiler(**parser['args'])
+        except (TypeError, ValueError), ex:
+            raise ConfigError("can't compile parser on line %d: %s" % (
+                parser['line'], ex))
+        # args from config are kept to compare sources on reload, and
+        # compiler to compile parser again for every bind (see
+        # 'gossip.pipeline.Pipeline.bind_branches')
+        parser['compiled_args'] = parser['args']
+        parser['args'] = {}
+        parser['compiler'] = compiler
+
     def build_source(self, source, parsers):
         """
         Build source from source and parsers.
@@ -211,7 +262,6 @@ class Config(object):
         parsers = [p for p in parsers if p['level'] == 0]
         for parser in parsers:
             parser.pop('level', None)
-            parser.pop('line', None)
         source.pop('line', None)
 
         source['parsers'] = parsers
@@ -248,9 +298,9 @@ class Config(object):
                                 self.setup[parser['cmd']] = parser['args']
                     else:
                         # append previous source with parsers to config
-                        self.config.append(
-                            self.build_source(source, parsers)
-                        )
+                        source = self.build_source(source, parsers)
+                        source['pipeline'] = Pipeline(source['parsers'])
+                        self.config.append(source)
 
                 if not lastline:
                     # parse new source
@@ -269,12 +319,29 @@ class Config(object):
         """
         Parse config file by filename.
         """
+        # absolute path: daemon changes working directory
+        self.filename = os.path.abspath(filename)
         try:
             with open(filename, 'r') as conf:
                 self.config_file = conf
                 self.parse_config()
         except IOError, ex:
-            print "ERROR: can't read from config file '%s': %s" % (filename,
-                                                                   ex)
+            self.error = "can't read from config file '%s': %s" % (filename,
+                                                                  ex)
+            print "ERROR: %s" % self.error
         except ConfigError, ex:
-            print "ERROR: can't parse config file '%s': %s" % (filename, ex)
+            self.error = "can't parse config file '%s': %s" % (filename, ex)
+            print "ERROR: %s" % self.error
+
+
+def parsers_signature(parsers):
+    """
+    Get comparable signature of parsers tree: parsers names and args
+    from config, without config lines.
+    """
+    return [
+        (parser.get('cmd_name'),
+         sorted(parser.get('compiled_args', parser.get('args', {})).items()),
+         parsers_signature(parser.get('parsers', ())))
+        for parser in parsers
+    ]
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Network sources: receive log lines over UDP, TCP or unix socket.
+
+Nginx sends access log to syslog server ('access_log syslog:server=...')
+as one UDP (or unix socket) datagram per line, so log lines go straight
+from nginx to parsers without writing second log to disk. Syslog header
+('<190>Jun  1 12:00:00 host nginx: ') is stripped from lines.
+
+Sockets are non-blocking and watched by the same watcher as tailed files:
+when socket is ready, listener drains all pending datagrams (no more than
+'batch_size') and passes them to parsers as one batch. TCP connections are
+read by large blocks and split into lines by newlines.
+"""
+import os
+import re
+import errno
+import socket
+
+
+# '<PRI>Mmm dd hh:mm:ss hostname tag: ', timestamp and hostname are optional
+SYSLOG_RE = re.compile(
+    r'<\d{1,3}>(?:[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d )?'
+    r'(?:[^\s:]+ )?[^\s:]+: ')
+
+# non-blocking socket has nothing to read
+EAGAIN = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+def strip_syslog(line):
+    """
+    Strip syslog header from line, if it has one.
+    """
+    if line[:1] != '<':
+        return line
+    match = SYSLOG_RE.match(line)
+    if match is None:
+        return line
+    return line[match.end():]
+
+
+def parse_address(kind, address):
+    """
+    Get socket family and address: 'host:port' for 'udp' and 'tcp', path
+    for 'unix'.
+    """
+    if kind == 'unix':
+        return socket.AF_UNIX, address
+
+    host, sep, port = address.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError("can't parse address '%s', use 'host:port'" %
+                         address)
+    host = host.strip('[]') or '0.0.0.0'
+    if ':' in host:
+        return socket.AF_INET6, (host, int(port))
+    return socket.AF_INET, (host, int(port))
+
+
+class DatagramListener(object):
+    """
+    UDP or unix datagram socket listener: one or more lines per datagram.
+    """
+    # sockets are never rotated, see 'gossip.worker.Worker.read_tail'
+    inode = None
+
+    def __init__(self, kind, address, batch_size=1024, buffer_size=4194304,
+                 syslog=True, **kwargs):
+        self.kind = kind
+        self.family, self.address = parse_address(kind, address)
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.syslog = syslog
+        self.sock = None
+        # bytes received
+        self.bytes_read = 0
+
+    def open(self):
+        """
+        Create socket and bind it to address.
+        """
+        sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                            self.buffer_size)
+            if self.family == socket.AF_UNIX:
+                if os.path.exists(self.address):
+                    # socket left by previous run
+                    os.unlink(self.address)
+            else:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(self.address)
+            sock.setblocking(0)
+        except socket.error:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def watch(self, watcher, key):
+        """
+        Watch socket: watcher reports 'key' when there is data to read.
+        """
+        watcher.add_fd(key, self.sock.fileno())
+
+    def read_lines(self):
+        """
+        Read all pending datagrams (no more than 'batch_size').
+
+        Returns list of lines or None if there is nothing to read.
+        """
+        recv = self.sock.recv
+        datagrams = []
+        append = datagrams.append
+        size = 0
+        for _ in xrange(self.batch_size):
+            try:
+                data = recv(65536)
+            except socket.error, e:
+                if e.args[0] in EAGAIN:
+                    break
+                raise
+            size += len(data)
+            append(data)
+        if not datagrams:
+            return None
+
+        self.bytes_read += size
+        lines = '\n'.join(datagrams).split('\n')
+        if self.syslog:
+            return [strip_syslog(line).strip() for line in lines]
+        return [line.strip() for line in lines]
+
+    def position(self):
+        """
+        Sockets have no position to resume from.
+        """
+        return None
+
+    def lag(self):
+        """
+        Lag is unknown for socket.
+        """
+        return 0
+
+    def close(self):
+        """
+        Close socket.
+        """
+        if self.sock is None:
+            return
+        self.sock.close()
+        self.sock = None
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+class StreamListener(object):
+    """
+    TCP listener: lines are separated by newlines, many clients may be
+    connected at once.
+    """
+    # sockets are never rotated, see 'gossip.worker.Worker.read_tail'
+    inode = None
+
+    def __init__(self, kind, address, block_size=262144, syslog=True,
+                 **kwargs):
+        self.kind = kind
+        self.family, self.address = parse_address(kind, address)
+        self.block_size = block_size
+        self.syslog = syslog
+        self.sock = None
+        # connected clients: {fd: [socket, partial line]}
+        self.clients = {}
+        self.watcher = None
+        self.key = None
+        # bytes received
+        self.bytes_read = 0
+
+    def open(self):
+        """
+        Create socket and listen for connections.
+        """
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(self.address)
+            sock.listen(128)
+            sock.setblocking(0)
+        except socket.error:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def watch(self, watcher, key):
+        """
+        Watch socket and connections: watcher reports 'key' when there is
+        new connection or data to read.
+        """
+        self.watcher = watcher
+        self.key = key
+        watcher.add_fd(key, self.sock.fileno())
+
+    def accept(self):
+        """
+        Accept all pending connections.
+        """
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error, e:
+                if e.args[0] in EAGAIN:
+                    return
+                raise
+            conn.setblocking(0)
+            self.clients[conn.fileno()] = [conn, '']
+            if self.watcher is not None:
+                self.watcher.add_fd(self.key, conn.fileno())
+
+    def disconnect(self, fd):
+        """
+        Close client connection, return its last line.
+        """
+        conn, partial = self.clients.pop(fd)
+        if self.watcher is not None:
+            self.watcher.remove_fd(fd)
+        conn.close()
+        return partial
+
+    def read_lines(self):
+        """
+        Accept new connections and read next block from every client.
+
+        Returns list of lines or None if there is nothing to read.
+        """
+        self.accept()
+
+        lines = []
+        received = False
+        for fd, client in self.clients.items():
+            try:
+                block = client[0].recv(self.block_size)
+            except socket.error, e:
+                if e.args[0] in EAGAIN:
+                    continue
+                block = ''
+            received = True
+            if not block:
+                # client is gone, last line may be without newline
+                partial = self.disconnect(fd)
+                if partial:
+                    lines.append(partial)
+                continue
+
+            self.bytes_read += len(block)
+            client_lines = block.split('\n')
+            if client[1]:
+                client_lines[0] = client[1] + client_lines[0]
+            client[1] = client_lines.pop()
+            lines.extend(client_lines)
+
+        if not received:
+            return None
+        if self.syslog:
+            return [strip_syslog(line).strip() for line in lines]
+        return [line.strip() for line in lines]
+
+    def position(self):
+        """
+        Sockets have no position to resume from.
+        """
+        return None
+
+    def lag(self):
+        """
+        Lag is unknown for socket.
+        """
+        return 0
+
+    def close(self):
+        """
+        Close all connections and socket.
+        """
+        for fd in self.clients.keys():
+            self.disconnect(fd)
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+LISTENERS = {
+    'udp': DatagramListener,
+    'unix': DatagramListener,
+    'tcp': StreamListener,
+}
+
+
+def get_listener(kind, address, **kwargs):
+    """
+    Create listener of source type 'kind' ('udp', 'tcp' or 'unix').
+    """
+    if kind not in LISTENERS:
+        raise ValueError("unknown listener '%s'" % kind)
+    return LISTENERS[kind](kind, address, **kwargs)
@@ -1,3 +1,116 @@
 """
 Parsers.
+
+Parser is a function, which gets one log line (or data from parent parser)
+in 'data' and returns data for child parsers or None to stop processing.
+
+Parser may have batch version, which gets list of lines in 'data' and
+returns list of results for child parsers (without None's):
+
+    def parse(data, **kwargs):
+        ...
+
+    @batch_of(parse)
+    def parse_batch(data, **kwargs):
+        ...
+
+Parser may also have compiler, which is called with parser args from
+config and returns parser function (with batch version probably), which
+does the same work with all args compiled in. Compiler is called at config
+load (to report bad args) and again for every source parser is bound to
+(every file of glob source, every shard), so state kept by compiled parser
+is not shared:
+
+    @compiler_of(parse)
+    def compile_parse(**kwargs):
+        ...
+        return parse_compiled
+
+Compiled parser with state (e.g. counters for interval) may have ticker,
+which is called periodically by worker with current time and worker
+context (stats senders, logger):
+
+    @ticker_of(parse_compiled)
+    def tick(now, statsd, graphite, logger, **kwargs):
+        ...
+
+Compiled parser may also change worker context of its child parsers, e.g.
+'base.sample' gives them its sampler in 'sample' argument:
+
+    @context_of(parse_compiled)
+    def child_context(context):
+        return dict(context, sample=sampler)
+
+State of ticker, which can't be merged by stats senders (e.g. window
+results are gauges), is merged by sharded source reader: shards don't tick
+such parser, but give its state collected since last send to reader, which
+merges it into state of its own bound parser and ticks it:
+
+    @taker_of(parse_compiled)
+    def take():
+        return state collected since last call, and reset it
+
+    @merger_of(parse_compiled)
+    def merge(state):
+        add 'state' of shard
 """
+
+
+def batch_of(parser):
+    """
+    Register decorated function as batch version of 'parser'.
+    """
+    def decorator(func):
+        parser.batch = func
+        return func
+    return decorator
+
+
+def compiler_of(parser):
+    """
+    Register decorated function as compiler of 'parser'.
+    """
+    def decorator(func):
+        parser.compile = func
+        return func
+    return decorator
+
+
+def ticker_of(parser):
+    """
+    Register decorated function as ticker of 'parser'.
+    """
+    def decorator(func):
+        parser.tick = func
+        return func
+    return decorator
+
+
+def context_of(parser):
+    """
+    Register decorated function as context changer of 'parser' children.
+    """
+    def decorator(func):
+        parser.context = func
+        return func
+    return decorator
+
+
+def taker_of(parser):
+    """
+    Register decorated function as taker of 'parser' state in shards.
+    """
+    def decorator(func):
+        parser.take = func
+        return func
+    return decorator
+
+
+def merger_of(parser):
+    """
+    Register decorated function as merger of 'parser' state from shards.
+    """
+    def decorator(func):
+        parser.merge = func
+        return func
+    return decorator
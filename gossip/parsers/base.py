@@ -2,6 +2,12 @@
 """
 Base parsers.
 """
+import re
+
+from gossip.parsers import (batch_of, compiler_of, context_of, merger_of,
+                            taker_of, ticker_of)
+from gossip.sampling import Sampler
+from gossip.window import Window
 
 
 def skip_empty_string(data, **kwargs):
@@ -14,6 +20,14 @@ def skip_empty_string(data, **kwargs):
     return data
 
 
+@batch_of(skip_empty_string)
+def skip_empty_string_batch(data, **kwargs):
+    """
+    Batch version of 'skip_empty_string'.
+    """
+    return [line for line in data if line and isinstance(line, basestring)]
+
+
 def grep(data, include=None, exclude=None, **kwargs):
     """
     This parser greps string for 'include' or 'exclude' substrings.
@@ -30,6 +44,397 @@ def grep(data, include=None, exclude=None, **kwargs):
     return None
 
 
+@batch_of(grep)
+def grep_batch(data, include=None, exclude=None, **kwargs):
+    """
+    Batch version of 'grep'.
+    """
+    return [
+        line for line in data
+        if line and isinstance(line, basestring) and (
+            (include is not None and include in line) or
+            (exclude is not None and exclude not in line))
+    ]
+
+
+class MatchedLine(str):
+    """
+    Line matched by 'match' with name of matched include pattern in 'route'.
+    """
+    route = None
+
+
+def match_patterns(patterns, is_regex):
+    """
+    Get [(route, regex)] for 'match' patterns: string, list or dict
+    {route: pattern}.
+    """
+    if not patterns:
+        return []
+    if isinstance(patterns, basestring):
+        patterns = [patterns]
+    if isinstance(patterns, dict):
+        items = sorted(patterns.iteritems())
+    else:
+        items = [(None, pattern) for pattern in patterns]
+
+    result = []
+    for route, pattern in items:
+        if not isinstance(pattern, basestring):
+            raise ValueError("pattern must be a string: %r" % (pattern,))
+        if not is_regex:
+            pattern = re.escape(pattern)
+        result.append((route, pattern))
+    return result
+
+
+def compile_matcher(include=(), exclude=(), include_re=(), exclude_re=()):
+    """
+    Compile 'match' patterns into one regex for includes and one for
+    excludes.
+
+    Returns function, which gets line and returns None if line doesn't
+    match, route name of matched include pattern (or '' if it has no name)
+    otherwise.
+    """
+    excludes = (match_patterns(exclude, False) +
+                match_patterns(exclude_re, True))
+    includes = (match_patterns(include, False) +
+                match_patterns(include_re, True))
+    if not excludes and not includes:
+        raise ValueError("no patterns to match")
+
+    # plain alternations without groups are much faster, than one regex
+    # with named group for every pattern; route is found with the last one
+    # only at position of match
+    try:
+        exclude_search = include_search = route_match = None
+        if excludes:
+            exclude_search = re.compile(
+                '|'.join(pattern for _, pattern in excludes)).search
+        if includes:
+            include_search = re.compile(
+                '|'.join(pattern for _, pattern in includes)).search
+            route_match = re.compile('|'.join(
+                '(?P<i%d>%s)' % (i, pattern)
+                for i, (_, pattern) in enumerate(includes))).match
+    except re.error, e:
+        raise ValueError("bad pattern: %s" % e)
+    routes = dict(('i%d' % i, route or '')
+                  for i, (route, _) in enumerate(includes))
+    routed = any(routes.itervalues())
+
+    def matcher(line):
+        if exclude_search is not None and exclude_search(line):
+            return None
+        if include_search is None:
+            return ''
+        found = include_search(line)
+        if found is None:
+            return None
+        if not routed:
+            return ''
+        return routes[route_match(line, found.start()).lastgroup]
+    return matcher
+
+
+def match(data, include=(), exclude=(), include_re=(), exclude_re=(),
+          **kwargs):
+    """
+    This parser matches string against many substrings and regexes at once.
+
+    String passes if it contains any of 'include' substrings or
+    'include_re' regexes (or there are none) and none of 'exclude' and
+    'exclude_re' ones. Every argument is string or list of strings.
+
+    Include patterns may be named with dict {route: pattern}: then matched
+    string has route name in 'route' attribute, so child 'route' parsers
+    get only their strings without matching them again.
+
+    Patterns are compiled at config load (see 'compile_match'), this
+    version compiles them on every call, so it is slow.
+    """
+    if not data or not isinstance(data, basestring):
+        return None
+
+    return compile_match(include, exclude, include_re, exclude_re)(data)
+
+
+@compiler_of(match)
+def compile_match(include=(), exclude=(), include_re=(), exclude_re=(),
+                  **kwargs):
+    """
+    Compile 'match' patterns into one regex, so string is scanned once.
+    """
+    matcher = compile_matcher(include, exclude, include_re, exclude_re)
+    routed = isinstance(include, dict) or isinstance(include_re, dict)
+
+    def match_compiled(data, **kwargs):
+        """
+        Match string with compiled patterns.
+        """
+        if not data or not isinstance(data, basestring):
+            return None
+        route = matcher(data)
+        if route is None:
+            return None
+        if routed:
+            data = MatchedLine(data)
+            data.route = route
+        return data
+
+    @batch_of(match_compiled)
+    def match_compiled_batch(data, **kwargs):
+        """
+        Batch version of 'match_compiled'.
+        """
+        result = []
+        append = result.append
+        for line in data:
+            if not line:
+                continue
+            route = matcher(line)
+            if route is None:
+                continue
+            if routed:
+                line = MatchedLine(line)
+                line.route = route
+            append(line)
+        return result
+
+    return match_compiled
+
+
+def route(data, name=None, **kwargs):
+    """
+    This parser passes only strings matched by 'match' pattern 'name'.
+    """
+    if getattr(data, 'route', None) != name:
+        return None
+
+    return data
+
+
+@batch_of(route)
+def route_batch(data, name=None, **kwargs):
+    """
+    Batch version of 'route'.
+    """
+    return [line for line in data if getattr(line, 'route', None) == name]
+
+
+# window aggregations
+WINDOW_AGGS = ('count', 'rate', 'sum', 'avg', 'ratio')
+
+# chars not allowed in window key metric name
+WINDOW_KEY_RE = re.compile(r'[^a-zA-Z0-9_-]+')
+
+
+def window(data, size=10, key=None, agg='rate', field=None, low=None,
+           high=None, slots=1, max_keys=1000, name=None, prefix=None,
+           **kwargs):
+    """
+    This parser aggregates parsed records (dicts) in time windows and sends
+    results every window (or every slot of sliding window).
+
+    Records are grouped by value of 'key' field (all together if it's not
+    set) in windows of 'size' seconds, which are tumbling ('slots=1') or
+    sliding by 'size / slots' seconds. Aggregation 'agg' is one of:
+
+     - 'count': number of records;
+     - 'rate': records (sum of 'field' if it's set) per second;
+     - 'sum': sum of 'field';
+     - 'avg': average of 'field';
+     - 'ratio': part of records with 'field' between 'low' and 'high'
+       (e.g. 5xx responses).
+
+    Results are sent as '<name>.<key value>' gauges (name is 'agg' by
+    default) to statsd, or to graphite if there is no statsd. No more than
+    'max_keys' keys are kept, the rest go to 'other'. Records of sampled
+    lines (see 'sample') are counted 'n' times. Windows are kept by
+    compiled version (see 'compile_window'), this version does nothing.
+    """
+    return data
+
+
+@compiler_of(window)
+def compile_window(size=10, key=None, agg='rate', field=None, low=None,
+                   high=None, slots=1, max_keys=1000, name=None, prefix=None,
+                   **kwargs):
+    """
+    Compile 'window': create window and its ticker. Shards give their
+    counts to window of reader, which sends results.
+    """
+    if agg not in WINDOW_AGGS:
+        raise ValueError("unknown window aggregation '%s', use one of: %s" % (
+            agg, ', '.join(WINDOW_AGGS)))
+    if agg in ('sum', 'avg', 'ratio') and field is None:
+        raise ValueError("window aggregation '%s' needs 'field'" % agg)
+    if agg == 'ratio' and low is None and high is None:
+        raise ValueError("window aggregation 'ratio' needs 'low' or 'high'")
+    counter = Window(size, slots, max_keys)
+    name = name or agg
+
+    def hit_of(value):
+        """
+        Check if value is counted by ratio.
+        """
+        return int(value is not None and
+                   (low is None or value >= low) and
+                   (high is None or value <= high))
+
+    def window_compiled(data, sample=None, **kwargs):
+        """
+        Count record in window.
+        """
+        if data is None:
+            return None
+        window_compiled_batch([data], sample)
+        return data
+
+    @batch_of(window_compiled)
+    def window_compiled_batch(data, sample=None, **kwargs):
+        """
+        Batch version of 'window_compiled'.
+        """
+        add = counter.add
+        n = sample.n if sample is not None else 1
+        if agg == 'ratio':
+            for item in data:
+                value = item.get(field)
+                add(item.get(key) if key is not None else None,
+                    (value or 0) * n, hit_of(value) * n, n)
+        elif field is not None:
+            for item in data:
+                add(item.get(key) if key is not None else None,
+                    (item.get(field) or 0) * n, 0, n)
+        elif key is not None:
+            for item in data:
+                add(item.get(key), 0, 0, n)
+        else:
+            for item in data:
+                add(None, 0, 0, n)
+        return data
+
+    @ticker_of(window_compiled)
+    def tick(now, statsd=None, graphite=None, **kwargs):
+        """
+        Move window and send its results.
+        """
+        if not counter.advance(now):
+            return
+        if statsd is not None:
+            send = statsd.gauge
+        elif graphite is not None:
+            send = graphite.send
+        else:
+            return
+
+        duration = counter.duration()
+        for value, count, total, hits in counter.totals():
+            if agg == 'count':
+                result = count
+            elif agg == 'rate':
+                result = float(total if field is not None else count)
+                result = result / duration
+            elif agg == 'sum':
+                result = total
+            elif not count:
+                # key is gone from window
+                result = 0.0
+            elif agg == 'avg':
+                result = float(total) / count
+            else:
+                result = float(hits) / count
+
+            metric = name
+            if key is not None:
+                if value is None:
+                    value = ''
+                metric = '%s.%s' % (name, WINDOW_KEY_RE.sub(
+                    '_', str(value)).strip('_') or 'empty')
+            send(metric, result, prefix=prefix)
+
+    @taker_of(window_compiled)
+    def take():
+        """
+        Take counts of shard window.
+        """
+        return counter.take()
+
+    @merger_of(window_compiled)
+    def merge(totals):
+        """
+        Add counts of shard window.
+        """
+        for value, count, total, hits in totals:
+            counter.add(value, total, hits, count)
+
+    return window_compiled
+
+
+def sample(data, n=10, method='random', field=None, target=None,
+           interval=10, max_n=1000, **kwargs):
+    """
+    This parser passes 1-in-'n' lines (or records) to child parsers.
+
+    Lines are chosen by 'method': 'random' or 'hash' of line ('field' value
+    of record, if it's set, so records with the same value are chosen
+    together). With 'target' lines per second 'n' is adapted to rate of
+    lines every 'interval' seconds (no more than 'max_n'). Child parsers
+    get sampler in 'sample' argument and scale counters up by 'n' (see
+    'gossip.sampling'). Sampler is kept by compiled version (see
+    'compile_sample'), this version passes all lines.
+    """
+    return data
+
+
+@compiler_of(sample)
+def compile_sample(n=10, method='random', field=None, target=None,
+                   interval=10, max_n=1000, **kwargs):
+    """
+    Compile 'sample': create sampler.
+    """
+    sampler = Sampler(n, method, target, interval, max_n)
+    hashed = method == 'hash' and field is not None
+
+    def sample_compiled(data, **kwargs):
+        """
+        Pass line if it is chosen.
+        """
+        if data is None:
+            return None
+        data = sample_compiled_batch([data])
+        return data[0] if data else None
+
+    @batch_of(sample_compiled)
+    def sample_compiled_batch(data, **kwargs):
+        """
+        Batch version of 'sample_compiled'.
+        """
+        if hashed:
+            return sampler.choose(data, [str(item.get(field))
+                                         for item in data])
+        return sampler.choose(data)
+
+    @ticker_of(sample_compiled)
+    def tick(now, logger=None, logname=None, **kwargs):
+        """
+        Adapt sampling to rate of lines.
+        """
+        if sampler.adapt(now) and logger is not None:
+            logger.info("%s: sampling 1 of %d lines" % (logname, sampler.n))
+
+    @context_of(sample_compiled)
+    def child_context(context):
+        """
+        Give sampler to child parsers.
+        """
+        return dict(context, sample=sampler)
+
+    return sample_compiled
+
+
 def print_data(data, logger=None, **kwargs):
     """
     Print log string.
@@ -39,3 +444,14 @@ def print_data(data, logger=None, **kwargs):
     print data
 
     return data
+
+
+@batch_of(print_data)
+def print_data_batch(data, **kwargs):
+    """
+    Batch version of 'print_data'.
+    """
+    for line in data:
+        print line
+
+    return data
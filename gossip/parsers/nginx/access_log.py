@@ -10,9 +10,40 @@ First, add new logger to nginx config:
 
 And tell nginx to write (one more?) access-log with this new format:
     access_log /var/log/nginx/website.gossip.log gossip;
+
+Or parse existing access log with any format by 'parse_format':
+    nginx.access_log.parse_format(log_format='combined')
 """
 # import time
 # from dateutil import parser
+import re
+import time
+from operator import attrgetter, itemgetter
+
+from gossip.cardinality import SpaceSaving
+from gossip.sketch import Sketch
+from gossip.parsers import (batch_of, compiler_of, merger_of, taker_of,
+                            ticker_of)
+from gossip.timestamp import parse_time
+from gossip.parsers.nginx.columns import column_stats, load_numpy, to_columns
+from gossip.parsers.nginx.log_format import (DEFAULT_FIELDS, SEND_FIELDS,
+                                             Record, compile_format)
+
+
+# get fields for 'send_to_statsd' from record and from dict
+record_send_fields = attrgetter(*SEND_FIELDS)
+dict_send_fields = itemgetter(*SEND_FIELDS)
+
+# chars not allowed in url group metric name
+URL_GROUP_RE = re.compile(r'[^a-zA-Z0-9_-]+')
+
+
+def url_group(base_url, depth=1):
+    """
+    Get base url group: first 'depth' path segments joined with '_'.
+    """
+    group = '_'.join(base_url.strip('/').split('/', depth)[:depth])
+    return URL_GROUP_RE.sub('_', group) or 'root'
 
 
 def skip_empty_requests(data, **kwargs):
@@ -30,6 +61,18 @@ def skip_empty_requests(data, **kwargs):
     return data
 
 
+@batch_of(skip_empty_requests)
+def skip_empty_requests_batch(data, **kwargs):
+    """
+    Batch version of 'skip_empty_requests'.
+    """
+    return [
+        line for line in data
+        if line and isinstance(line, basestring) and
+        not line.rstrip().endswith('-')
+    ]
+
+
 def parse(data, **kwargs):
     """
     Parse nginx 'gossip' log.
@@ -37,7 +80,14 @@ def parse(data, **kwargs):
     if not data or not isinstance(data, basestring):
         return None
 
-    data = data.split()
+    return parse_line(data)
+
+
+def parse_line(line):
+    """
+    Parse one nginx 'gossip' log line into dict.
+    """
+    data = line.split()
 
     try:
         url, _ = data[8].split('?')
@@ -62,35 +112,423 @@ def parse(data, **kwargs):
     return data
 
 
-def send_to_statsd(data, statsd, graphite, prefix=None, **kwargs):
+@batch_of(parse)
+def parse_batch(data, **kwargs):
+    """
+    Batch version of 'parse'.
+    """
+    return [
+        parse_line(line) for line in data
+        if line and isinstance(line, basestring)
+    ]
+
+
+def parse_format(data, log_format='gossip', fields=DEFAULT_FIELDS,
+                 **kwargs):
+    """
+    Parse nginx log with any 'log_format' into record.
+
+    Format is compiled at config load (see 'compile_parse_format'), this
+    version compiles it on every call, so it is slow.
+    """
+    if not data or not isinstance(data, basestring):
+        return None
+
+    return compile_format(log_format, fields)(data)
+
+
+@compiler_of(parse_format)
+def compile_parse_format(log_format='gossip', fields=DEFAULT_FIELDS,
+                         **kwargs):
+    """
+    Compile 'parse_format' for 'log_format'.
+
+    Only 'fields' are extracted (fields used by 'send_to_statsd' and
+    'datetime' by default, all fields of format if None).
+    """
+    extract = compile_format(log_format, fields)
+
+    def parse_compiled(data, **kwargs):
+        """
+        Parse nginx log line with compiled log format.
+        """
+        if not data or not isinstance(data, basestring):
+            return None
+        return extract(data)
+
+    @batch_of(parse_compiled)
+    def parse_compiled_batch(data, **kwargs):
+        """
+        Batch version of 'parse_compiled'.
+        """
+        result = []
+        append = result.append
+        for line in data:
+            if line:
+                record = extract(line)
+                if record is not None:
+                    append(record)
+        return result
+
+    return parse_compiled
+
+
+def send_to_statsd(data, statsd, graphite, prefix=None, url_depth=None,
+                   sample=None, **kwargs):
     """
     Send all data from nginx log to statsd.
+
+    Fields which are None (not in log format of record) are skipped. If
+    'url_depth' is set, 'request_time' is also sent for every base url
+    group (see 'url_group') as 'request_time.url.<group>'. Stats of
+    sampled lines (see 'gossip.parsers.base.sample') are scaled up.
     """
+    rate = sample.rate if sample is not None else 1
+    if isinstance(data, Record):
+        fields = record_send_fields(data)
+    else:
+        fields = dict_send_fields(data)
+    (request_length, request_time, bytes_sent, body_bytes_sent,
+     response_status, request_method, base_url) = fields
+
     # send 'request_length' stats - total + host
-    statsd.incr('request_length', data['request_length'], prefix=prefix)
+    if request_length is not None:
+        statsd.incr('request_length', request_length, prefix=prefix,
+                    rate=rate)
 
     # send 'request_time' stats - total + host
-    statsd.timing('request_time', data['request_time'], prefix=prefix)
+    if request_time is not None:
+        statsd.timing('request_time', request_time, prefix=prefix, rate=rate)
+        if url_depth and base_url:
+            statsd.timing('request_time.url.%s' % url_group(base_url,
+                                                            url_depth),
+                          request_time, prefix=prefix, rate=rate)
 
     # send 'bytes_sent' stats - total + host
-    statsd.incr('bytes_sent', data['bytes_sent'], prefix=prefix)
+    if bytes_sent is not None:
+        statsd.incr('bytes_sent', bytes_sent, prefix=prefix, rate=rate)
 
     # send 'body_bytes_sent' stats - total + host
-    statsd.incr('body_bytes_sent', data['body_bytes_sent'], prefix=prefix)
+    if body_bytes_sent is not None:
+        statsd.incr('body_bytes_sent', body_bytes_sent, prefix=prefix,
+                    rate=rate)
 
     # send 'response_status' stats - total + host
-    statsd.incr('response_status.%d' % data['response_status'], prefix=prefix)
+    if response_status is not None:
+        statsd.incr('response_status.%d' % response_status, prefix=prefix,
+                    rate=rate)
 
     # send 'request_method' stats - total + host
-    statsd.incr('request_method.%s' % data['request_method'], prefix=prefix)
+    if request_method is not None:
+        statsd.incr('request_method.%s' % request_method, prefix=prefix,
+                    rate=rate)
 
     # send stats by request type
-    base_url = data['base_url']
+    if base_url is None:
+        base_url = ''
     if base_url.endswith('.js'):
-        statsd.incr('static_type.js', prefix=prefix)
+        statsd.incr('static_type.js', prefix=prefix, rate=rate)
     elif base_url.endswith('.png') or base_url.endswith('.jpg'):
-        statsd.incr('static_type.image', prefix=prefix)
+        statsd.incr('static_type.image', prefix=prefix, rate=rate)
     elif base_url.endswith('.css'):
-        statsd.incr('static_type.css', prefix=prefix)
+        statsd.incr('static_type.css', prefix=prefix, rate=rate)
 
     return data
+
+
+@batch_of(send_to_statsd)
+def send_to_statsd_batch(data, statsd, graphite, prefix=None, url_depth=None,
+                         sample=None, **kwargs):
+    """
+    Batch version of 'send_to_statsd'.
+    """
+    for item in data:
+        send_to_statsd(item, statsd, graphite, prefix=prefix,
+                       url_depth=url_depth, sample=sample)
+
+    return data
+
+
+def send_to_graphite(data, statsd, graphite, prefix=None, sample=None,
+                     **kwargs):
+    """
+    Send parsed nginx log line stats to graphite at time of request.
+
+    Request time is taken from 'datetime' field ($time_iso8601 or
+    $time_local, current time if there is no one), so stats are correct
+    when log is read with lag. Counters are summed by time in graphite
+    buckets (1 second ones without 'bucket' option). 'request_time' is sum
+    of requests times, divide it by 'requests' to get average. Stats of
+    sampled lines are scaled up.
+    """
+    if data is None:
+        return None
+    rate = sample.rate if sample is not None else 1
+
+    if isinstance(data, Record):
+        fields = record_send_fields(data)
+    else:
+        fields = dict_send_fields(data)
+    (request_length, request_time, bytes_sent, body_bytes_sent,
+     response_status, request_method, base_url) = fields
+
+    datetime = data.get('datetime')
+    timestamp = parse_time(datetime) if datetime else None
+    incr = graphite.incr
+
+    incr('requests', 1, prefix=prefix, timestamp=timestamp, rate=rate)
+    if request_length is not None:
+        incr('request_length', request_length, prefix=prefix,
+             timestamp=timestamp, rate=rate)
+    if request_time is not None:
+        incr('request_time', request_time, prefix=prefix,
+             timestamp=timestamp, rate=rate)
+    if bytes_sent is not None:
+        incr('bytes_sent', bytes_sent, prefix=prefix, timestamp=timestamp,
+             rate=rate)
+    if body_bytes_sent is not None:
+        incr('body_bytes_sent', body_bytes_sent, prefix=prefix,
+             timestamp=timestamp, rate=rate)
+    if response_status is not None:
+        incr('response_status.%d' % response_status, 1, prefix=prefix,
+             timestamp=timestamp, rate=rate)
+    if request_method is not None:
+        incr('request_method.%s' % request_method, 1, prefix=prefix,
+             timestamp=timestamp, rate=rate)
+
+    return data
+
+
+@batch_of(send_to_graphite)
+def send_to_graphite_batch(data, statsd, graphite, prefix=None, sample=None,
+                           **kwargs):
+    """
+    Batch version of 'send_to_graphite'.
+    """
+    for item in data:
+        send_to_graphite(item, statsd, graphite, prefix=prefix,
+                         sample=sample)
+
+    return data
+
+
+def send_columns(data, statsd, graphite, prefix=None,
+                 percentiles=(50, 95, 99), interval=10.0, use_numpy=True,
+                 sample=None, timings=None, **kwargs):
+    """
+    Send aggregated stats for nginx 'gossip' log lines to statsd.
+
+    Works on batches of raw lines (see 'send_columns_batch'): lines are
+    split into columns and counters are summed. Request times are added
+    to statsd quantile sketches if statsd counts them ('percentiles' in
+    statsd setup), so percentiles are sent once per statsd flush. Otherwise
+    they are added to 'timings' sketch of compiled version (see
+    'compile_send_columns'), which sends 'request_time.p<N>' gauges every
+    'interval' seconds. Stats of sampled lines are scaled up.
+    """
+    if not data or not isinstance(data, basestring):
+        return None
+
+    send_columns_batch([data], statsd, graphite, prefix=prefix,
+                       use_numpy=use_numpy, sample=sample, timings=timings)
+    return data
+
+
+@batch_of(send_columns)
+def send_columns_batch(data, statsd, graphite, prefix=None,
+                       percentiles=(50, 95, 99), interval=10.0,
+                       use_numpy=True, sample=None, timings=None, **kwargs):
+    """
+    Batch version of 'send_columns'.
+    """
+    columns = to_columns(data, use_numpy)
+    counters = column_stats(columns)
+    rate = sample.rate if sample is not None else 1
+
+    for metric, value in counters.iteritems():
+        statsd.incr(metric, value, prefix=prefix, rate=rate)
+
+    if columns.size:
+        sketches = statsd.sketches('request_time', prefix=prefix)
+        if not sketches and timings is not None:
+            sketches = [timings]
+        n = sample.n if sample is not None else 1
+        for sketch in sketches:
+            columns.add_to_sketch(columns.request_time, sketch, n)
+
+    return data
+
+
+@compiler_of(send_columns)
+def compile_send_columns(prefix=None, percentiles=(50, 95, 99),
+                         interval=10.0, use_numpy=True, **kwargs):
+    """
+    Compile 'send_columns': import NumPy at config load (before worker
+    processes are forked) instead of on first batch in every worker, and
+    create sketch for request times of 'interval' (shards give their
+    sketches to reader).
+    """
+    if use_numpy:
+        load_numpy()
+    timings = Sketch()
+    state = {'send_time': time.time() + interval}
+
+    def send_columns_compiled(data, statsd, graphite, sample=None,
+                              **kwargs):
+        """
+        Send aggregated stats for line.
+        """
+        return send_columns(data, statsd, graphite, prefix=prefix,
+                            use_numpy=use_numpy, sample=sample,
+                            timings=timings)
+
+    @batch_of(send_columns_compiled)
+    def send_columns_compiled_batch(data, statsd, graphite, sample=None,
+                                    **kwargs):
+        """
+        Batch version of 'send_columns_compiled'.
+        """
+        return send_columns_batch(data, statsd, graphite, prefix=prefix,
+                                  use_numpy=use_numpy, sample=sample,
+                                  timings=timings)
+
+    @ticker_of(send_columns_compiled)
+    def tick(now, statsd=None, **kwargs):
+        """
+        Send request time percentiles of interval and start new one.
+        """
+        if now < state['send_time']:
+            return
+        state['send_time'] = now + interval
+        if not timings.count or statsd is None:
+            return
+
+        for percentile in percentiles:
+            statsd.gauge('request_time.p%s' % percentile,
+                         timings.quantile(percentile / 100.0), prefix=prefix)
+        timings.clear()
+
+    @taker_of(send_columns_compiled)
+    def take():
+        """
+        Take request times sketch of shard.
+        """
+        if not timings.count:
+            return None
+        sketch = Sketch(timings.accuracy, timings.max_buckets)
+        sketch.merge(timings)
+        timings.clear()
+        return sketch
+
+    @merger_of(send_columns_compiled)
+    def merge(sketch):
+        """
+        Add request times sketch of shard.
+        """
+        timings.merge(sketch)
+
+    return send_columns_compiled
+
+
+def send_top(data, statsd, graphite, fields=('base_url', 'remote_addr'),
+             k=10, capacity=1000, interval=60, prefix=None, **kwargs):
+    """
+    Send top-K most frequent values of fields every 'interval' seconds.
+
+    Values are counted in fixed memory (see 'gossip.cardinality'), top-K
+    are logged and their counts are sent as 'top.<field>.<rank>' counters
+    (values are never metric names, so they are bounded by 'k'). Values of
+    sampled lines are counted 'n' times. Counts are kept by compiled
+    version (see 'compile_send_top'), this version does nothing.
+    """
+    return data
+
+
+@compiler_of(send_top)
+def compile_send_top(fields=('base_url', 'remote_addr'), k=10, capacity=1000,
+                     interval=60, prefix=None, **kwargs):
+    """
+    Compile 'send_top': create heavy hitters counter for every field
+    (shards give their counts to reader).
+    """
+    if isinstance(fields, basestring):
+        fields = (fields,)
+    if k < 1 or capacity < k:
+        raise ValueError("'k' must be positive and not more than 'capacity'")
+    counters = [(field, SpaceSaving(capacity)) for field in fields]
+    state = {'send_time': time.time() + interval}
+
+    def send_top_compiled(data, sample=None, **kwargs):
+        """
+        Count values of fields.
+        """
+        if data is None:
+            return None
+        n = sample.n if sample is not None else 1
+        for field, counter in counters:
+            value = data.get(field)
+            if value is not None:
+                counter.add(value, n)
+        return data
+
+    @batch_of(send_top_compiled)
+    def send_top_compiled_batch(data, sample=None, **kwargs):
+        """
+        Batch version of 'send_top_compiled'.
+        """
+        n = sample.n if sample is not None else 1
+        for field, counter in counters:
+            add = counter.add
+            for item in data:
+                value = item.get(field)
+                if value is not None:
+                    add(value, n)
+        return data
+
+    @ticker_of(send_top_compiled)
+    def tick(now, statsd=None, logger=None, logname=None, **kwargs):
+        """
+        Send top-K values and start new interval.
+        """
+        if now < state['send_time']:
+            return
+        state['send_time'] = now + interval
+
+        for field, counter in counters:
+            top = counter.top(k)
+            counter.clear()
+            if not top:
+                continue
+            if statsd is not None:
+                for rank, (_, count, _) in enumerate(top, 1):
+                    statsd.incr('top.%s.%d' % (field, rank), count,
+                                prefix=prefix)
+            if logger is not None:
+                logger.info("%s: top %s: %s" % (
+                    logname, field, ', '.join(
+                        '%d. %s (%d)' % (rank, value, count)
+                        for rank, (value, count, _) in enumerate(top, 1))))
+
+    @taker_of(send_top_compiled)
+    def take():
+        """
+        Take counts of shard: [(field, [(value, count, error)])].
+        """
+        counts = [(field, counter.top(capacity))
+                  for field, counter in counters]
+        for _, counter in counters:
+            counter.clear()
+        return [(field, top) for field, top in counts if top] or None
+
+    @merger_of(send_top_compiled)
+    def merge(counts):
+        """
+        Add counts of shard.
+        """
+        counters_of = dict(counters)
+        for field, top in counts:
+            add = counters_of[field].add
+            for value, count, _ in top:
+                add(value, count)
+
+    return send_top_compiled
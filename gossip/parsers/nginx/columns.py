@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar batch processing of nginx 'gossip' log.
+
+Batch of lines is split into columns (NumPy arrays if NumPy is installed,
+'array' module arrays otherwise) and stats are computed for every column
+in one pass instead of parsing every line into dict.
+
+NumPy is imported on first use (it takes longer to import than the rest of
+gossip), 'nginx.access_log.send_columns' imports it at config load, so
+worker processes inherit it from main process.
+"""
+import re
+from array import array
+from collections import defaultdict
+
+from gossip.sketch import MIN_VALUE, Sketch
+
+# NumPy module, None if it isn't imported or isn't installed
+numpy = None
+NUMPY_IMPORTED = False
+
+
+# 'gossip' log format fields (see 'gossip.parsers.nginx.access_log')
+FIELDS = ('datetime', 'remote_addr', 'request_length', 'request_time',
+          'bytes_sent', 'body_bytes_sent', 'response_status',
+          'request_method', 'request_url', 'http_version')
+WIDTH = len(FIELDS)
+(DATETIME, REMOTE_ADDR, REQUEST_LENGTH, REQUEST_TIME, BYTES_SENT,
+ BODY_BYTES_SENT, RESPONSE_STATUS, REQUEST_METHOD, REQUEST_URL,
+ HTTP_VERSION) = range(WIDTH)
+
+# static files types by base url extension
+STATIC_TYPES = {'js': 'js', 'png': 'image', 'jpg': 'image', 'css': 'css'}
+STATIC_RE = re.compile(r'(?:^| )[^ ?]*\.(js|png|jpg|css)(?=[? ]|$)')
+
+# count values with 'list.count' if there are no more distinct values
+MAX_COUNT_VALUES = 32
+
+
+def load_numpy():
+    """
+    Import NumPy on first call.
+
+    Returns NumPy module or None if it isn't installed.
+    """
+    global numpy, NUMPY_IMPORTED
+    if not NUMPY_IMPORTED:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+        NUMPY_IMPORTED = True
+    return numpy
+
+
+class Columns(object):
+    """
+    Columns of batch of parsed lines.
+    """
+    def __init__(self, tokens, size, use_numpy=True):
+        self.size = size
+        self.use_numpy = use_numpy and load_numpy() is not None
+        self.request_length = self.column(tokens[REQUEST_LENGTH::WIDTH], 'l')
+        self.request_time = self.column(tokens[REQUEST_TIME::WIDTH], 'd')
+        self.bytes_sent = self.column(tokens[BYTES_SENT::WIDTH], 'l')
+        self.body_bytes_sent = self.column(tokens[BODY_BYTES_SENT::WIDTH],
+                                           'l')
+        # string columns
+        self.response_status = tokens[RESPONSE_STATUS::WIDTH]
+        self.request_method = tokens[REQUEST_METHOD::WIDTH]
+        self.request_url = tokens[REQUEST_URL::WIDTH]
+
+    def column(self, values, typecode):
+        """
+        Convert list of strings into numeric column.
+        """
+        if self.use_numpy:
+            return numpy.array(values, dtype='int64' if typecode == 'l'
+                               else 'float64')
+        return array(typecode, map(int if typecode == 'l' else float, values))
+
+    def sum(self, column):
+        """
+        Sum of numeric column.
+        """
+        if self.use_numpy:
+            return column.sum().item()
+        return sum(column)
+
+    def add_to_sketch(self, column, sketch, count=1):
+        """
+        Add values of numeric column to quantile sketch ('count' times
+        each, see 'gossip.sketch.Sketch').
+
+        With NumPy sketch buckets of all values are computed at once.
+        """
+        if not self.use_numpy:
+            add = sketch.add
+            for value in column:
+                add(value, count)
+            return
+
+        positive = column[column >= MIN_VALUE]
+        batch = Sketch(sketch.accuracy, sketch.max_buckets)
+        batch.count = self.size * count
+        batch.sum = column.sum().item() * count
+        batch.zeros = (self.size - len(positive)) * count
+        if len(positive):
+            keys, counts = numpy.unique(
+                numpy.ceil(numpy.log(positive) / batch.gamma_log),
+                return_counts=True)
+            batch.buckets = dict(
+                (int(key), value * count)
+                for key, value in zip(keys.tolist(), counts.tolist()))
+        sketch.merge(batch)
+
+
+def count(values):
+    """
+    Count values in column: {value: count}.
+    """
+    distinct = set(values)
+    if len(distinct) <= MAX_COUNT_VALUES:
+        return dict((value, values.count(value)) for value in distinct)
+
+    counts = defaultdict(int)
+    for value in values:
+        counts[value] += 1
+    return counts
+
+
+def split_tokens(lines):
+    """
+    Split lines of 'gossip' log into flat list of tokens, WIDTH per line.
+
+    Returns tokens and number of lines. Lines with wrong number of tokens
+    (e.g. with empty request) are skipped.
+    """
+    tokens = ' '.join(lines).split()
+    size = len(lines)
+    if len(tokens) == WIDTH * size:
+        # check that every line really has WIDTH tokens
+        versions = set(tokens[HTTP_VERSION::WIDTH])
+        if all(v.startswith('HTTP/') for v in versions):
+            return tokens, size
+
+    tokens = []
+    size = 0
+    for line in lines:
+        line_tokens = line.split()
+        if len(line_tokens) == WIDTH:
+            tokens.extend(line_tokens)
+            size += 1
+    return tokens, size
+
+
+def valid_tokens(tokens, size):
+    """
+    Skip lines with bad numeric values.
+    """
+    result = []
+    count = 0
+    for i in xrange(0, size * WIDTH, WIDTH):
+        line_tokens = tokens[i:i + WIDTH]
+        try:
+            int(line_tokens[REQUEST_LENGTH])
+            float(line_tokens[REQUEST_TIME])
+            int(line_tokens[BYTES_SENT])
+            int(line_tokens[BODY_BYTES_SENT])
+            int(line_tokens[RESPONSE_STATUS])
+        except ValueError:
+            continue
+        result.extend(line_tokens)
+        count += 1
+    return result, count
+
+
+def to_columns(lines, use_numpy=True):
+    """
+    Convert batch of 'gossip' log lines into columns.
+    """
+    tokens, size = split_tokens(lines)
+    try:
+        return Columns(tokens, size, use_numpy)
+    except ValueError:
+        tokens, size = valid_tokens(tokens, size)
+        return Columns(tokens, size, use_numpy)
+
+
+def column_stats(columns):
+    """
+    Compute counters for columns: {metric: value}.
+    """
+    counters = defaultdict(int)
+    if not columns.size:
+        return counters
+
+    counters['requests'] = columns.size
+    counters['request_length'] = columns.sum(columns.request_length)
+    counters['bytes_sent'] = columns.sum(columns.bytes_sent)
+    counters['body_bytes_sent'] = columns.sum(columns.body_bytes_sent)
+
+    for status, value in count(columns.response_status).iteritems():
+        counters['response_status.%s' % status] += value
+    for method, value in count(columns.request_method).iteritems():
+        counters['request_method.%s' % method.lower()] += value
+
+    static = STATIC_RE.findall(' '.join(columns.request_url))
+    for ext, value in count(static).iteritems():
+        counters['static_type.%s' % STATIC_TYPES[ext]] += value
+
+    return counters
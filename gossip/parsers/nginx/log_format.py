@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Compile nginx 'log_format' into specialised line extractor.
+
+Extractor is one precompiled regexp, which captures only needed variables,
+and generated function, which converts them and packs into record: tuple
+with named fields (no dict per line). Record supports 'record.field',
+'record[field]' and 'record.get(field)', so it could be used instead of
+parsed dict. Known fields, which are not in log format, are None.
+
+Variables are named as in nginx, except:
+ - $status -> 'response_status';
+ - $time_iso8601, $time_local -> 'datetime';
+ - $request_uri -> 'request_url';
+ - $request -> 'request_method', 'request_url', 'http_version';
+ - 'base_url' is 'request_url' without query string.
+
+Typed fields with nginx empty value '-' are None, and so are fields of
+$request, which isn't 'METHOD URL VERSION' (e.g. '-' of 400 and 408
+responses), so such lines are still counted.
+"""
+import re
+from operator import itemgetter
+
+
+# predefined formats
+FORMATS = {
+    'gossip': ('$time_iso8601 $remote_addr'
+               ' $request_length $request_time'
+               ' $bytes_sent $body_bytes_sent'
+               ' $status $request'),
+    'combined': ('$remote_addr - $remote_user [$time_local] '
+                 '"$request" $status $body_bytes_sent '
+                 '"$http_referer" "$http_user_agent"'),
+}
+
+# fields used by 'nginx.access_log.send_to_statsd'
+SEND_FIELDS = ('request_length', 'request_time', 'bytes_sent',
+               'body_bytes_sent', 'response_status', 'request_method',
+               'base_url')
+
+# fields extracted by default: 'send_to_statsd' ones and time of line for
+# 'nginx.access_log.send_to_graphite' (if format has time variable)
+DEFAULT_FIELDS = SEND_FIELDS + ('datetime',)
+
+# variables -> field names
+VARIABLE_FIELDS = {
+    'status': 'response_status',
+    'time_iso8601': 'datetime',
+    'time_local': 'datetime',
+    'request_uri': 'request_url',
+}
+
+# field converters, strings by default
+FIELD_TYPES = {
+    'request_length': 'int',
+    'request_time': 'float',
+    'bytes_sent': 'int',
+    'body_bytes_sent': 'int',
+    'response_status': 'int',
+    'upstream_response_time': 'float',
+}
+
+# fields derived from $request
+REQUEST_FIELDS = ('request_method', 'request_url', 'http_version', 'base_url')
+
+VARIABLE_RE = re.compile(r'\$(?:\{([a-zA-Z0-9_]+)\}|([a-zA-Z0-9_]+))')
+
+
+class Record(tuple):
+    """
+    Base class for parsed log line records.
+    """
+    __slots__ = ()
+    fields = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        """
+        Get field value or 'default'.
+        """
+        value = getattr(self, key, None)
+        if value is None:
+            return default
+        return value
+
+    def keys(self):
+        """
+        Get record field names.
+        """
+        return list(self.fields)
+
+    def __repr__(self):
+        return '<Record %s>' % ', '.join(
+            '%s=%r' % (key, value) for key, value in zip(self.fields, self))
+
+
+def split_format(log_format):
+    """
+    Split log format into list of literals and variables.
+
+    Returns list of (is_variable, text).
+    """
+    log_format = FORMATS.get(log_format, log_format)
+
+    parts = []
+    pos = 0
+    for match in VARIABLE_RE.finditer(log_format):
+        if match.start() > pos:
+            parts.append((False, log_format[pos:match.start()]))
+        parts.append((True, match.group(1) or match.group(2)))
+        pos = match.end()
+    if pos < len(log_format):
+        parts.append((False, log_format[pos:]))
+
+    if not any(is_variable for is_variable, _ in parts):
+        raise ValueError("no variables in log format '%s'" % log_format)
+
+    return parts
+
+
+def make_record(fields):
+    """
+    Make record class with given fields.
+    """
+    attrs = {'__slots__': (), 'fields': tuple(fields)}
+    # known fields, which are not in record
+    for field in SEND_FIELDS + REQUEST_FIELDS + ('datetime',):
+        attrs[field] = None
+    for i, field in enumerate(fields):
+        attrs[field] = property(itemgetter(i))
+
+    return type('Record', (Record,), attrs)
+
+
+def compile_format(log_format='gossip', fields=DEFAULT_FIELDS):
+    """
+    Compile log format into extractor function: line -> record or None.
+
+    Only 'fields' are extracted (all format fields if 'fields' is None).
+    Lines which don't match format or have bad values in typed fields are
+    skipped. Variables must be separated by literals, there is no way to
+    split '$a$b'.
+    """
+    parts = split_format(log_format)
+
+    # all fields this format provides
+    provided = []
+    for is_variable, name in parts:
+        if not is_variable:
+            continue
+        if name == 'request':
+            provided.extend(REQUEST_FIELDS)
+        else:
+            provided.append(VARIABLE_FIELDS.get(name, name))
+            if VARIABLE_FIELDS.get(name) == 'request_url':
+                provided.append('base_url')
+    if fields is None:
+        fields = provided
+    if not any(f in provided for f in fields):
+        raise ValueError("log format provides none of fields %s" % (
+            ', '.join(fields)))
+    fields = [f for f in fields if f in provided]
+
+    # build regexp: capture only variables needed for fields
+    regexp = ['^']
+    groups = []
+    for i, (is_variable, name) in enumerate(parts):
+        if not is_variable:
+            regexp.append(re.escape(name))
+            continue
+
+        # variable value lasts till the first char of next literal
+        if i + 1 < len(parts) and not parts[i + 1][0]:
+            value_re = '[^%s]*' % re.escape(parts[i + 1][1][0])
+        elif i + 1 < len(parts):
+            raise ValueError("variables '$%s' and '$%s' are not separated "
+                             "in log format" % (name, parts[i + 1][1]))
+        else:
+            value_re = '.*'
+
+        field = VARIABLE_FIELDS.get(name, name)
+        if name == 'request':
+            needed = any(f in fields for f in REQUEST_FIELDS)
+        elif field == 'request_url':
+            needed = field in fields or 'base_url' in fields
+        else:
+            needed = field in fields and field not in groups
+
+        if needed:
+            groups.append(field if name != 'request' else 'request')
+            regexp.append('(%s)' % value_re)
+        else:
+            regexp.append(value_re)
+
+    # generate extractor code
+    code = [
+        'def extract(line):',
+        '    match = _match(line)',
+        '    if match is None:',
+        '        return None',
+        '    %s, = match.groups()' % ', '.join('_%s' % g for g in groups),
+        '    try:',
+    ]
+    if 'request' in groups:
+        code.extend([
+            '        _request = _request.split(" ")',
+            '        if len(_request) == 3:',
+            '            _request_method = _request[0].lower()',
+            '            _request_url = _request[1]',
+            '            _http_version = _request[2]',
+            '        else:',
+            '            _request_method = _request_url = _http_version = '
+            'None',
+        ])
+    if 'base_url' in fields:
+        code.append('        _base_url = (_request_url.split("?", 1)[0] '
+                    'if _request_url is not None else None)')
+    for field in fields:
+        if field in FIELD_TYPES and field in groups:
+            code.append('        _%s = %s(_%s) if _%s != "-" else None' % (
+                field, FIELD_TYPES[field], field, field))
+    code.extend([
+        '    except ValueError:',
+        '        return None',
+        '    return _Record((%s,))' % ', '.join('_%s' % f for f in fields),
+    ])
+
+    namespace = {
+        '_match': re.compile(''.join(regexp)).match,
+        '_Record': make_record(fields),
+    }
+    exec '\n'.join(code) in namespace
+
+    extract = namespace['extract']
+    extract.fields = tuple(fields)
+    return extract
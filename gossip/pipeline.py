@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled parsers tree.
+
+Parsers tree of source is compiled once at config load into execution plan:
+chains of parsers with only one child are flattened into list of steps, so
+tree is a list of branches (steps, child branches). When worker starts,
+plan is bound to worker context (logname, stats senders, etc.): every step
+becomes batch callable with all arguments frozen. Tickers of parsers (see
+'gossip.parsers.ticker_of') are bound too and available in 'run.ticks'.
+
+Pipeline may be bound with counters: then every step counts its calls,
+items and time spent (without child parsers) by node name, e.g.
+'line7_nginx_access_log_parse'. Steps are called for batches, so it costs
+two 'time.time()' calls per batch.
+
+Parser may change context of following steps and child branches (see
+'gossip.parsers.context_of').
+
+Parsers with compiler (see 'gossip.parsers.compiler_of') are compiled
+again on every bind, so state kept by compiled parser (windows, sampler,
+top values) belongs to one bound source: files of glob source and shards
+don't share it. Pipeline bound in shard doesn't tick parsers with taker,
+their state is merged by reader instead (see 'gossip.parsers.taker_of').
+"""
+import re
+import time
+from functools import partial
+
+
+# chars not allowed in node name
+NODE_NAME_RE = re.compile(r'[^a-zA-Z0-9_-]+')
+
+
+def run_items(parser, data):
+    """
+    Run parser without batch version for every item in batch.
+    """
+    result = []
+    append = result.append
+    for item in data:
+        item = parser(item)
+        if item is not None:
+            append(item)
+    return result
+
+
+def make_branch(steps, children):
+    """
+    Make branch runner: run steps one by one, then all child branches.
+    """
+    if len(steps) == 1 and not children:
+        step = steps[0]
+
+        def run_step(data):
+            step(data)
+        return run_step
+
+    def run_branch(data):
+        for step in steps:
+            data = step(data)
+            if not data:
+                return
+        for child in children:
+            child(data)
+    return run_branch
+
+
+def node_name(parser):
+    """
+    Get parser node name for counters: config line and parser name.
+    """
+    name = (parser.get('cmd_name') or
+            getattr(parser['cmd'], '__name__', 'parser'))
+    name = NODE_NAME_RE.sub('_', name)
+    if parser.get('line') is not None:
+        return 'line%d_%s' % (parser['line'], name)
+    return name
+
+
+def instrument(step, counter):
+    """
+    Count step calls, items and time spent in 'counter': [calls, items,
+    seconds].
+    """
+    now = time.time
+
+    def run_instrumented(data):
+        started = now()
+        result = step(data)
+        counter[2] += now() - started
+        counter[1] += len(data)
+        counter[0] += 1
+        return result
+    return run_instrumented
+
+
+class Pipeline(object):
+    """
+    Compiled parsers tree of source.
+    """
+    def __init__(self, parsers):
+        self.plan = self.compile(parsers)
+
+    def compile(self, parsers):
+        """
+        Compile parsers into execution plan: [(steps, child branches)].
+
+        Every step is (parser, args, node name, compiler), compiler makes
+        new compiled parser or is None.
+        """
+        branches = []
+        for parser in parsers:
+            steps = []
+            while True:
+                if 'cmd' in parser:
+                    compiler = parser.get('compiler')
+                    if compiler is not None:
+                        compiler = partial(compiler,
+                                           **parser['compiled_args'])
+                    steps.append((parser['cmd'], parser.get('args', {}),
+                                  node_name(parser), compiler))
+                children = parser.get('parsers', ())
+                if len(children) != 1:
+                    break
+                parser = children[0]
+            branches.append((steps, self.compile(children)))
+        return branches
+
+    def bind_step(self, parser, args, context, ticks):
+        """
+        Bind step to context: make batch callable with frozen arguments.
+
+        Parser ticker is bound with the same arguments and added to 'ticks'.
+        """
+        kwargs = dict(context)
+        kwargs.update(args)
+
+        tick = getattr(parser, 'tick', None)
+        if tick is not None:
+            ticks.append(partial(tick, **kwargs))
+
+        batch = getattr(parser, 'batch', None)
+        if batch is not None:
+            return partial(batch, **kwargs)
+
+        return partial(run_items, partial(parser, **kwargs))
+
+    def bind_branches(self, branches, context, ticks, counters=None,
+                      shared=None, shard=False):
+        """
+        Bind all branches to context.
+
+        With 'counters' dict every step is instrumented, its counter is
+        'counters[node name]'. Parsers with taker are put into 'shared'
+        dict by node name, in 'shard' they are not ticked.
+        """
+        bound = []
+        for steps, children in branches:
+            runs = []
+            branch_context = context
+            for cmd, args, node, compiler in steps:
+                if compiler is not None:
+                    # state of compiled parser is per bind
+                    cmd = compiler()
+                step_ticks = ticks
+                if getattr(cmd, 'take', None) is not None:
+                    if shared is not None:
+                        shared[node] = cmd
+                    if shard:
+                        # reader merges state of shards and ticks it
+                        step_ticks = []
+                run = self.bind_step(cmd, args, branch_context, step_ticks)
+                if counters is not None:
+                    run = instrument(run, counters.setdefault(node, [0, 0, 0]))
+                runs.append(run)
+                child_context = getattr(cmd, 'context', None)
+                if child_context is not None:
+                    branch_context = child_context(branch_context)
+            bound.append(make_branch(
+                runs, self.bind_branches(children, branch_context, ticks,
+                                         counters, shared, shard)))
+        return bound
+
+    def bind(self, logname=None, hostname=None, statsd=None, graphite=None,
+             logger=None, counters=None, shard=False):
+        """
+        Bind pipeline to worker context.
+
+        Returns function, which runs all parsers for batch of lines, with
+        bound parsers tickers in 'ticks' attribute and parsers with state
+        merged from shards in 'shared' ({node name: parser}). Steps are
+        instrumented if 'counters' dict is given (see 'instrument'). With
+        'shard' state of shared parsers isn't ticked (see
+        'gossip.parsers.taker_of').
+        """
+        context = {
+            'logname': logname,
+            'hostname': hostname,
+            'statsd': statsd,
+            'graphite': graphite,
+            'logger': logger,
+            'sample': None,
+        }
+        ticks = []
+        shared = {}
+        branches = self.bind_branches(self.plan, context, ticks, counters,
+                                      shared, shard)
+        if len(branches) == 1:
+            run = branches[0]
+        else:
+            def run(data):
+                for branch in branches:
+                    branch(data)
+        run.ticks = ticks
+        run.shared = shared
+        return run
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Replay: process whole log files (e.g. rotated and compressed ones).
+
+Files are read by large blocks and decompressed on the fly by extension
+('.gz', '.bz2', '.zst'), several files are processed in parallel by
+'jobs' processes. Lines are processed by parsers of one config source in
+batches of lines with the same timestamp, and graphite metrics get
+timestamp of log lines instead of current time. StatsD has no timestamps,
+so replayed stats are counted by statsd at time they are received.
+"""
+import os
+import re
+import bz2
+import time
+import zlib
+import subprocess
+from multiprocessing import Pool
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from gossip.timestamp import parse_time
+from gossip.worker import Worker, worker_setup
+
+
+# '2013-06-01T12:00:00+04:00' ($time_iso8601) or
+# '[01/Jun/2013:12:00:00 +0400]' ($time_local)
+TIME_RE = re.compile(
+    r'(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:Z|[+-]\d\d:?\d\d)?)|'
+    r'\[(\d\d/\w{3}/\d{4}:\d\d:\d\d:\d\d [+-]\d{4})\]')
+
+# read files by 4M blocks
+BLOCK_SIZE = 4194304
+
+# config and worker settings of replay processes, set before fork
+REPLAY = {}
+
+
+def read_blocks(path, block_size=BLOCK_SIZE):
+    """
+    Read file by blocks, decompress it by extension.
+    """
+    if path.endswith('.zst') or path.endswith('.zstd'):
+        for block in read_zstd(path, block_size):
+            yield block
+        return
+
+    if path.endswith('.gz'):
+        decompressor = lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif path.endswith('.bz2'):
+        decompressor = bz2.BZ2Decompressor
+    else:
+        decompressor = None
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        decompress = decompressor() if decompressor is not None else None
+        while True:
+            block = os.read(fd, block_size)
+            if not block:
+                break
+            if decompress is None:
+                yield block
+                continue
+
+            # files may have several compressed streams (e.g. 'cat a.gz
+            # b.gz'): start new decompressor for data after end of stream,
+            # finished bz2 decompressor raises EOFError when stream ends
+            # exactly at the end of block
+            while block:
+                try:
+                    data = decompress.decompress(block)
+                except EOFError:
+                    decompress = decompressor()
+                    continue
+                if data:
+                    yield data
+                block = decompress.unused_data
+                if block:
+                    decompress = decompressor()
+    finally:
+        os.close(fd)
+
+
+def read_zstd(path, block_size=BLOCK_SIZE):
+    """
+    Read zstd compressed file by blocks: with 'zstandard' module if it is
+    installed, with 'zstd' command otherwise.
+    """
+    if zstandard is not None:
+        with open(path, 'rb') as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f)
+            while True:
+                block = reader.read(block_size)
+                if not block:
+                    break
+                yield block
+        return
+
+    try:
+        process = subprocess.Popen(['zstd', '-dc', path],
+                                   stdout=subprocess.PIPE)
+    except OSError, e:
+        raise IOError("can't decompress '%s': no zstandard module or "
+                      "zstd command (%s)" % (path, e))
+    try:
+        while True:
+            block = process.stdout.read(block_size)
+            if not block:
+                break
+            yield block
+    finally:
+        process.stdout.close()
+        if process.wait():
+            raise IOError("can't decompress '%s': zstd exit code %d" % (
+                path, process.returncode))
+
+
+def read_lines(path, block_size=BLOCK_SIZE):
+    """
+    Read file by batches of lines.
+    """
+    partial = ''
+    for block in read_blocks(path, block_size):
+        lines = block.split('\n')
+        if partial:
+            lines[0] = partial + lines[0]
+        partial = lines.pop()
+        yield [line.strip() for line in lines]
+    if partial.strip():
+        yield [partial.strip()]
+
+
+def split_by_time(lines, timestamp):
+    """
+    Split batch of lines into (timestamp, lines) with the same timestamp.
+
+    Lines without timestamp get timestamp of previous line ('timestamp' for
+    the first one).
+    """
+    search = TIME_RE.search
+    group = []
+    for line in lines:
+        match = search(line)
+        if match is not None:
+            ts = parse_time(match.group(1) or match.group(2))
+            if ts is not None and ts != timestamp:
+                if group:
+                    yield timestamp, group
+                    group = []
+                timestamp = ts
+        group.append(line)
+    if group:
+        yield timestamp, group
+
+
+def replay_file(path):
+    """
+    Replay one file (in replay process).
+
+    Returns (path, lines, seconds, error).
+    """
+    source = REPLAY['source']
+    worker_kwargs = worker_setup(REPLAY['setup'])
+    worker_kwargs.pop('shards', None)
+    worker_kwargs.pop('setup', None)
+    worker = Worker([source], logger=REPLAY['logger'], **worker_kwargs)
+    run = worker.bind(source)
+
+    # graphite metrics get timestamp of log lines
+    clock = [time.time()]
+    if worker.graphite is not None:
+        worker.graphite.clock = lambda: clock[0]
+
+    started = time.time()
+    count = 0
+    try:
+        for lines in read_lines(path):
+            count += len(lines)
+            for clock[0], group in split_by_time(lines, clock[0]):
+                run(group)
+                for tick in worker.ticks:
+                    tick(clock[0])
+            now = time.time()
+            if worker.statsd is not None:
+                worker.statsd.tick(now)
+            if worker.graphite is not None:
+                worker.graphite.tick(now)
+    except (IOError, OSError, EOFError, zlib.error), e:
+        return path, count, time.time() - started, str(e)
+    finally:
+        worker.flush()
+    return path, count, time.time() - started, None
+
+
+def do_replay(config, args, logger=None):
+    """
+    Replay files 'args.replay' with parsers of source 'args.source' (may be
+    omitted if config has one source) in 'args.jobs' processes.
+
+    Returns number of files which weren't processed.
+    """
+    if args.source is not None:
+        sources = [s for s in config.config if s['name'] == args.source]
+        if not sources:
+            raise ValueError("unknown source '%s'" % args.source)
+    elif len(config.config) == 1:
+        sources = config.config
+    else:
+        raise ValueError("config has several sources, choose one of them "
+                         "with '--source'")
+
+    REPLAY.update({
+        'source': sources[0],
+        'setup': config.setup,
+        'logger': logger,
+    })
+    if 'statsd' in config.setup and logger is not None:
+        logger.warning("statsd has no timestamps: replayed stats are "
+                       "counted at time they are received")
+
+    jobs = max(1, min(args.jobs or 1, len(args.replay)))
+    if jobs == 1:
+        results = (replay_file(path) for path in args.replay)
+    else:
+        pool = Pool(jobs)
+        results = pool.imap_unordered(replay_file, args.replay)
+
+    failed = 0
+    for path, count, elapsed, error in results:
+        if error is not None:
+            failed += 1
+            message = "can't replay '%s': %s" % (path, error)
+            if logger is not None:
+                logger.error(message)
+            else:
+                print "ERROR: %s" % message
+            continue
+        message = "replayed '%s': %d lines in %.1fs (%.0f lines/s)" % (
+            path, count, elapsed, count / max(elapsed, 1e-6))
+        if logger is not None:
+            logger.info(message)
+        else:
+            print message
+
+    if jobs > 1:
+        pool.close()
+        pool.join()
+    return failed
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Lines sampling for extreme-volume logs.
+
+Sampler passes 1-in-N lines, chosen at random or by hash of line (or of
+record field), so the same lines (keys) are always chosen for the same N.
+With 'target' lines per second N is adapted every 'interval' seconds to
+the current rate of lines. Parsers after sampler scale counters up by N
+(senders get 'rate' = 1 / N, like statsd '@rate'), so stats stay correct
+with known error while parse and send cost drops by N.
+"""
+import math
+import zlib
+import random
+
+
+SAMPLE_METHODS = ('random', 'hash')
+
+
+class Sampler(object):
+    """
+    Choose 1-in-'n' items, adapt 'n' to 'target' items per second.
+    """
+    def __init__(self, n=10, method='random', target=None, interval=10.0,
+                 max_n=1000):
+        if method not in SAMPLE_METHODS:
+            raise ValueError("unknown sample method '%s', use one of: %s" % (
+                method, ', '.join(SAMPLE_METHODS)))
+        if n < 1 or max_n < n:
+            raise ValueError("'n' must be positive and not more than 'max_n'")
+        self.n = int(n)
+        self.method = method
+        self.target = target
+        self.interval = interval
+        self.max_n = max_n
+        # items seen since last adaptation
+        self.seen = 0
+        self.adapt_time = None
+
+    @property
+    def rate(self):
+        """
+        Part of items passed: 1 / n.
+        """
+        return 1.0 / self.n
+
+    def choose(self, items, keys=None):
+        """
+        Choose items from list: 'keys' are strings to hash (items by
+        default) for 'hash' method.
+        """
+        self.seen += len(items)
+        n = self.n
+        if n == 1:
+            return items
+        if self.method == 'random':
+            rand = random.random
+            rate = 1.0 / n
+            return [item for item in items if rand() < rate]
+
+        crc32 = zlib.crc32
+        if keys is None:
+            return [item for item in items if crc32(item) % n == 0]
+        return [item for item, key in zip(items, keys)
+                if crc32(key) % n == 0]
+
+    def adapt(self, now):
+        """
+        Adapt 'n' to rate of items seen since last adaptation.
+
+        Returns True if 'n' is changed.
+        """
+        if self.target is None:
+            return False
+        if self.adapt_time is None:
+            self.adapt_time = now
+            self.seen = 0
+            return False
+        elapsed = now - self.adapt_time
+        if elapsed < self.interval:
+            return False
+
+        items_rate = self.seen / elapsed
+        self.adapt_time = now
+        self.seen = 0
+        n = min(max(int(math.ceil(items_rate / self.target)), 1), self.max_n)
+        if n == self.n:
+            return False
+        self.n = n
+        return True
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded queue between reader and stats sender thread.
+
+Reader puts metrics into queue and never waits for network: sender thread
+takes them by batches and sends. When queue is full (sender is too slow or
+collector is unavailable) policy defines what happens:
+
+ - 'block': reader waits for free space (log is read later, nothing lost);
+ - 'oldest': oldest metric is dropped;
+ - 'newest': new metric is dropped;
+ - 'sample': when queue is more than half full only every 'sample_rate'
+   metric is queued, new metrics are dropped when it's full.
+"""
+import time
+import threading
+from collections import deque
+
+
+POLICIES = ('block', 'oldest', 'newest', 'sample')
+
+
+class SendQueue(object):
+    """
+    Thread-safe bounded queue with drop policy.
+    """
+    def __init__(self, maxsize=100000, policy='oldest', sample_rate=10):
+        if policy not in POLICIES:
+            raise ValueError("unknown queue policy '%s'" % policy)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.skipped = 0
+        # items taken by sender, which aren't sent or returned yet
+        self.taken = 0
+        # counters
+        self.queued = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        """
+        Put item into queue.
+        """
+        with self.cond:
+            items = self.items
+            if self.policy == 'sample' and len(items) * 2 >= self.maxsize:
+                self.skipped += 1
+                if self.skipped < self.sample_rate:
+                    self.dropped += 1
+                    return
+                self.skipped = 0
+
+            if len(items) >= self.maxsize:
+                if self.policy == 'block':
+                    while len(self.items) >= self.maxsize:
+                        self.cond.wait(1.0)
+                elif self.policy == 'oldest':
+                    items.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                    return
+
+            self.items.append(item)
+            self.queued += 1
+            self.cond.notify_all()
+
+    def get(self, count, timeout=None):
+        """
+        Get up to 'count' items, wait for 'count' items no more than
+        'timeout' seconds.
+        """
+        with self.cond:
+            if len(self.items) < count and timeout:
+                deadline = time.time() + timeout
+                while len(self.items) < count:
+                    left = deadline - time.time()
+                    if left <= 0:
+                        break
+                    self.cond.wait(left)
+
+            items = self.items
+            batch = [items.popleft() for _ in xrange(min(count, len(items)))]
+            self.taken += len(batch)
+            self.cond.notify_all()
+            return batch
+
+    def done(self, count):
+        """
+        Mark 'count' taken items as sent.
+        """
+        with self.cond:
+            self.taken -= count
+            self.cond.notify_all()
+
+    def join(self, timeout=None):
+        """
+        Wait until all items are sent, no more than 'timeout' seconds.
+        Returns False on timeout.
+        """
+        with self.cond:
+            deadline = time.time() + timeout if timeout is not None else None
+            while self.items or self.taken > 0:
+                if deadline is None:
+                    self.cond.wait(1.0)
+                    continue
+                left = deadline - time.time()
+                if left <= 0:
+                    return False
+                self.cond.wait(left)
+            return True
+
+    def put_back(self, batch):
+        """
+        Return batch, which wasn't sent, to the head of queue.
+
+        Items which don't fit are dropped (with 'block' policy queue may
+        grow more than 'maxsize' by one batch instead).
+        """
+        with self.cond:
+            self.taken -= len(batch)
+            free = self.maxsize - len(self.items)
+            if free < len(batch) and self.policy != 'block':
+                self.dropped += len(batch) - free
+                batch = batch[len(batch) - free:] if free > 0 else []
+            self.items.extendleft(reversed(batch))
+            self.cond.notify_all()
+
+    def clear(self):
+        """
+        Get all items and clear queue.
+        """
+        with self.cond:
+            items = list(self.items)
+            self.items.clear()
+            self.cond.notify_all()
+            return items
+
+
+class SenderThread(threading.Thread):
+    """
+    Thread, which takes batches from queue and sends them.
+
+    'send' gets batch and returns number of items sent from its head, the
+    rest is returned to queue and sending is retried after
+    'retry_interval'.
+    """
+    def __init__(self, queue, send, batch_size=500, flush_interval=1.0,
+                 retry_interval=1.0):
+        self.queue = queue
+        self.send = send
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.stopped = threading.Event()
+
+        super(SenderThread, self).__init__()
+        self.daemon = True
+
+    def run(self):
+        """
+        Send batches until stopped.
+        """
+        while not self.stopped.is_set():
+            batch = self.queue.get(self.batch_size, self.flush_interval)
+            if batch and not self.send_batch(batch):
+                self.stopped.wait(self.retry_interval)
+
+    def send_batch(self, batch):
+        """
+        Send batch, return its unsent items to queue. Returns False if
+        batch wasn't sent completely.
+        """
+        sent = self.send(batch)
+        self.queue.done(sent)
+        if sent < len(batch):
+            self.queue.put_back(batch[sent:])
+            return False
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Stop thread, try to send what's left in queue.
+        """
+        self.stopped.set()
+        self.join(timeout)
+        while len(self.queue):
+            batch = self.queue.get(self.batch_size)
+            if not self.send_batch(batch):
+                break
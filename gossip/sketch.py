@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Quantile sketches for timings.
+
+Sketch counts values in logarithmic buckets (like DDSketch): value 'v' goes
+to bucket 'ceil(log(v, gamma))', where gamma = (1 + accuracy) /
+(1 - accuracy), so every quantile is estimated with 'accuracy' relative
+error. Memory is bounded by 'max_buckets' and sketches are mergeable, so
+they could be collected in several processes and merged before sending.
+"""
+from math import ceil, log
+
+
+# values less than this are counted as zeros
+MIN_VALUE = 1e-9
+
+
+class Sketch(object):
+    """
+    Quantile sketch with relative accuracy.
+    """
+    __slots__ = ('accuracy', 'gamma', 'gamma_log', 'max_buckets', 'buckets',
+                 'zeros', 'count', 'sum')
+
+    def __init__(self, accuracy=0.01, max_buckets=2048):
+        self.accuracy = accuracy
+        self.gamma = (1.0 + accuracy) / (1.0 - accuracy)
+        self.gamma_log = log(self.gamma)
+        self.max_buckets = max_buckets
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+    def add(self, value, count=1):
+        """
+        Add value to sketch.
+        """
+        self.count += count
+        self.sum += value * count
+        if value < MIN_VALUE:
+            self.zeros += count
+            return
+
+        key = int(ceil(log(value) / self.gamma_log))
+        buckets = self.buckets
+        buckets[key] = buckets.get(key, 0) + count
+        if len(buckets) > self.max_buckets:
+            self.collapse()
+
+    def collapse(self):
+        """
+        Collapse lowest buckets, so there are no more than 'max_buckets'.
+
+        Accuracy is lost for lowest quantiles only.
+        """
+        keys = sorted(self.buckets)
+        extra = len(keys) - self.max_buckets
+        if extra <= 0:
+            return
+        target = keys[extra]
+        for key in keys[:extra]:
+            self.buckets[target] += self.buckets.pop(key)
+
+    def merge(self, other):
+        """
+        Merge other sketch (with the same accuracy) into this one.
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("can't merge sketches with different accuracy")
+
+        self.count += other.count
+        self.sum += other.sum
+        self.zeros += other.zeros
+        buckets = self.buckets
+        for key, count in other.buckets.iteritems():
+            buckets[key] = buckets.get(key, 0) + count
+        if len(buckets) > self.max_buckets:
+            self.collapse()
+
+    def clear(self):
+        """
+        Forget all values.
+        """
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0
+
+    def quantile(self, q):
+        """
+        Estimate quantile 'q' (0 <= q <= 1), None if sketch is empty.
+        """
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # bucket (gamma^(key-1), gamma^key] middle value
+                return 2.0 * self.gamma ** key / (self.gamma + 1.0)
+        return 2.0 * self.gamma ** max(self.buckets) / (self.gamma + 1.0)
+
+    def size(self):
+        """
+        Number of buckets used.
+        """
+        return len(self.buckets) + (1 if self.zeros else 0)
@@ -4,23 +4,294 @@ Statictic senders.
 """
 import time
 import socket
-from statsd import StatsClient
+import struct
+import cPickle
+from collections import defaultdict, deque
+
+from gossip.cardinality import CardinalityGuard
+from gossip.sender import POLICIES, SendQueue, SenderThread
+from gossip.sketch import Sketch
+
+
+def scale(value, rate=1):
+    """
+    Scale up value of sampled counter: 'rate' is part of events counted
+    (like statsd '@rate'), e.g. 0.1 for 1-in-10 sampling.
+    """
+    if rate == 1:
+        return value
+    value = value / float(rate)
+    rounded = round(value)
+    if abs(value - rounded) < 1e-6:
+        return int(rounded)
+    return value
+
+
+class StatsAggregate(object):
+    """
+    Aggregate stats for statsd in memory.
+
+    Counters are summed, gauges keep last value and timings are collected
+    for every metric. If 'percentiles' are set, timings are counted in
+    quantile sketches with 'accuracy' relative error and no more than
+    'max_buckets' buckets (see 'gossip.sketch'), and only percentiles and
+    counts are sent. No more than 'max_timers' sketches are kept, timings
+    for new metrics are counted in '<metric parent>.other' sketch then.
+
+    Sampled stats ('rate' < 1) are scaled up: counters and timings counts,
+    timings without sketches keep 'rate' and are sent with '@rate'.
+    """
+    def __init__(self, percentiles=None, accuracy=0.01, max_buckets=2048,
+                 max_timers=1000, **kwargs):
+        self.percentiles = percentiles
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self.max_timers = max_timers
+
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        if percentiles:
+            self.timers = {}
+        else:
+            self.timers = defaultdict(list)
+        self.timings_count = 0
+
+    def incr(self, stat, count=1, rate=1):
+        """
+        Increment 'stat' counter by 'count'.
+        """
+        self.counters[stat] += scale(count, rate)
+
+    def gauge(self, stat, value):
+        """
+        Set 'stat' gauge value.
+        """
+        self.gauges[stat] = value
+
+    def sketch(self, stat):
+        """
+        Get sketch for 'stat' timings.
+        """
+        sketch = self.timers.get(stat)
+        if sketch is not None:
+            return sketch
+
+        if len(self.timers) >= self.max_timers:
+            stat = '%s.other' % stat.rsplit('.', 1)[0]
+            sketch = self.timers.get(stat)
+            if sketch is not None:
+                return sketch
+
+        sketch = self.timers[stat] = Sketch(self.accuracy, self.max_buckets)
+        return sketch
+
+    def timing(self, stat, delta, rate=1):
+        """
+        Add 'stat' timing.
+        """
+        if self.percentiles:
+            self.sketch(stat).add(delta, scale(1, rate))
+            return
+
+        self.timers[stat].append(delta if rate == 1 else (delta, rate))
+        self.timings_count += 1
+
+    def take(self):
+        """
+        Get all collected stats (counters, gauges, timers) and reset them.
+        """
+        stats = (dict(self.counters), self.gauges, dict(self.timers))
+
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        if self.percentiles:
+            self.timers = {}
+        else:
+            self.timers = defaultdict(list)
+        self.timings_count = 0
+
+        return stats
+
+    def merge(self, counters, gauges, timers, guard=None):
+        """
+        Merge stats, collected by another aggregate ('guard' folds metric
+        names, see 'gossip.cardinality.CardinalityGuard').
+        """
+        for stat, count in counters.iteritems():
+            if guard is not None:
+                stat = guard(stat, count)
+            self.counters[stat] += count
+        if guard is None:
+            self.gauges.update(gauges)
+        else:
+            for stat, value in gauges.iteritems():
+                self.gauges[guard(stat)] = value
+        for stat, timings in timers.iteritems():
+            if guard is not None:
+                stat = guard(stat)
+            if self.percentiles:
+                self.sketch(stat).merge(timings)
+            else:
+                self.timers[stat].extend(timings)
+                self.timings_count += len(timings)
+
+
+class StatsDBuffer(StatsAggregate):
+    """
+    Aggregate stats for statsd in memory and send them periodically.
+
+    All collected stats are sent every 'flush_interval' seconds in
+    multi-metric packets, no more than 'max_packet' bytes each. Timings
+    counted in sketches are sent as '<metric>.count' counter and
+    '<metric>.p<N>' gauges for every percentile.
+    """
+    def __init__(self, host, port, prefix=None, flush_interval=1.0,
+                 max_packet=1432, max_timings=10000, **kwargs):
+        super(StatsDBuffer, self).__init__(**kwargs)
+        self.addr = (socket.gethostbyname(host), port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if prefix:
+            self.prefix = '%s.' % prefix
+        else:
+            self.prefix = ''
+        self.flush_interval = flush_interval
+        self.max_packet = max_packet
+        self.max_timings = max_timings
+        self.flush_time = time.time() + flush_interval
+
+    def timing(self, stat, delta, rate=1):
+        """
+        Add 'stat' timing, flush stats if there are too many timings.
+        """
+        super(StatsDBuffer, self).timing(stat, delta, rate)
+        if self.timings_count >= self.max_timings:
+            self.flush()
+
+    def merge(self, counters, gauges, timers, guard=None):
+        """
+        Merge stats, flush them if there are too many timings.
+        """
+        super(StatsDBuffer, self).merge(counters, gauges, timers, guard)
+        if self.timings_count >= self.max_timings:
+            self.flush()
+
+    def tick(self, now=None):
+        """
+        Flush stats if it's time to.
+        """
+        if now is None:
+            now = time.time()
+        if now >= self.flush_time:
+            self.flush()
+            self.flush_time = now + self.flush_interval
+
+    def lines(self):
+        """
+        Get all collected stats as statsd lines and reset them.
+        """
+        prefix = self.prefix
+        counters, gauges, timers = self.take()
+        for stat, count in counters.iteritems():
+            yield '%s%s:%s|c' % (prefix, stat, count)
+        for stat, value in gauges.iteritems():
+            yield '%s%s:%s|g' % (prefix, stat, value)
+        if self.percentiles:
+            for stat, sketch in timers.iteritems():
+                yield '%s%s.count:%d|c' % (prefix, stat, sketch.count)
+                for percentile in self.percentiles:
+                    yield '%s%s.p%s:%s|g' % (
+                        prefix, stat, percentile,
+                        sketch.quantile(percentile / 100.0))
+            return
+
+        for stat, timings in timers.iteritems():
+            for delta in timings:
+                if isinstance(delta, tuple):
+                    yield '%s%s:%d|ms|@%s' % (prefix, stat, delta[0],
+                                              delta[1])
+                else:
+                    yield '%s%s:%d|ms' % (prefix, stat, delta)
+
+    def flush(self):
+        """
+        Send all collected stats packed into packets.
+        """
+        packet = []
+        size = 0
+        for line in self.lines():
+            if packet and size + len(line) >= self.max_packet:
+                self.send('\n'.join(packet))
+                packet = []
+                size = 0
+            packet.append(line)
+            size += len(line) + 1
+        if packet:
+            self.send('\n'.join(packet))
+
+    def send(self, packet):
+        """
+        Send packet to statsd.
+        """
+        try:
+            self.sock.sendto(packet, self.addr)
+        except socket.error:
+            pass
 
 
 class StaticticStatsD(object):
     """
     Send stats to statsd.
+
+    If 'flush_interval' is set, stats are aggregated in memory and sent
+    every 'flush_interval' seconds (see 'StatsDBuffer'). Timings percentiles
+    need aggregation, so stats are sent every second if 'percentiles' are
+    set without 'flush_interval'. With 'aggregate' stats are only
+    aggregated in memory and never sent (for shard workers, see
+    'gossip.worker.ShardWorker'). If 'max_names' is set, no more than
+    'max_names' most frequent names per metric parent are sent every
+    'max_names_interval' seconds, except ones matching 'max_names_keep'
+    patterns (see 'gossip.cardinality'). Names are guarded once in process,
+    which sends stats: aggregating clients leave it to 'merge'.
+
+    Counters and timings of sampled lines have 'rate' (see
+    'gossip.sampling'): counters are scaled up, aggregated timings are
+    counted with '@rate'. Not aggregated timings are sent without rate:
+    statsd client would sample them again.
     """
-    def __init__(self, hostname, host, port, prefix=None):
-        self.client = StatsClient(host, port, prefix=prefix)
+    def __init__(self, hostname, host, port, prefix=None,
+                 flush_interval=None, aggregate=False, max_names=None,
+                 max_names_interval=60.0,
+                 max_names_keep=('*.response_status.*',), **kwargs):
+        if flush_interval is None and kwargs.get('percentiles'):
+            flush_interval = 1.0
+
+        self.guard = None
+        if max_names and not aggregate:
+            self.guard = CardinalityGuard(max_names, max_names_interval,
+                                          keep=max_names_keep)
+
+        if aggregate:
+            self.client = StatsAggregate(**kwargs)
+        elif flush_interval is not None:
+            self.client = StatsDBuffer(host, port, prefix=prefix,
+                                       flush_interval=flush_interval,
+                                       **kwargs)
+        else:
+            # 'statsd' package is only needed for unbuffered client
+            from statsd import StatsClient
+            self.client = StatsClient(host, port, prefix=prefix)
         self.hostname = hostname
 
-    def incr(self, metric, value=1, prefix=None):
+    def incr(self, metric, value=1, prefix=None, rate=1):
         """
-        Increment 'metric' counter with 'value'.
+        Increment 'metric' counter with 'value' ('rate' part of sampled
+        values).
         """
         if prefix is not None:
             metric = '%s.%s' % (prefix, metric)
+        value = scale(value, rate)
+        if self.guard is not None:
+            metric = self.guard(metric, value)
 
         self.client.incr(metric, value)
 
@@ -29,26 +300,145 @@ class StaticticStatsD(object):
             metric = '%s.%s' % (self.hostname, metric)
             self.client.incr(metric, value)
 
-    def timing(self, metric, value, prefix=None):
+    def timing(self, metric, value, prefix=None, rate=1):
+        """
+        Send 'metric' timing ('rate' part of sampled timings).
+        """
+        if prefix is not None:
+            metric = '%s.%s' % (prefix, metric)
+        if self.guard is not None:
+            metric = self.guard(metric)
+
+        args = (rate,) if isinstance(self.client, StatsAggregate) else ()
+
+        self.client.timing(metric, value, *args)
+
+        # separate metric for hostname
+        if self.hostname is not None:
+            metric = '%s.%s' % (self.hostname, metric)
+            self.client.timing(metric, value, *args)
+
+    def sketches(self, metric, prefix=None):
+        """
+        Get quantile sketches of 'metric' timings (and of its hostname
+        version) to add many timings at once, empty list if timings aren't
+        counted in sketches (no 'percentiles' set).
+        """
+        client = self.client
+        if not isinstance(client, StatsAggregate) or not client.percentiles:
+            return []
+        if prefix is not None:
+            metric = '%s.%s' % (prefix, metric)
+        if self.guard is not None:
+            metric = self.guard(metric)
+
+        sketches = [client.sketch(metric)]
+        if self.hostname is not None:
+            sketches.append(client.sketch('%s.%s' % (self.hostname, metric)))
+        return sketches
+
+    def gauge(self, metric, value, prefix=None):
         """
-        Send 'metric' timing.
+        Set 'metric' gauge value.
         """
         if prefix is not None:
             metric = '%s.%s' % (prefix, metric)
+        if self.guard is not None:
+            metric = self.guard(metric)
 
-        self.client.timing(metric, value)
+        self.client.gauge(metric, value)
 
         # separate metric for hostname
         if self.hostname is not None:
             metric = '%s.%s' % (self.hostname, metric)
-            self.client.timing(metric, value)
+            self.client.gauge(metric, value)
+
+    def take(self):
+        """
+        Get all aggregated stats and reset them.
+        """
+        return self.client.take()
+
+    def merge(self, counters, gauges, timers):
+        """
+        Merge stats aggregated in another process and send them.
+        """
+        guard = self.guard
+        if isinstance(self.client, StatsAggregate):
+            self.client.merge(counters, gauges, timers, guard)
+            return
+
+        for stat, count in counters.iteritems():
+            if guard is not None:
+                stat = guard(stat, count)
+            self.client.incr(stat, count)
+        for stat, value in gauges.iteritems():
+            if guard is not None:
+                stat = guard(stat)
+            self.client.gauge(stat, value)
+        for stat, timings in timers.iteritems():
+            if guard is not None:
+                stat = guard(stat)
+            for delta in timings:
+                if isinstance(delta, tuple):
+                    delta = delta[0]
+                self.client.timing(stat, delta)
+
+    def tick(self, now=None):
+        """
+        Send aggregated stats if it's time to.
+        """
+        if self.guard is not None:
+            self.guard.tick(now)
+        if isinstance(self.client, StatsDBuffer):
+            self.client.tick(now)
+
+    def flush(self):
+        """
+        Send all aggregated stats.
+        """
+        if isinstance(self.client, StatsDBuffer):
+            self.client.flush()
 
 
 class StaticticGraphite(object):
     """
     Send stats to graphite.
+
+    Metrics are buffered and sent in batches over long-lived connection:
+    when 'batch_size' metrics are collected or every 'flush_interval'
+    seconds. No more than 'max_buffer' metrics are buffered while carbon is
+    unavailable: 'drop' policy defines which ones are dropped on overflow -
+    'oldest' or 'newest'. Protocol is 'plaintext' or 'pickle'. With
+    'aggregate' metrics are only collected in memory and never sent (for
+    shard workers, see 'gossip.worker.ShardWorker'). 'max_names' and
+    'max_names_keep' work as in 'StaticticStatsD'.
+
+    With 'threaded' metrics are sent by separate thread, so slow carbon
+    never stalls reading of logs, and 'drop' may also be 'block' or 'sample'
+    (see 'gossip.sender').
+
+    Metrics may be sent with 'timestamp' (e.g. of log line), current time
+    is used otherwise. With 'bucket' metrics are aggregated in buckets of
+    'bucket' seconds by timestamp: values of the same counter are summed,
+    metric sent by 'send' (gauge) keeps the last value. Bucket is sent when
+    the newest timestamp seen (watermark) is 'bucket_delay' seconds past its
+    end, or when no metrics are added for 'bucket' + 'bucket_delay' seconds
+    of wall clock. Sums of sent buckets are kept for 'bucket_keep' seconds
+    of event time: late values are added to them and full sums are sent
+    again, graphite keeps the last value (late gauge replaces sent one).
+
+    Counters ('incr') are always summed in buckets, 1 second ones without
+    'bucket': otherwise graphite keeps only the last of values of counter
+    sent for the same second.
     """
-    def __init__(self, hostname, host, port, prefix=None):
+    def __init__(self, hostname, host, port, prefix=None, protocol='plaintext',
+                 batch_size=500, flush_interval=1.0, max_buffer=100000,
+                 drop='oldest', timeout=1.0, reconnect_interval=5.0,
+                 aggregate=False, max_names=None, max_names_interval=60.0,
+                 max_names_keep=('*.response_status.*',),
+                 threaded=False, sample_rate=10, bucket=None,
+                 bucket_delay=None, bucket_keep=None):
         self.hostname = hostname
         self.host = host
         self.port = port
@@ -57,24 +447,399 @@ class StaticticGraphite(object):
         else:
             self.prefix = ''
 
-    def _send(self, metric, value):
+        if protocol not in ('plaintext', 'pickle'):
+            raise ValueError("unknown graphite protocol '%s'" % protocol)
+        if drop not in (POLICIES if threaded else ('oldest', 'newest')):
+            raise ValueError("unknown graphite drop policy '%s'" % drop)
+        self.protocol = protocol
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.drop = drop
+        self.timeout = timeout
+        self.reconnect_interval = reconnect_interval
+        self.aggregate = aggregate
+        self.guard = None
+        if max_names and not aggregate:
+            self.guard = CardinalityGuard(max_names, max_names_interval,
+                                          keep=max_names_keep)
+
+        self.threaded = threaded and not aggregate
+        self.thread = None
+        if self.threaded:
+            self.buffer = SendQueue(max_buffer, drop, sample_rate)
+        elif drop == 'oldest':
+            self.buffer = deque(maxlen=max_buffer)
+        else:
+            self.buffer = deque()
+        self.dropped = 0
+        # metrics timestamps source, replay sets it to time of log lines
+        self.clock = time.time
+        # open buckets {start: ({counter: sum}, {gauge: last value})} and
+        # sums of sent ones {start: {counter: sum}}
+        self.bucket = bucket
+        self.bucket_size = bucket or 1
+        self.bucket_delay = (self.bucket_size if bucket_delay is None
+                             else bucket_delay)
+        self.bucket_keep = (10 * self.bucket_size if bucket_keep is None
+                            else bucket_keep)
+        self.buckets = {}
+        self.closed = {}
+        # newest timestamp of metrics and wall time when it was added
+        self.event_time = 0
+        self.add_time = time.time()
+        self.sock = None
+        self.connect_time = 0
+        self.flush_time = time.time() + flush_interval
+
+    def connect(self):
+        """
+        Connect to carbon, but not more often than 'reconnect_interval'.
+        """
+        now = time.time()
+        if now < self.connect_time:
+            return False
+        self.connect_time = now + self.reconnect_interval
+
+        try:
+            self.sock = socket.create_connection((self.host, self.port),
+                                                 self.timeout)
+        except socket.error:
+            self.sock = None
+            return False
+
+        return True
+
+    def close(self):
+        """
+        Close connection to carbon.
+        """
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def serialize(self, batch):
+        """
+        Serialize batch of metrics for sending.
+        """
+        if self.protocol == 'pickle':
+            payload = cPickle.dumps(
+                [(metric, (ts, value)) for metric, value, ts in batch],
+                protocol=2)
+            return struct.pack('!L', len(payload)) + payload
+
+        return ''.join(
+            '%s %s %d\n' % (metric, value, ts) for metric, value, ts in batch)
+
+    def send_batch(self, batch):
+        """
+        Send batch of metrics, returns number of metrics sent from its head
+        (less than batch size if carbon is unavailable).
+
+        When connection breaks in the middle of batch, metrics written
+        completely are not sent again: carbon drops incomplete line (or
+        pickle) of closed connection.
+        """
+        if self.sock is None and not self.connect():
+            return 0
+
+        data = self.serialize(batch)
+        sent = 0
+        try:
+            while sent < len(data):
+                sent += self.sock.send(buffer(data, sent))
+        except socket.error:
+            self.close()
+            if self.protocol == 'pickle':
+                return 0
+            return data.count('\n', 0, sent)
+        return len(batch)
+
+    def start(self):
+        """
+        Start sender thread.
+        """
+        self.thread = SenderThread(
+            self.buffer, self.send_batch, batch_size=self.batch_size,
+            flush_interval=self.flush_interval,
+            retry_interval=min(self.reconnect_interval, 1.0))
+        self.thread.start()
+
+    def close_buckets(self, all_buckets=False):
+        """
+        Move buckets, which are 'bucket_delay' seconds past their end by
+        watermark (or all ones), to buffer.
+
+        Counters of bucket are added to sums of sent bucket with the same
+        start, and full sums are sent.
+        """
+        if not self.buckets:
+            return
+        # last bucket start, which may be closed
+        last = self.event_time - self.bucket_size - self.bucket_delay
+        for start in sorted(self.buckets):
+            if not all_buckets and start > last:
+                break
+            totals = self.closed.get(start)
+            if totals is None:
+                totals = self.closed[start] = {}
+            counters, gauges = self.buckets.pop(start)
+            for metric, value in counters.iteritems():
+                value = totals[metric] = totals.get(metric, 0) + value
+                self._buffer((metric, value, start))
+            for metric, value in gauges.iteritems():
+                self._buffer((metric, value, start))
+
+        # forget sums of buckets, which are too old to get late values
+        oldest = self.event_time - self.bucket_keep
+        for start in self.closed.keys():
+            if start < oldest:
+                del self.closed[start]
+
+    def flush(self):
+        """
+        Send all buffered metrics by batches.
+
+        With 'threaded' waits for sender thread to send them, but no more
+        than 'flush_interval' + 'timeout' seconds, thread keeps running.
+        """
+        if self.aggregate:
+            return
+
+        self.close_buckets(all_buckets=True)
+        self.send_buffer()
+        if self.threaded and self.thread is not None:
+            self.buffer.join(self.flush_interval + self.timeout)
+
+    def stop(self):
+        """
+        Send all buffered metrics, stop sender thread and close connection.
+        """
+        self.flush()
+        if self.thread is not None:
+            self.thread.stop(self.timeout)
+            self.thread = None
+        self.close()
+
+    def send_buffer(self):
+        """
+        Send all metrics from buffer by batches.
+        """
+        if self.threaded:
+            # sender thread sends them
+            return
+
+        buf = self.buffer
+        while buf:
+            size = min(len(buf), self.batch_size)
+            batch = [buf.popleft() for _ in xrange(size)]
+            sent = self.send_batch(batch)
+            if sent < len(batch):
+                # return unsent metrics back to buffer and try again later
+                batch = batch[sent:]
+                free = self.max_buffer - len(buf)
+                if free < len(batch):
+                    self.dropped += len(batch) - free
+                    batch = batch[len(batch) - free:] if free > 0 else []
+                buf.extendleft(reversed(batch))
+                return
+
+    def counters(self):
+        """
+        Get buffer counters: {'depth': metrics in buffer, 'dropped': metrics
+        dropped}.
+        """
+        dropped = self.dropped
+        if self.threaded:
+            dropped = self.buffer.dropped
+        return {'depth': len(self.buffer), 'dropped': dropped}
+
+    def take(self):
+        """
+        Get all metrics and reset buffer: (buffered metrics, metrics from
+        buckets with counter flag).
+        """
+        bucketed = []
+        for start, (counters, gauges) in self.buckets.iteritems():
+            bucketed.extend((metric, value, start, True)
+                            for metric, value in counters.iteritems())
+            bucketed.extend((metric, value, start, False)
+                            for metric, value in gauges.iteritems())
+        self.buckets = {}
+        if self.threaded:
+            return self.buffer.clear(), bucketed
+        items = list(self.buffer)
+        self.buffer.clear()
+        return items, bucketed
+
+    def merge(self, items):
+        """
+        Add metrics collected in another process (see 'take') to buffer.
+        """
+        buffered, bucketed = items
+        guard = self.guard
+        bucket = self.bucket
+        for item in buffered:
+            if guard is not None:
+                item = (guard(item[0]),) + item[1:]
+            if bucket:
+                self._add_bucket(item, False)
+            else:
+                self._buffer(item)
+        for metric, value, start, counter in bucketed:
+            if guard is not None:
+                metric = guard(metric, value if counter else 1)
+            self._add_bucket((metric, value, start), counter)
+
+    def tick(self, now=None):
+        """
+        Send buffered metrics if it's time to.
+        """
+        if now is None:
+            now = time.time()
+        if self.guard is not None:
+            self.guard.tick(now)
+        if self.buckets and not self.aggregate:
+            # watermark doesn't move without metrics, so buckets are sent
+            # by wall clock when nothing is added
+            idle = time.time() - self.add_time
+            self.close_buckets(
+                all_buckets=idle >= self.bucket_size + self.bucket_delay)
+        if self.threaded:
+            return
+        if now >= self.flush_time:
+            self.flush_time = now + self.flush_interval
+            if self.buffer:
+                self.send_buffer()
+
+    def _buffer(self, item):
+        """
+        Add (metric, value, timestamp) to buffer, send batch if it's full.
+        """
+        if self.threaded:
+            if self.thread is None:
+                self.start()
+            self.buffer.put(item)
+            return
+
+        buf = self.buffer
+        if len(buf) >= self.max_buffer:
+            self.dropped += 1
+            if self.drop == 'newest':
+                return
+        buf.append(item)
+
+        if len(buf) >= self.batch_size:
+            self.send_buffer()
+
+    def _add_bucket(self, item, counter=True):
+        """
+        Add (metric, value, timestamp) to its bucket: sum counter, keep the
+        last value of gauge.
+        """
+        metric, value, timestamp = item
+        start = timestamp - timestamp % self.bucket_size
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = self.buckets[start] = ({}, {})
+        if counter:
+            metrics = bucket[0]
+            metrics[metric] = metrics.get(metric, 0) + value
+        else:
+            bucket[1][metric] = value
+        if timestamp > self.event_time:
+            self.event_time = timestamp
+        self.add_time = time.time()
+
+    def _send(self, metric, value, timestamp=None, counter=False):
         """
         Internal function for send stats.
         """
-        sock = socket.socket()
-        sock.connect((self.host, self.port))
-        sock.sendall('%s %s %d\n' % (metric, value, int(time.time())))
-        sock.close()
+        if timestamp is None:
+            timestamp = self.clock()
+        if self.bucket or counter:
+            self._add_bucket((metric, value, int(timestamp)), counter)
+        else:
+            self._buffer((metric, value, int(timestamp)))
 
-    def send(self, metric, value=1, prefix=None):
+    def _send_metric(self, metric, value, prefix, timestamp, rate, counter):
         """
-        Send 'value' for 'metric'.
+        Send metric with full name and its hostname version.
         """
         if prefix is not None:
             metric = '%s.%s' % (prefix, metric)
+        value = scale(value, rate)
+        if self.guard is not None:
+            metric = self.guard(metric, value if counter else 1)
 
-        self._send("%s%s" % (self.prefix, metric), value)
+        self._send("%s%s" % (self.prefix, metric), value, timestamp, counter)
 
         # separate metric for hostname
         if self.hostname is not None:
-            self._send("%s%s.%s" % (self.prefix, self.hostname, metric), value)
+            self._send("%s%s.%s" % (self.prefix, self.hostname, metric), value,
+                       timestamp, counter)
+
+    def send(self, metric, value=1, prefix=None, timestamp=None, rate=1):
+        """
+        Send 'value' for 'metric' (at 'timestamp'), value of sampled lines
+        is scaled up by 'rate'.
+        """
+        self._send_metric(metric, value, prefix, timestamp, rate, False)
+
+    def incr(self, metric, value=1, prefix=None, timestamp=None, rate=1):
+        """
+        Add 'value' to counter 'metric' (at 'timestamp'): values are summed
+        by time in buckets, see class docstring.
+        """
+        self._send_metric(metric, value, prefix, timestamp, rate, True)
+
+
+class TaggedStats(object):
+    """
+    Stats sender proxy, which puts tag into metric names after parser
+    prefix: 'prefix.tag.metric' ('tag.metric' if parser has no prefix).
+
+    Files of 'glob' and 'dir' sources are parsed with tagged senders, tag is
+    derived from file name.
+    """
+    def __init__(self, stats, tag):
+        self.stats = stats
+        self.tag = tag
+
+    def __getattr__(self, name):
+        return getattr(self.stats, name)
+
+    def tagged(self, prefix):
+        """
+        Get prefix with tag.
+        """
+        if prefix is None:
+            return self.tag
+        return '%s.%s' % (prefix, self.tag)
+
+    def incr(self, metric, value=1, prefix=None, rate=1, **kwargs):
+        """
+        Increment counter with tagged prefix ('timestamp' for graphite).
+        """
+        self.stats.incr(metric, value, prefix=self.tagged(prefix), rate=rate,
+                        **kwargs)
+
+    def timing(self, metric, value, prefix=None, rate=1):
+        """
+        Send timing with tagged prefix.
+        """
+        self.stats.timing(metric, value, prefix=self.tagged(prefix),
+                          rate=rate)
+
+    def gauge(self, metric, value, prefix=None):
+        """
+        Set gauge with tagged prefix.
+        """
+        self.stats.gauge(metric, value, prefix=self.tagged(prefix))
+
+    def send(self, metric, value=1, prefix=None, timestamp=None, rate=1):
+        """
+        Send metric to graphite with tagged prefix.
+        """
+        self.stats.send(metric, value, prefix=self.tagged(prefix),
+                        timestamp=timestamp, rate=rate)
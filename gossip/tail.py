@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+"""
+Tail files: file watchers and file sources.
+
+Watcher waits till something happens with watched files. There are two
+watchers: 'inotify' (Linux only) blocks in kernel till new bytes are written
+and 'poll' simply sleeps for some interval (old good 'sleep(0.1)'). Both
+also wait for sockets of network sources (see 'gossip.listen').
+
+File source reads file by large blocks and splits them into lines in bulk.
+"""
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+
+# inotify constants, see 'man 7 inotify'
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVE_SELF = 0x00000800
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# inotify event header: wd, mask, cookie, len
+IN_EVENT = struct.Struct('iIII')
+
+# events we are interested in for watched file
+IN_FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+
+# events we are interested in for watched directory: files come and go
+IN_DIR_EVENTS = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO |
+                 IN_ONLYDIR)
+
+
+class WatcherError(Exception):
+    """
+    File watcher exception.
+    """
+    pass
+
+
+def select_fds(fds, timeout=None):
+    """
+    Wait till some of file descriptors are ready to read no more than
+    'timeout' seconds.
+
+    Returns list of ready file descriptors (empty on timeout or signal).
+    """
+    try:
+        ready, _, _ = select.select(list(fds), [], [], timeout)
+    except select.error, ex:
+        if ex.args[0] == errno.EINTR:
+            return []
+        raise
+    return ready
+
+
+class PollWatcher(object):
+    """
+    Poll watcher: sleep for 'interval' seconds and say 'check all files'.
+    """
+    name = 'poll'
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.paths = set()
+        # watched sockets: {fd: key}
+        self.fds = {}
+
+    def add(self, path):
+        """
+        Add file to watch.
+        """
+        self.paths.add(path)
+
+    def add_dir(self, path):
+        """
+        Add directory to watch: nothing to do, directories are scanned by
+        worker every 'scan_interval' seconds.
+        """
+        pass
+
+    def add_fd(self, key, fd):
+        """
+        Add socket to watch: 'key' is reported when it is ready to read.
+        """
+        self.fds[fd] = key
+
+    def remove(self, path):
+        """
+        Remove file from watch.
+        """
+        self.paths.discard(path)
+
+    def remove_fd(self, fd):
+        """
+        Remove socket from watch.
+        """
+        self.fds.pop(fd, None)
+
+    def wait(self, timeout=None):
+        """
+        Wait for 'interval' seconds and return all watched paths (and keys
+        of ready sockets, which wake watcher up earlier).
+        """
+        if timeout is None or timeout > self.interval:
+            timeout = self.interval
+        if not self.fds:
+            time.sleep(timeout)
+            return set(self.paths)
+        changed = set(self.paths)
+        changed.update(self.fds[fd] for fd in select_fds(self.fds, timeout))
+        return changed
+
+    def close(self):
+        """
+        Close watcher.
+        """
+        self.paths.clear()
+        self.fds.clear()
+
+
+class InotifyWatcher(object):
+    """
+    Inotify watcher: block till kernel tells us about changes in files.
+
+    With 'fallback' files, which can't be watched (e.g. inotify watches
+    limit is reached), are polled: watcher wakes up every 'interval'
+    seconds and says 'check all files'. Directories, which can't be
+    watched, are only scanned by worker every 'scan_interval' seconds.
+    """
+    name = 'inotify'
+
+    def __init__(self, interval=0.1, fallback=False, **kwargs):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise WatcherError("can't find libc")
+
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise WatcherError("inotify is not supported")
+
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise WatcherError(os.strerror(ctypes.get_errno()))
+
+        # watch descriptor -> path and back
+        self.watches = {}
+        self.paths = {}
+        # watched sockets: {fd: key}
+        self.fds = {}
+        # files, which can't be watched and are polled
+        self.interval = interval
+        self.fallback = fallback
+        self.polled = set()
+
+    def add(self, path, mask=IN_FILE_EVENTS):
+        """
+        Add file to watch.
+        """
+        wd = self.libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            if self.fallback:
+                if not mask & IN_ONLYDIR:
+                    self.polled.add(path)
+                return
+            raise WatcherError("can't watch '%s': %s" % (
+                path, os.strerror(ctypes.get_errno())))
+        self.polled.discard(path)
+        self.watches[wd] = path
+        self.paths[path] = wd
+
+    def add_dir(self, path):
+        """
+        Add directory to watch: path of directory is reported as changed
+        when files are created, removed or renamed in it.
+        """
+        self.add(path, IN_DIR_EVENTS)
+
+    def add_fd(self, key, fd):
+        """
+        Add socket to watch: 'key' is reported when it is ready to read.
+        """
+        self.fds[fd] = key
+
+    def remove_fd(self, fd):
+        """
+        Remove socket from watch.
+        """
+        self.fds.pop(fd, None)
+
+    def remove(self, path):
+        """
+        Remove file from watch.
+        """
+        self.polled.discard(path)
+        wd = self.paths.pop(path, None)
+        if wd is None:
+            return
+        self.watches.pop(wd, None)
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """
+        Read all pending events from inotify and return changed paths.
+        """
+        changed = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except OSError, ex:
+                if ex.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not buf:
+                break
+
+            pos = 0
+            while pos < len(buf):
+                wd, mask, _, length = IN_EVENT.unpack_from(buf, pos)
+                pos += IN_EVENT.size + length
+                path = self.watches.get(wd)
+                if path is None:
+                    continue
+                changed.add(path)
+                if mask & IN_IGNORED:
+                    # watch was removed by kernel (file is deleted)
+                    self.watches.pop(wd, None)
+                    if self.paths.get(path) == wd:
+                        self.paths.pop(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """
+        Wait for changes in watched files no more than 'timeout' seconds.
+
+        Returns set of changed paths and keys of ready sockets (empty on
+        timeout, every 'interval' seconds if some files are polled).
+        """
+        if self.polled and (timeout is None or timeout > self.interval):
+            timeout = self.interval
+        ready = select_fds([self.fd] + self.fds.keys(), timeout)
+        if not ready:
+            return set()
+        changed = set(self.fds[fd] for fd in ready if fd in self.fds)
+        changed.update(self.polled)
+        if self.fd in ready:
+            changed.update(self.read_events())
+        return changed
+
+    def close(self):
+        """
+        Close watcher.
+        """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self.watches.clear()
+        self.paths.clear()
+        self.fds.clear()
+        self.polled.clear()
+
+
+WATCHERS = {
+    'poll': PollWatcher,
+    'inotify': InotifyWatcher,
+}
+
+
+def get_watcher(engine='auto', interval=0.1):
+    """
+    Create file watcher.
+
+    Engine 'auto' tries inotify first and falls back to polling: for all
+    files if inotify isn't available, for files which can't be watched
+    otherwise.
+    """
+    if engine == 'auto':
+        try:
+            return InotifyWatcher(interval=interval, fallback=True)
+        except WatcherError:
+            return PollWatcher(interval=interval)
+
+    if engine not in WATCHERS:
+        raise WatcherError("unknown tail engine '%s'" % engine)
+
+    return WATCHERS[engine](interval=interval)
+
+
+class FileSource(object):
+    """
+    Tailed file: read file by large blocks and split them into lines.
+
+    File is tracked by inode and size, so rotation (file is renamed or
+    removed and new one is created) and truncation (copytruncate) are
+    detected. Rotated file is drained till the end and closed after
+    'rotate_timeout' seconds without new data.
+    """
+    def __init__(self, path, block_size=262144, rotate_timeout=5.0):
+        self.path = path
+        self.block_size = block_size
+        self.rotate_timeout = rotate_timeout
+        self.fd = None
+        # (device, inode) of opened file
+        self.inode = None
+        self.offset = 0
+        # partial trailing line, carried over to the next read
+        self.partial = ''
+        # rotated file which is still drained: [fd, partial, deadline]
+        self.rotated = None
+        # bytes read from all files
+        self.bytes_read = 0
+
+    def open(self, offset=None):
+        """
+        Open file and seek to 'offset' (to the end by default).
+        """
+        fd = os.open(self.path, os.O_RDONLY)
+        stat = os.fstat(fd)
+        if offset is None:
+            offset = stat.st_size
+
+        self.fd = fd
+        self.inode = (stat.st_dev, stat.st_ino)
+        self.offset = os.lseek(fd, offset, os.SEEK_SET)
+        self.partial = ''
+
+    def resume(self, inode, offset, max_backlog=None):
+        """
+        Open file and resume reading from saved position.
+
+        If file is rotated since position was saved, new file is read from
+        the beginning. No more than 'max_backlog' bytes are read on resume.
+        """
+        self.open()
+        size = self.offset
+
+        if inode != self.inode or offset > size:
+            offset = 0
+
+        if max_backlog is None or size - offset <= max_backlog:
+            self.offset = os.lseek(self.fd, offset, os.SEEK_SET)
+            return
+
+        # skip backlog and first (probably incomplete) line
+        self.offset = os.lseek(self.fd, size - max_backlog, os.SEEK_SET)
+        while True:
+            block = os.read(self.fd, 4096)
+            if not block:
+                break
+            pos = block.find('\n')
+            if pos != -1:
+                self.offset += pos + 1
+                os.lseek(self.fd, self.offset, os.SEEK_SET)
+                break
+            self.offset += len(block)
+
+    def position(self):
+        """
+        Get position of first unprocessed line: (inode, offset).
+        """
+        return self.inode, self.offset - len(self.partial)
+
+    def lag(self):
+        """
+        Get number of bytes behind end of file.
+        """
+        if self.fd is None:
+            return 0
+        return max(os.fstat(self.fd).st_size - self.offset, 0)
+
+    def split(self, block, partial):
+        """
+        Split block into lines, prepend previous partial line to the first
+        one and return lines with new partial line.
+        """
+        lines = block.split('\n')
+        if partial:
+            lines[0] = partial + lines[0]
+        partial = lines.pop()
+
+        return [line.strip() for line in lines], partial
+
+    def read_lines(self):
+        """
+        Read next block from file and split it into lines.
+
+        Returns list of complete lines or None if end of file is reached.
+        Empty list means 'nothing to process yet, but read again'.
+        """
+        if self.rotated is not None:
+            lines = self.read_rotated()
+            if lines is not None:
+                return lines
+
+        block = os.read(self.fd, self.block_size)
+        if block:
+            self.offset += len(block)
+            self.bytes_read += len(block)
+            lines, self.partial = self.split(block, self.partial)
+            return lines
+
+        # end of file: check if file is truncated or rotated
+        if self.check_truncated() or self.check_rotated():
+            return []
+
+        return None
+
+    def read_rotated(self):
+        """
+        Read next block from rotated file.
+
+        Returns None if there is no new data in rotated file.
+        """
+        fd, partial, deadline = self.rotated
+
+        block = os.read(fd, self.block_size)
+        if block:
+            self.bytes_read += len(block)
+            lines, self.rotated[1] = self.split(block, partial)
+            self.rotated[2] = time.time() + self.rotate_timeout
+            return lines
+
+        if time.time() < deadline:
+            return None
+
+        # rotated file is drained, last line may be without newline
+        os.close(fd)
+        self.rotated = None
+        if partial:
+            return [partial.strip()]
+        return None
+
+    def check_truncated(self):
+        """
+        Check if file is truncated and read it from the beginning.
+        """
+        if os.fstat(self.fd).st_size >= self.offset:
+            return False
+
+        self.offset = os.lseek(self.fd, 0, os.SEEK_SET)
+        self.partial = ''
+        return True
+
+    def check_rotated(self):
+        """
+        Check if file is rotated and open new one from the beginning.
+
+        Old file is kept open and drained by 'read_rotated'.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # file is removed or renamed, but new one is not created yet
+            return False
+
+        if (stat.st_dev, stat.st_ino) == self.inode:
+            return False
+
+        if self.rotated is not None:
+            # file is rotated twice, we did our best with previous one
+            os.close(self.rotated[0])
+
+        self.rotated = [self.fd, self.partial,
+                        time.time() + self.rotate_timeout]
+        self.fd = None
+        self.open(0)
+        return True
+
+    def close(self):
+        """
+        Close file.
+        """
+        if self.rotated is not None:
+            os.close(self.rotated[0])
+            self.rotated = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -1,5 +1,5 @@
 """
 Tests.
 
-TODO.
+Run them with 'python -m unittest discover -s gossip/test -t .'.
 """
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of metric names cardinality control.
+"""
+import unittest
+
+from gossip.cardinality import SpaceSaving, CardinalityGuard
+
+
+class SpaceSavingTest(unittest.TestCase):
+    """
+    Test 'gossip.cardinality.SpaceSaving'.
+    """
+    def test_exact_counts(self):
+        counts = SpaceSaving(capacity=10)
+        for item, count in (('a', 5), ('b', 3), ('a', 2), ('c', 1)):
+            counts.add(item, count)
+        self.assertEqual(counts.top(2), [('a', 7, 0), ('b', 3, 0)])
+
+    def test_heavy_hitters(self):
+        counts = SpaceSaving(capacity=5)
+        # heavy hitters come after many distinct rare items
+        for i in xrange(100):
+            counts.add('rare%d' % i)
+        for _ in xrange(50):
+            counts.add('heavy1')
+            counts.add('heavy2', 2)
+        self.assertEqual(len(counts.counters), 5)
+        top = counts.top(2)
+        self.assertEqual([item for item, _, _ in top], ['heavy2', 'heavy1'])
+        for item, count, error in top:
+            real = 100 if item == 'heavy2' else 50
+            # counts are overestimated by no more than error
+            self.assertTrue(count - error <= real <= count)
+
+    def test_clear(self):
+        counts = SpaceSaving()
+        counts.add('a')
+        counts.clear()
+        self.assertEqual(counts.top(), [])
+
+
+class CardinalityGuardTest(unittest.TestCase):
+    """
+    Test 'gossip.cardinality.CardinalityGuard'.
+    """
+    def test_fold(self):
+        guard = CardinalityGuard(max_names=2, keep=())
+        names = [guard('method.%s' % name) for name in ('GET', 'POST', 'X')]
+        self.assertEqual(names, ['method.GET', 'method.POST', 'method.other'])
+        self.assertEqual(guard('method.GET'), 'method.GET')
+        self.assertEqual(guard.folded, 1)
+        # names are capped per parent, names without parent are kept
+        self.assertEqual(guard('url.X'), 'url.X')
+        self.assertEqual(guard('total'), 'total')
+
+    def test_keep(self):
+        guard = CardinalityGuard(max_names=1)
+        guard('host.response_status.200')
+        self.assertEqual(guard('host.response_status.404'),
+                         'host.response_status.404')
+        guard = CardinalityGuard(max_names=1, keep='*.status.*')
+        guard('a.status.200')
+        self.assertEqual(guard('a.status.500'), 'a.status.500')
+        guard('a.response_status.200')
+        self.assertEqual(guard('a.response_status.500'),
+                         'a.response_status.other')
+
+    def test_tick_chooses_heavy_hitters(self):
+        guard = CardinalityGuard(max_names=2, interval=60.0, keep=())
+        now = guard.reset_time - 60.0
+        # garbage names come first and take all slots
+        guard('url.junk1')
+        guard('url.junk2')
+        self.assertEqual(guard('url.index', 100), 'url.other')
+        guard('url.api', 50)
+
+        # not the time yet
+        guard.tick(now + 1)
+        self.assertEqual(guard('url.index'), 'url.other')
+
+        guard.tick(now + 60)
+        self.assertEqual(guard.allowed['url'], set(['index', 'api']))
+        self.assertEqual(guard('url.index'), 'url.index')
+        self.assertEqual(guard('url.junk1'), 'url.other')
+
+        # counts are of the last interval only
+        guard('url.junk1', 10)
+        guard('url.junk2', 10)
+        guard.tick(now + 120)
+        self.assertEqual(guard.allowed['url'], set(['junk1', 'junk2']))
+
+    def test_capacity(self):
+        guard = CardinalityGuard(max_names=3, keep=())
+        self.assertEqual(guard.capacity, 12)
+        for i in xrange(1000):
+            guard('url.%d' % i)
+        self.assertEqual(len(guard.counts['url'].counters), 12)
+        self.assertEqual(len(guard.allowed['url']), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
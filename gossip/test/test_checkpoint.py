@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of read offsets checkpoints.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from gossip.checkpoint import Checkpoint
+from gossip.tail import FileSource
+
+
+class Logger(object):
+    """
+    Logger, which saves errors.
+    """
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message):
+        self.errors.append(message)
+
+
+class CheckpointTest(unittest.TestCase):
+    """
+    Test 'gossip.checkpoint.Checkpoint'.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='gossip-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_save_load(self):
+        checkpoint = Checkpoint(self.dir, 'nginx')
+        self.assertIsNone(checkpoint.load())
+        checkpoint.update((1, 2), 100)
+        # not saved before 'interval'
+        self.assertIsNone(Checkpoint(self.dir, 'nginx').load())
+        checkpoint.save()
+        self.assertEqual(Checkpoint(self.dir, 'nginx').load(), ((1, 2), 100))
+
+    def test_interval(self):
+        checkpoint = Checkpoint(self.dir, 'nginx', interval=0)
+        checkpoint.update((1, 2), 100)
+        self.assertEqual(Checkpoint(self.dir, 'nginx').load(), ((1, 2), 100))
+
+    def test_broken(self):
+        with open(os.path.join(self.dir, 'nginx.offset'), 'w') as f:
+            f.write('1 2\n')
+        self.assertIsNone(Checkpoint(self.dir, 'nginx').load())
+
+    def test_atomic_write(self):
+        logger = Logger()
+        checkpoint = Checkpoint(self.dir, 'nginx', logger=logger)
+        checkpoint.update((1, 2), 100)
+        checkpoint.save()
+        self.assertEqual(os.listdir(self.dir), ['nginx.offset'])
+
+        # temporary file can't be written: saved position is kept whole
+        os.mkdir(checkpoint.filename + '.tmp')
+        checkpoint.update((1, 2), 200)
+        checkpoint.save()
+        self.assertEqual(Checkpoint(self.dir, 'nginx').load(), ((1, 2), 100))
+        self.assertEqual(checkpoint.saved, ((1, 2), 100))
+        self.assertEqual(len(logger.errors), 1)
+
+
+class ResumeTest(unittest.TestCase):
+    """
+    Test 'gossip.tail.FileSource.resume' from checkpoint.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='gossip-test-')
+        self.path = os.path.join(self.dir, 'access.log')
+        with open(self.path, 'w') as f:
+            for i in xrange(10):
+                f.write('line %d\n' % i)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def saved(self, offset, max_backlog=None):
+        """
+        Save position of test log file, get checkpoint loaded again.
+        """
+        source = FileSource(self.path)
+        source.open(offset)
+        checkpoint = Checkpoint(self.dir, 'nginx', max_backlog=max_backlog)
+        checkpoint.update(*source.position())
+        checkpoint.save()
+        source.close()
+        return Checkpoint(self.dir, 'nginx', max_backlog=max_backlog)
+
+    def resume(self, checkpoint):
+        """
+        Resume reading of test log file, get the first line.
+        """
+        source = FileSource(self.path)
+        inode, offset = checkpoint.load()
+        source.resume(inode, offset, checkpoint.max_backlog)
+        lines = source.read_lines()
+        source.close()
+        return lines[0]
+
+    def test_resume(self):
+        checkpoint = self.saved(14)
+        self.assertEqual(self.resume(checkpoint), 'line 2')
+
+    def test_rotated(self):
+        checkpoint = self.saved(14)
+        os.rename(self.path, self.path + '.1')
+        with open(self.path, 'w') as f:
+            f.write('new 0\nnew 1\n')
+        # new file is read from the beginning
+        self.assertEqual(self.resume(checkpoint), 'new 0')
+
+    def test_truncated(self):
+        checkpoint = self.saved(56)
+        with open(self.path, 'w') as f:
+            f.write('new 0\n')
+        self.assertEqual(self.resume(checkpoint), 'new 0')
+
+    def test_max_backlog(self):
+        checkpoint = self.saved(0, max_backlog=17)
+        # backlog is skipped up to the first complete line
+        self.assertEqual(self.resume(checkpoint), 'line 8')
+        checkpoint = self.saved(56, max_backlog=17)
+        self.assertEqual(self.resume(checkpoint), 'line 8')
+
+
+if __name__ == '__main__':
+    unittest.main()
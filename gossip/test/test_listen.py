@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of network sources helpers.
+"""
+import socket
+import unittest
+
+from gossip.listen import strip_syslog, parse_address
+
+
+class StripSyslogTest(unittest.TestCase):
+    """
+    Test 'gossip.listen.strip_syslog'.
+    """
+    def test_full_header(self):
+        self.assertEqual(
+            strip_syslog('<190>Jun  1 12:00:00 web1 nginx: 1.2.3.4 GET /'),
+            '1.2.3.4 GET /')
+        self.assertEqual(
+            strip_syslog('<13>Dec 31 23:59:59 web1 nginx: line'), 'line')
+
+    def test_short_header(self):
+        self.assertEqual(strip_syslog('<190>nginx: line'), 'line')
+        self.assertEqual(strip_syslog('<190>web1 nginx: line'), 'line')
+
+    def test_no_header(self):
+        for line in ('1.2.3.4 GET /', '', '<190> not header',
+                     '<html>: text'):
+            self.assertEqual(strip_syslog(line), line)
+
+
+class ParseAddressTest(unittest.TestCase):
+    """
+    Test 'gossip.listen.parse_address'.
+    """
+    def test_inet(self):
+        self.assertEqual(parse_address('udp', '127.0.0.1:514'),
+                         (socket.AF_INET, ('127.0.0.1', 514)))
+        self.assertEqual(parse_address('tcp', ':514'),
+                         (socket.AF_INET, ('0.0.0.0', 514)))
+
+    def test_inet6(self):
+        self.assertEqual(parse_address('udp', '[::1]:514'),
+                         (socket.AF_INET6, ('::1', 514)))
+
+    def test_unix(self):
+        self.assertEqual(parse_address('unix', '/run/log.sock'),
+                         (socket.AF_UNIX, '/run/log.sock'))
+
+    def test_invalid(self):
+        for address in ('localhost', 'localhost:port', '127.0.0.1:'):
+            self.assertRaises(ValueError, parse_address, 'udp', address)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of nginx log_format compiler.
+"""
+import unittest
+
+from gossip.parsers.nginx.log_format import split_format, compile_format
+
+
+LINE = ('2013-06-01T12:00:00+04:00 1.2.3.4 100 0.005 500 300 200 '
+        'GET /index?page=1 HTTP/1.1')
+
+COMBINED = ('1.2.3.4 - - [01/Jun/2013:12:00:00 +0400] "POST /api HTTP/1.0" '
+            '404 12 "-" "curl/7.30"')
+
+
+class SplitFormatTest(unittest.TestCase):
+    """
+    Test 'gossip.parsers.nginx.log_format.split_format'.
+    """
+    def test_split(self):
+        self.assertEqual(split_format('[$a] ${b}c $d'), [
+            (False, '['), (True, 'a'), (False, '] '), (True, 'b'),
+            (False, 'c '), (True, 'd')])
+
+    def test_predefined(self):
+        self.assertEqual(split_format('gossip')[0], (True, 'time_iso8601'))
+
+    def test_no_variables(self):
+        self.assertRaises(ValueError, split_format, 'text')
+
+
+class CompileFormatTest(unittest.TestCase):
+    """
+    Test 'gossip.parsers.nginx.log_format.compile_format'.
+    """
+    def test_send_fields(self):
+        record = compile_format('gossip')(LINE)
+        self.assertEqual(record.request_length, 100)
+        self.assertEqual(record.request_time, 0.005)
+        self.assertEqual(record.bytes_sent, 500)
+        self.assertEqual(record.body_bytes_sent, 300)
+        self.assertEqual(record.response_status, 200)
+        self.assertEqual(record.request_method, 'get')
+        self.assertEqual(record.base_url, '/index')
+        # time of line is extracted for 'send_to_graphite'
+        self.assertEqual(record.datetime, '2013-06-01T12:00:00+04:00')
+        # not extracted fields
+        self.assertIsNone(record.request_url)
+
+    def test_default_fields(self):
+        record = compile_format('combined')(COMBINED)
+        self.assertEqual(record.datetime, '01/Jun/2013:12:00:00 +0400')
+        # format without time variable
+        record = compile_format('$status $request_time')('200 0.1')
+        self.assertEqual(tuple(record), (0.1, 200))
+        self.assertIsNone(record.datetime)
+
+    def test_record_access(self):
+        extract = compile_format('gossip', fields=None)
+        record = extract(LINE)
+        self.assertEqual(record['request_url'], '/index?page=1')
+        self.assertEqual(record.get('http_version'), 'HTTP/1.1')
+        self.assertEqual(record.get('unknown', 1), 1)
+        self.assertRaises(KeyError, lambda: record['unknown'])
+        self.assertEqual(record.keys(), list(extract.fields))
+        self.assertEqual(record['datetime'], '2013-06-01T12:00:00+04:00')
+
+    def test_combined(self):
+        extract = compile_format(
+            'combined', fields=('response_status', 'request_method',
+                                'http_user_agent', 'datetime'))
+        record = extract(COMBINED)
+        self.assertEqual(tuple(record), (404, 'post', 'curl/7.30',
+                                         '01/Jun/2013:12:00:00 +0400'))
+
+    def test_not_matching(self):
+        self.assertIsNone(compile_format('combined')('garbage'))
+
+    def test_bad_value(self):
+        line = LINE.replace(' 200 ', ' abc ')
+        self.assertIsNone(compile_format('gossip')(line))
+
+    def test_empty_value(self):
+        extract = compile_format(
+            '$status $upstream_response_time $request_time',
+            fields=('response_status', 'upstream_response_time',
+                    'request_time'))
+        self.assertEqual(tuple(extract('502 - 0.1')), (502, None, 0.1))
+
+    def test_bad_request(self):
+        # 400 and 408 responses have '-' request
+        record = compile_format('gossip')(LINE.replace(
+            'GET /index?page=1 HTTP/1.1', '-').replace(' 200 ', ' 400 '))
+        self.assertEqual(record.response_status, 400)
+        self.assertIsNone(record.request_method)
+        self.assertIsNone(record.base_url)
+
+    def test_request_uri(self):
+        extract = compile_format('$status "$request_uri"',
+                                 fields=('base_url',))
+        self.assertEqual(extract('200 "/a/b?c=d"').base_url, '/a/b')
+
+    def test_adjacent_variables(self):
+        self.assertRaises(ValueError, compile_format, '$status$request_time')
+
+    def test_no_fields(self):
+        self.assertRaises(ValueError, compile_format, '$remote_addr $a')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of lines matching and routing.
+"""
+import unittest
+
+from gossip.parsers.base import compile_match, compile_matcher, route_batch
+
+
+LINES = [
+    'GET /api/items 200',
+    'GET /static/app.js 200',
+    'GET /api/health 200',
+    'POST /login 500',
+    '',
+]
+
+
+class CompileMatcherTest(unittest.TestCase):
+    """
+    Test 'gossip.parsers.base.compile_matcher'.
+    """
+    def test_include(self):
+        matcher = compile_matcher(include=['/api/', '/login'])
+        self.assertEqual([matcher(line) for line in LINES],
+                         ['', None, '', '', None])
+
+    def test_exclude(self):
+        matcher = compile_matcher(include='/api/', exclude='health')
+        self.assertEqual([matcher(line) for line in LINES[:3]],
+                         ['', None, None])
+        # without includes everything else passes
+        matcher = compile_matcher(exclude_re=r' [45]\d\d$')
+        self.assertEqual([matcher(line) for line in LINES[:4]],
+                         ['', '', '', None])
+
+    def test_escape(self):
+        matcher = compile_matcher(include='app.js', include_re='^POST')
+        self.assertEqual([matcher(line) for line in LINES[:4]],
+                         [None, '', None, ''])
+        # substrings are not regexes
+        self.assertIsNone(matcher('GET /static/appXjs 200'))
+
+    def test_routes(self):
+        matcher = compile_matcher(
+            include={'api': '/api/', 'static': '/static/'},
+            include_re={'errors': r' 5\d\d$'})
+        self.assertEqual([matcher(line) for line in LINES],
+                         ['api', 'static', 'api', 'errors', None])
+        # route of the first match in line
+        self.assertEqual(matcher('GET /api/ 500'), 'api')
+        self.assertEqual(matcher('GET /static/api/ 200'), 'static')
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, compile_matcher)
+        self.assertRaises(ValueError, compile_matcher, include_re='(')
+        self.assertRaises(ValueError, compile_matcher, include=[1])
+
+
+class RouteTest(unittest.TestCase):
+    """
+    Test 'gossip.parsers.base.match' routes dispatch by 'route'.
+    """
+    def test_dispatch(self):
+        match = compile_match(include={'api': '/api/', 'static': '/static/'})
+        matched = match.batch(LINES)
+        self.assertEqual(route_batch(matched, name='api'),
+                         [LINES[0], LINES[2]])
+        self.assertEqual(route_batch(matched, name='static'), [LINES[1]])
+        self.assertEqual(route_batch(matched, name='login'), [])
+
+    def test_single_line(self):
+        match = compile_match(include={'api': '/api/'})
+        line = match(LINES[0])
+        self.assertEqual(line, LINES[0])
+        self.assertEqual(line.route, 'api')
+        self.assertIsNone(match(LINES[1]))
+
+    def test_not_routed(self):
+        match = compile_match(include='/api/')
+        # lines without routes are passed as they are
+        self.assertIs(type(match(LINES[0])), str)
+        self.assertEqual(route_batch(match.batch(LINES), name='api'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
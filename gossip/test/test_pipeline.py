@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of compiled parsers tree.
+"""
+import time
+import unittest
+
+from gossip.parsers import base, context_of, ticker_of
+from gossip.parsers.nginx import access_log
+from gossip.pipeline import Pipeline
+
+
+# some time after all intervals of parsers
+LATER = time.time() + 3600
+
+# 'gossip' log line with request time 0.5
+LINE = ('2013-06-01T12:00:00+04:00 10.0.0.1 512 0.500 1024 900 200 '
+        'GET /page/1.js HTTP/1.1')
+
+
+class Stats(object):
+    """
+    Statsd client, which saves sent stats.
+    """
+    def __init__(self):
+        self.sent = []
+
+    def incr(self, metric, count=1, prefix=None, rate=1):
+        self.sent.append((metric, count))
+
+    def gauge(self, metric, value, prefix=None):
+        self.sent.append((metric, value))
+
+    def sketches(self, metric, prefix=None):
+        return []
+
+
+class Logger(object):
+    """
+    Logger, which saves messages.
+    """
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message):
+        self.messages.append(message)
+
+
+def collect(data, out=None, sample=None, **kwargs):
+    """
+    Test parser: save record and sampler it's got with.
+    """
+    out.append((data, sample))
+    return data
+
+
+def upper(data, **kwargs):
+    """
+    Test parser: make line upper case.
+    """
+    return data.upper()
+
+
+def skip_b(data, **kwargs):
+    """
+    Test parser: skip lines, which start with 'b'.
+    """
+    if data.startswith('b'):
+        return None
+    return data
+
+
+def ticked(data, **kwargs):
+    """
+    Test parser with ticker.
+    """
+    return data
+
+
+@ticker_of(ticked)
+def ticked_tick(now, out=None, logname=None, **kwargs):
+    """
+    Save tick time and log name.
+    """
+    out.append((now, logname))
+
+
+def sampled(data, **kwargs):
+    """
+    Test parser, which gives sampler to child parsers.
+    """
+    return data
+
+
+@context_of(sampled)
+def sampled_context(context):
+    """
+    Set 'sample' of child parsers.
+    """
+    return dict(context, sample='sampler')
+
+
+def walk(data, node, context):
+    """
+    Run parsers tree for line by recursive walk (as it was before pipeline).
+    """
+    if 'cmd' in node:
+        kwargs = dict(context)
+        kwargs.update(node['args'])
+        data = node['cmd'](data=data, **kwargs)
+    if data is None:
+        return
+    for child in node.get('parsers', ()):
+        walk(data, child, context)
+
+
+def parser(cmd, children=(), **args):
+    """
+    Make parser node as config does, compile it if parser has compiler.
+    """
+    node = {'cmd': cmd, 'args': args, 'parsers': list(children)}
+    compiler = getattr(cmd, 'compile', None)
+    if compiler is not None:
+        node.update(cmd=compiler(**args), args={}, compiled_args=args,
+                    compiler=compiler)
+    return node
+
+
+class PipelineTest(unittest.TestCase):
+    """
+    Test 'gossip.pipeline.Pipeline'.
+    """
+    def tree(self, outs):
+        """
+        Get parsers tree with branches, 'outs' are lists of collected lines.
+        """
+        return [
+            parser(skip_b, [
+                parser(upper, [parser(collect, out=outs[0])]),
+                parser(collect, out=outs[1]),
+            ]),
+            parser(collect, out=outs[2]),
+        ]
+
+    def test_plan(self):
+        pipeline = Pipeline([parser(upper, [parser(skip_b, [
+            parser(collect, out=[])])])])
+        # chain of parsers with one child is one branch
+        self.assertEqual(len(pipeline.plan), 1)
+        steps, children = pipeline.plan[0]
+        self.assertEqual([step[0] for step in steps],
+                         [upper, skip_b, collect])
+        self.assertEqual(children, [])
+
+    def test_same_as_walk(self):
+        lines = ['a1', 'b1', 'c1', 'b2', 'a2']
+        walked = ([], [], [])
+        for line in lines:
+            for node in self.tree(walked):
+                walk(line, node, {'sample': None})
+        outs = ([], [], [])
+        Pipeline(self.tree(outs)).bind()(lines)
+        self.assertEqual(outs, walked)
+        self.assertEqual([data for data, _ in outs[0]], ['A1', 'C1', 'A2'])
+
+    def test_skip_all(self):
+        outs = ([], [], [])
+        Pipeline(self.tree(outs)).bind()(['b1', 'b2'])
+        # children don't get empty batch
+        self.assertEqual(outs[0], [])
+        self.assertEqual(len(outs[2]), 2)
+
+    def test_ticks(self):
+        out = []
+        pipeline = Pipeline([parser(upper, [
+            parser(ticked, out=out), parser(ticked, out=out)])])
+        run = pipeline.bind(logname='nginx')
+        self.assertEqual(len(run.ticks), 2)
+        for tick in run.ticks:
+            tick(10)
+        # tickers get arguments of parser and context
+        self.assertEqual(out, [(10, 'nginx'), (10, 'nginx')])
+
+    def test_context(self):
+        outs = ([], [], [])
+        pipeline = Pipeline([
+            parser(sampled, [parser(collect, out=outs[0]),
+                             parser(collect, out=outs[1])]),
+            parser(collect, out=outs[2]),
+        ])
+        pipeline.bind()(['a'])
+        # context is changed for child parsers only
+        self.assertEqual(outs, ([('a', 'sampler')], [('a', 'sampler')],
+                                [('a', None)]))
+
+    def test_counters(self):
+        counters = {}
+        pipeline = Pipeline([dict(parser(skip_b, [parser(collect, out=[])]),
+                                  line=3)])
+        pipeline.bind(counters=counters)(['a', 'b'])
+        # calls, items and time of every step by node name
+        self.assertEqual(sorted(counters), ['collect', 'line3_skip_b'])
+        self.assertEqual(counters['line3_skip_b'][:2], [1, 2])
+        self.assertEqual(counters['collect'][:2], [1, 1])
+
+
+class PipelineStateTest(unittest.TestCase):
+    """
+    Test 'gossip.pipeline.Pipeline' state of compiled parsers.
+    """
+    def test_sampler_per_bind(self):
+        out = []
+        pipeline = Pipeline([parser(base.sample, [parser(collect, out=out)],
+                                    n=1)])
+        first, second = pipeline.bind(), pipeline.bind()
+        first(['a', 'b'])
+        second(['c'])
+        # every bound source (e.g. file of glob) has its own sampler
+        samplers = [sample for _, sample in out]
+        self.assertIs(samplers[0], samplers[1])
+        self.assertIsNot(samplers[0], samplers[2])
+        self.assertEqual(samplers[0].seen, 2)
+        self.assertEqual(samplers[2].seen, 1)
+
+    def test_top_per_bind(self):
+        pipeline = Pipeline([parser(access_log.send_top, fields='status',
+                                    k=1)])
+        first, second = Stats(), Stats()
+        run = pipeline.bind(statsd=first)
+        pipeline.bind(statsd=second)(
+            [{'status': 404}, {'status': 404}, {'status': 404}])
+        run([{'status': 200}, {'status': 200}])
+        for tick in run.ticks:
+            tick(LATER)
+        # counts of the other bound source aren't sent
+        self.assertEqual(first.sent, [('top.status.1', 2)])
+
+    def test_top_by_rank(self):
+        pipeline = Pipeline([parser(access_log.send_top, fields='url', k=2)])
+        stats, logger = Stats(), Logger()
+        run = pipeline.bind(logname='nginx', statsd=stats, logger=logger)
+        run([{'url': '/a?id=%d' % (i % 3)} for i in xrange(10)])
+        for tick in run.ticks:
+            tick(LATER)
+        # values are logged, metrics are named by rank
+        self.assertEqual(stats.sent, [('top.url.1', 4), ('top.url.2', 3)])
+        self.assertEqual(logger.messages[0][:26],
+                         'nginx: top url: 1. /a?id=0')
+
+    def test_columns_timings_per_bind(self):
+        pipeline = Pipeline([parser(access_log.send_columns,
+                                    percentiles=(50,), use_numpy=False)])
+        first, second = Stats(), Stats()
+        run = pipeline.bind(statsd=first)
+        pipeline.bind(statsd=second)([LINE.replace('0.500', '9.000')] * 10)
+        run([LINE])
+        for tick in run.ticks:
+            tick(LATER)
+        # request times of the other bound source aren't counted
+        gauges = [(metric, round(value, 1)) for metric, value in first.sent
+                  if metric.startswith('request_time')]
+        self.assertEqual(gauges, [('request_time.p50', 0.5)])
+
+    def test_shard(self):
+        pipeline = Pipeline([dict(parser(base.window, agg='count'), line=1,
+                                  cmd_name='base.window')])
+        stats = Stats()
+        run = pipeline.bind(statsd=stats)
+        shard = pipeline.bind(statsd=Stats(), shard=True)
+        # shard doesn't tick window, reader merges its counts
+        self.assertEqual(len(run.ticks), 1)
+        self.assertEqual(shard.ticks, [])
+        self.assertEqual(sorted(shard.shared), ['line1_base_window'])
+        shard([{}, {}])
+        window = shard.shared['line1_base_window']
+        run.shared['line1_base_window'].merge(window.take())
+        for now in (0, 10):
+            for tick in run.ticks:
+                tick(now)
+        self.assertEqual(stats.sent, [('count', 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
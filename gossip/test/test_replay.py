@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of whole log files replay.
+"""
+import os
+import bz2
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from gossip.replay import read_lines, split_by_time
+
+
+# 2013-06-01 08:00:00 UTC
+TIME = 1370073600
+
+
+def gzipped(data):
+    """
+    Compress data into one gzip stream.
+    """
+    fd, path = tempfile.mkstemp(prefix='gossip-test-')
+    os.close(fd)
+    f = gzip.open(path, 'wb')
+    f.write(data)
+    f.close()
+    with open(path, 'rb') as f:
+        data = f.read()
+    os.remove(path)
+    return data
+
+
+class ReadLinesTest(unittest.TestCase):
+    """
+    Test 'gossip.replay.read_lines'.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='gossip-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        """
+        Write test file, get its path.
+        """
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def read(self, path, block_size):
+        """
+        Read all lines of file.
+        """
+        lines = []
+        for batch in read_lines(path, block_size):
+            lines.extend(batch)
+        return lines
+
+    def test_plain(self):
+        path = self.write('access.log', 'line 1\nline 2\nline 3')
+        # lines are split by blocks, the last one has no newline
+        self.assertEqual(self.read(path, 4), ['line 1', 'line 2', 'line 3'])
+
+    def test_gzip_streams(self):
+        # 'cat a.gz b.gz > access.log.gz'
+        path = self.write('access.log.gz', gzipped('line 1\nline 2\n') +
+                          gzipped('line 3\n'))
+        self.assertEqual(self.read(path, 10), ['line 1', 'line 2', 'line 3'])
+        self.assertEqual(self.read(path, 1 << 20),
+                         ['line 1', 'line 2', 'line 3'])
+
+    def test_bz2_streams(self):
+        first = bz2.compress('line 1\nline 2\n')
+        path = self.write('access.log.bz2', first + bz2.compress('line 3\n'))
+        # the first stream ends exactly at the end of block
+        self.assertEqual(self.read(path, len(first)),
+                         ['line 1', 'line 2', 'line 3'])
+        self.assertEqual(self.read(path, 1 << 20),
+                         ['line 1', 'line 2', 'line 3'])
+
+
+class SplitByTimeTest(unittest.TestCase):
+    """
+    Test 'gossip.replay.split_by_time'.
+    """
+    def test_split(self):
+        lines = [
+            '2013-06-01T12:00:00+04:00 a',
+            '2013-06-01T12:00:00+04:00 b',
+            'no time',
+            '1.2.3.4 - - [01/Jun/2013:12:00:01 +0400] "GET / HTTP/1.1"',
+            '2013-06-01T08:00:00Z c',
+        ]
+        self.assertEqual(list(split_by_time(lines, 0)), [
+            (TIME, lines[:3]),
+            (TIME + 1, lines[3:4]),
+            (TIME, lines[4:]),
+        ])
+
+    def test_no_time(self):
+        # lines without time get time of previous batch
+        self.assertEqual(list(split_by_time(['a', 'b'], 100)),
+                         [(100, ['a', 'b'])])
+        self.assertEqual(list(split_by_time([], 100)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of lines sampling.
+"""
+import random
+import unittest
+
+from gossip.sampling import Sampler
+
+
+class SamplerTest(unittest.TestCase):
+    """
+    Test 'gossip.sampling.Sampler'.
+    """
+    def test_invalid(self):
+        self.assertRaises(ValueError, Sampler, method='first')
+        self.assertRaises(ValueError, Sampler, n=0)
+        self.assertRaises(ValueError, Sampler, n=10, max_n=5)
+
+    def test_n_one(self):
+        items = ['a', 'b']
+        sampler = Sampler(n=1)
+        self.assertIs(sampler.choose(items), items)
+        self.assertEqual(sampler.rate, 1.0)
+
+    def test_random(self):
+        random.seed(1)
+        sampler = Sampler(n=10)
+        chosen = sampler.choose(range(100000))
+        self.assertAlmostEqual(len(chosen) / 100000.0, sampler.rate,
+                               delta=0.005)
+        self.assertEqual(sampler.seen, 100000)
+
+    def test_hash(self):
+        sampler = Sampler(n=4, method='hash')
+        items = ['line %d' % i for i in xrange(10000)]
+        chosen = sampler.choose(items)
+        # the same lines are chosen every time
+        self.assertEqual(chosen, sampler.choose(items))
+        self.assertAlmostEqual(len(chosen) / 10000.0, 0.25, delta=0.02)
+
+    def test_hash_keys(self):
+        sampler = Sampler(n=4, method='hash')
+        keys = ['user%d' % (i % 50) for i in xrange(1000)]
+        chosen = sampler.choose(range(1000), keys)
+        chosen_keys = set(keys[i] for i in chosen)
+        # all items of chosen key are chosen
+        self.assertEqual(len(chosen), 20 * len(chosen_keys))
+
+    def test_adapt(self):
+        sampler = Sampler(n=1, target=100, interval=10.0, max_n=50)
+        self.assertFalse(sampler.adapt(0))
+        sampler.choose(range(5000))
+        self.assertFalse(sampler.adapt(5))
+        # 5000 items in 10 seconds: 500 per second, target is 100
+        self.assertTrue(sampler.adapt(10))
+        self.assertEqual(sampler.n, 5)
+        self.assertEqual(sampler.seen, 0)
+
+        sampler.choose(range(100000))
+        self.assertTrue(sampler.adapt(20))
+        self.assertEqual(sampler.n, 50)
+
+        self.assertTrue(sampler.adapt(30))
+        self.assertEqual(sampler.n, 1)
+        self.assertFalse(sampler.adapt(40))
+
+    def test_adapt_without_target(self):
+        sampler = Sampler(n=10)
+        sampler.choose(range(1000))
+        self.assertFalse(sampler.adapt(100))
+        self.assertEqual(sampler.n, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of stats sender queue and thread.
+"""
+import socket
+import unittest
+
+from gossip.sender import SendQueue, SenderThread
+from gossip.stats import StaticticGraphite
+
+
+class BrokenSocket(object):
+    """
+    Socket, which writes no more than 'size' bytes per call and breaks
+    after 'calls' calls.
+    """
+    def __init__(self, size, calls):
+        self.size = size
+        self.calls = calls
+        self.data = ''
+
+    def send(self, data):
+        if not self.calls:
+            raise socket.error('connection reset')
+        self.calls -= 1
+        data = str(data)[:self.size]
+        self.data += data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class SendQueueTest(unittest.TestCase):
+    """
+    Test 'gossip.sender.SendQueue'.
+    """
+    def test_invalid(self):
+        self.assertRaises(ValueError, SendQueue, policy='all')
+
+    def test_oldest(self):
+        queue = SendQueue(maxsize=2, policy='oldest')
+        for item in 'abc':
+            queue.put(item)
+        self.assertEqual(queue.get(10), ['b', 'c'])
+        self.assertEqual(queue.dropped, 1)
+
+    def test_newest(self):
+        queue = SendQueue(maxsize=2, policy='newest')
+        for item in 'abc':
+            queue.put(item)
+        self.assertEqual(queue.get(10), ['a', 'b'])
+
+    def test_sample(self):
+        queue = SendQueue(maxsize=10, policy='sample', sample_rate=5)
+        for i in xrange(30):
+            queue.put(i)
+        # first half is queued, then every 5th
+        self.assertEqual(queue.get(100), range(5) + range(9, 30, 5))
+
+    def test_join(self):
+        queue = SendQueue()
+        queue.put('a')
+        queue.put('b')
+        batch = queue.get(2)
+        # taken, but not sent yet
+        self.assertFalse(queue.join(0.01))
+        queue.done(1)
+        queue.put_back(batch[1:])
+        self.assertFalse(queue.join(0.01))
+        self.assertEqual(queue.get(2), ['b'])
+        queue.done(1)
+        self.assertTrue(queue.join(0.01))
+
+    def test_put_back_overflow(self):
+        queue = SendQueue(maxsize=3, policy='oldest')
+        for item in 'abc':
+            queue.put(item)
+        batch = queue.get(2)
+        queue.put('d')
+        queue.put_back(batch)
+        # oldest item of batch doesn't fit
+        self.assertEqual(queue.get(10), ['b', 'c', 'd'])
+        self.assertEqual(queue.dropped, 1)
+
+
+class SenderThreadTest(unittest.TestCase):
+    """
+    Test 'gossip.sender.SenderThread'.
+    """
+    def test_partial(self):
+        queue = SendQueue()
+        sent = []
+
+        def send(batch):
+            # only first item is sent every time
+            sent.append(batch[0])
+            return 1
+
+        for item in 'abc':
+            queue.put(item)
+        thread = SenderThread(queue, send, flush_interval=0.01,
+                              retry_interval=0)
+        thread.start()
+        self.assertTrue(queue.join(5.0))
+        thread.stop()
+        self.assertEqual(sent, ['a', 'b', 'c'])
+        self.assertFalse(thread.is_alive())
+
+
+class GraphiteSendTest(unittest.TestCase):
+    """
+    Test 'gossip.stats.StaticticGraphite' sending.
+    """
+    batch = [('a', 1, 1000), ('b', 2, 1000), ('c', 3, 1000)]
+
+    def test_partial_plaintext(self):
+        sender = StaticticGraphite(None, '127.0.0.1', 1)
+        sender.sock = BrokenSocket(size=9, calls=2)
+        sock = sender.sock
+        # 'a 1 1000\nb 2 1000\n' is written, then connection breaks
+        self.assertEqual(sender.send_batch(self.batch), 2)
+        self.assertEqual(sock.data, 'a 1 1000\nb 2 1000\n')
+        self.assertIsNone(sender.sock)
+
+    def test_partial_pickle(self):
+        sender = StaticticGraphite(None, '127.0.0.1', 1, protocol='pickle')
+        sender.sock = BrokenSocket(size=8, calls=2)
+        # incomplete pickle is dropped by carbon, send all again
+        self.assertEqual(sender.send_batch(self.batch), 0)
+
+    def test_buffer_keeps_unsent(self):
+        sender = StaticticGraphite(None, '127.0.0.1', 1, batch_size=10,
+                                   reconnect_interval=60)
+        sender.sock = BrokenSocket(size=9, calls=1)
+        sender.connect_time = float('inf')
+        for metric, value, timestamp in self.batch:
+            sender.send(metric, value, timestamp=timestamp)
+        sender.flush()
+        self.assertEqual(list(sender.buffer), self.batch[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of quantile sketches.
+"""
+import random
+import pickle
+import unittest
+
+from gossip.sketch import Sketch
+
+
+def exact_quantile(values, q):
+    """
+    Get quantile of sorted values with the same rank as sketch.
+    """
+    return values[int(q * (len(values) - 1))]
+
+
+class SketchTest(unittest.TestCase):
+    """
+    Test 'gossip.sketch.Sketch'.
+    """
+    quantiles = (0.01, 0.1, 0.5, 0.9, 0.95, 0.99, 0.999, 1.0)
+
+    def assert_accuracy(self, sketch, values):
+        """
+        Check all quantiles are within sketch relative accuracy.
+        """
+        values = sorted(values)
+        for q in self.quantiles:
+            expected = exact_quantile(values, q)
+            estimate = sketch.quantile(q)
+            error = abs(estimate - expected) / expected
+            self.assertTrue(
+                error <= sketch.accuracy + 1e-9,
+                'q=%s: %s instead of %s, error %.4f' % (
+                    q, estimate, expected, error))
+
+    def test_empty(self):
+        self.assertIsNone(Sketch().quantile(0.5))
+
+    def test_relative_error(self):
+        rand = random.Random(1)
+        for accuracy in (0.01, 0.05):
+            sketch = Sketch(accuracy)
+            # long tail: values from microseconds to minutes
+            values = [rand.lognormvariate(-3, 2) for _ in xrange(20000)]
+            for value in values:
+                sketch.add(value)
+            self.assertEqual(sketch.count, len(values))
+            self.assert_accuracy(sketch, values)
+
+    def test_weighted_add(self):
+        sketch = Sketch()
+        sketch.add(0.1, 90)
+        sketch.add(5.0, 10)
+        self.assertEqual(sketch.count, 100)
+        self.assertAlmostEqual(sketch.sum, 59.0)
+        self.assertAlmostEqual(sketch.quantile(0.5), 0.1, delta=0.001)
+        self.assertAlmostEqual(sketch.quantile(0.95), 5.0, delta=0.05)
+
+    def test_zeros(self):
+        sketch = Sketch()
+        for value in (0, 0, 0, 1.0):
+            sketch.add(value)
+        self.assertEqual(sketch.quantile(0.5), 0.0)
+        self.assertAlmostEqual(sketch.quantile(1.0), 1.0, delta=0.01)
+        self.assertEqual(sketch.size(), 2)
+
+    def test_merge(self):
+        rand = random.Random(2)
+        values = [rand.expovariate(10) for _ in xrange(10000)]
+        merged, parts = Sketch(), [Sketch() for _ in xrange(4)]
+        for i, value in enumerate(values):
+            parts[i % 4].add(value)
+        for part in parts:
+            merged.merge(part)
+
+        whole = Sketch()
+        for value in values:
+            whole.add(value)
+        self.assertEqual(merged.count, whole.count)
+        self.assertEqual(merged.zeros, whole.zeros)
+        self.assertEqual(merged.buckets, whole.buckets)
+        self.assertAlmostEqual(merged.sum, whole.sum)
+        self.assert_accuracy(merged, values)
+
+    def test_merge_accuracy_mismatch(self):
+        self.assertRaises(ValueError, Sketch(0.01).merge, Sketch(0.02))
+
+    def test_collapse(self):
+        sketch = Sketch(max_buckets=10)
+        values = [1.5 ** i for i in xrange(100)]
+        for value in values:
+            sketch.add(value)
+        self.assertEqual(len(sketch.buckets), 10)
+        self.assertEqual(sketch.count, 100)
+        # only lowest quantiles lose accuracy
+        self.assertAlmostEqual(sketch.quantile(1.0) / values[-1], 1.0,
+                               delta=sketch.accuracy)
+        self.assertAlmostEqual(sketch.quantile(0.95) / values[94], 1.0,
+                               delta=sketch.accuracy)
+
+    def test_clear(self):
+        sketch = Sketch()
+        sketch.add(1.0)
+        sketch.clear()
+        self.assertEqual((sketch.count, sketch.sum, sketch.size()), (0, 0, 0))
+        self.assertIsNone(sketch.quantile(0.5))
+
+    def test_pickle(self):
+        sketch = Sketch(0.02)
+        for value in (0.1, 0.2, 0.3):
+            sketch.add(value)
+        copy = pickle.loads(pickle.dumps(sketch, 2))
+        self.assertEqual(copy.buckets, sketch.buckets)
+        self.assertEqual(copy.quantile(0.5), sketch.quantile(0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of stats senders.
+"""
+import unittest
+
+from gossip.stats import StaticticGraphite
+
+
+def graphite(**kwargs):
+    """
+    Get graphite sender, which never sends by itself.
+    """
+    kwargs.setdefault('batch_size', 1000)
+    return StaticticGraphite(None, '127.0.0.1', 1, **kwargs)
+
+
+class GraphiteBucketsTest(unittest.TestCase):
+    """
+    Test 'gossip.stats.StaticticGraphite' buckets.
+    """
+    def test_watermark(self):
+        sender = graphite(bucket=10, bucket_delay=5)
+        sender.incr('a', 1, timestamp=1000)
+        sender.incr('a', 2, timestamp=1009)
+        sender.incr('a', 4, timestamp=1010)
+        sender.close_buckets()
+        self.assertEqual(list(sender.buffer), [])
+        # bucket 1000 closes when watermark is 'bucket_delay' past its end
+        sender.incr('a', 8, timestamp=1015)
+        sender.close_buckets()
+        self.assertEqual(list(sender.buffer), [('a', 3, 1000)])
+
+    def test_late_values(self):
+        sender = graphite(bucket=10, bucket_delay=0)
+        sender.incr('a', 10, timestamp=1000)
+        sender.incr('b', 1, timestamp=1010)
+        sender.close_buckets()
+        # late value is added to sum of sent bucket
+        sender.incr('a', 1, timestamp=1005)
+        sender.close_buckets(all_buckets=True)
+        self.assertEqual(sorted(sender.buffer), [
+            ('a', 10, 1000), ('a', 11, 1000), ('b', 1, 1010)])
+
+    def test_keep(self):
+        sender = graphite(bucket=10, bucket_delay=0, bucket_keep=20)
+        sender.send('a', 1, timestamp=1000)
+        sender.send('a', 1, timestamp=1030)
+        sender.close_buckets()
+        self.assertNotIn(1000, sender.closed)
+
+    def test_gauges(self):
+        sender = graphite(bucket=10, bucket_delay=0)
+        for value in (100, 120, 110):
+            sender.send('g', value, timestamp=1000)
+        sender.incr('c', 1, timestamp=1000)
+        sender.incr('c', 1, timestamp=1005)
+        sender.send('g', 5, timestamp=1010)
+        sender.close_buckets()
+        # gauge keeps the last value, counter is summed
+        self.assertEqual(sorted(sender.buffer), [('c', 2, 1000),
+                                                 ('g', 110, 1000)])
+        # late gauge replaces sent value, it isn't added to it
+        sender.send('g', 90, timestamp=1001)
+        sender.close_buckets()
+        self.assertEqual(list(sender.buffer)[-1], ('g', 90, 1000))
+
+    def test_idle(self):
+        sender = graphite(bucket=10)
+        sender.send('a', 1, timestamp=1000)
+        sender.tick()
+        self.assertEqual(list(sender.buffer), [])
+        # no metrics for 'bucket' + 'bucket_delay' seconds of wall clock
+        sender.add_time -= 20
+        sender.tick()
+        self.assertEqual(list(sender.buffer), [('a', 1, 1000)])
+
+    def test_counters(self):
+        sender = graphite()
+        for _ in xrange(3):
+            sender.incr('hits', timestamp=1000.5)
+        sender.incr('hits', 2, timestamp=1001)
+        sender.send('gauge', 5, timestamp=1000)
+        sender.close_buckets(all_buckets=True)
+        # counters are summed by seconds without 'bucket'
+        self.assertEqual(sorted(sender.buffer), [
+            ('gauge', 5, 1000), ('hits', 2, 1001), ('hits', 3, 1000)])
+
+    def test_take_merge(self):
+        shard = graphite(bucket=10, aggregate=True)
+        shard.incr('a', 1, timestamp=1000)
+        shard.send('g', 7, timestamp=1000)
+        sender = graphite(bucket=10, bucket_delay=0)
+        sender.incr('a', 2, timestamp=1001)
+        sender.send('g', 5, timestamp=1001)
+        sender.merge(shard.take())
+        self.assertEqual(shard.buckets, {})
+        sender.close_buckets(all_buckets=True)
+        self.assertEqual(sorted(sender.buffer), [('a', 3, 1000),
+                                                 ('g', 7, 1000)])
+
+
+if __name__ == '__main__':
+    unittest.main()
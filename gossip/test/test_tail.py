@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of tailed files and file watchers.
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from gossip.tail import (WatcherError, FileSource, PollWatcher,
+                         InotifyWatcher, get_watcher)
+
+
+def read_all(source):
+    """
+    Read lines of source till the end of file.
+    """
+    result = []
+    while True:
+        lines = source.read_lines()
+        if lines is None:
+            return result
+        result.extend(lines)
+
+
+class FileSourceTest(unittest.TestCase):
+    """
+    Test 'gossip.tail.FileSource'.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='gossip-test-')
+        self.path = os.path.join(self.dir, 'access.log')
+        self.write('', 'w')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data, mode='a'):
+        """
+        Write data to test log file.
+        """
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def test_partial_line(self):
+        source = FileSource(self.path, block_size=8)
+        source.open(0)
+        self.write('first line\nsecond')
+        # line is split by blocks, partial line waits for its end
+        self.assertEqual(read_all(source), ['first line'])
+        self.assertEqual(source.position(), (source.inode, 11))
+        self.write(' line\n')
+        self.assertEqual(read_all(source), ['second line'])
+        self.assertEqual(source.position(), (source.inode, 23))
+        source.close()
+
+    def test_open_at_end(self):
+        self.write('old\n')
+        source = FileSource(self.path)
+        source.open()
+        self.write('new\n')
+        self.assertEqual(read_all(source), ['new'])
+        source.close()
+
+    def test_rename(self):
+        source = FileSource(self.path, rotate_timeout=0)
+        source.open(0)
+        self.write('old 1\nold 2')
+        self.assertEqual(read_all(source), ['old 1'])
+        os.rename(self.path, self.path + '.1')
+        self.write('new 1\n', 'w')
+        # rotated file is drained, its last line has no newline
+        self.assertEqual(read_all(source), ['old 2', 'new 1'])
+        self.assertIsNone(source.rotated)
+        self.assertEqual(source.inode[1], os.stat(self.path).st_ino)
+        source.close()
+
+    def test_rename_drain(self):
+        source = FileSource(self.path, rotate_timeout=60)
+        source.open(0)
+        os.rename(self.path, self.path + '.1')
+        self.write('new 1\n', 'w')
+        self.assertEqual(read_all(source), ['new 1'])
+        # lines written to rotated file after rename are read too
+        with open(self.path + '.1', 'a') as f:
+            f.write('old 1\n')
+        self.assertEqual(read_all(source), ['old 1'])
+        self.assertIsNotNone(source.rotated)
+        source.close()
+
+    def test_truncate(self):
+        source = FileSource(self.path)
+        source.open(0)
+        self.write('line 1\nline 2\n')
+        self.assertEqual(read_all(source), ['line 1', 'line 2'])
+        # copytruncate: file is truncated and written from the beginning
+        self.write('line 3\n', 'w')
+        self.assertEqual(read_all(source), ['line 3'])
+        self.assertEqual(source.offset, 7)
+        source.close()
+
+    def test_inode_change(self):
+        source = FileSource(self.path)
+        source.open(0)
+        inode = source.inode
+        self.write('line 1\n')
+        os.remove(self.path)
+        self.assertEqual(read_all(source), ['line 1'])
+        # new file is created after removal
+        self.write('line 2\n', 'w')
+        self.assertEqual(read_all(source), ['line 2'])
+        self.assertNotEqual(source.inode, inode)
+        source.close()
+
+
+class InotifyWatcherTest(unittest.TestCase):
+    """
+    Test 'gossip.tail.InotifyWatcher'.
+    """
+    def setUp(self):
+        try:
+            InotifyWatcher().close()
+        except WatcherError:
+            self.skipTest('inotify is not supported')
+        self.dir = tempfile.mkdtemp(prefix='gossip-test-')
+        self.path = os.path.join(self.dir, 'access.log')
+        open(self.path, 'w').close()
+        # inotify can't watch missing file
+        self.missing = os.path.join(self.dir, 'missing.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_changes(self):
+        watcher = InotifyWatcher()
+        watcher.add(self.path)
+        self.assertEqual(watcher.wait(0.01), set())
+        with open(self.path, 'a') as f:
+            f.write('line\n')
+        self.assertEqual(watcher.wait(1.0), set([self.path]))
+        watcher.close()
+
+    def test_error(self):
+        watcher = InotifyWatcher()
+        self.assertRaises(WatcherError, watcher.add, self.missing)
+        watcher.close()
+
+    def test_fallback(self):
+        watcher = InotifyWatcher(interval=0.05, fallback=True)
+        watcher.add(self.path)
+        watcher.add(self.missing)
+        watcher.add_dir(self.missing)
+        self.assertEqual(watcher.polled, set([self.missing]))
+
+        # polled file is checked every 'interval' seconds
+        started = time.time()
+        self.assertEqual(watcher.wait(10.0), set())
+        self.assertTrue(time.time() - started < 1.0)
+        with open(self.path, 'a') as f:
+            f.write('line\n')
+        self.assertEqual(watcher.wait(1.0), set([self.path, self.missing]))
+
+        watcher.remove(self.missing)
+        self.assertEqual(watcher.polled, set())
+        watcher.close()
+
+    def test_auto(self):
+        watcher = get_watcher('auto', interval=0.05)
+        self.assertEqual(watcher.name, 'inotify')
+        watcher.add(self.missing)
+        self.assertEqual(watcher.polled, set([self.missing]))
+        watcher.close()
+
+
+class GetWatcherTest(unittest.TestCase):
+    """
+    Test 'gossip.tail.get_watcher'.
+    """
+    def test_poll(self):
+        watcher = get_watcher('poll', interval=0.5)
+        self.assertIsInstance(watcher, PollWatcher)
+        self.assertEqual(watcher.interval, 0.5)
+
+    def test_unknown(self):
+        self.assertRaises(WatcherError, get_watcher, 'kqueue')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of log lines timestamps parsing.
+"""
+import unittest
+
+from gossip import timestamp
+from gossip.timestamp import parse_offset, parse_time_uncached, parse_time
+
+
+# 2013-06-01 08:00:00 UTC
+TIME = 1370073600
+
+
+class ParseTimeTest(unittest.TestCase):
+    """
+    Test 'gossip.timestamp' functions.
+    """
+    def setUp(self):
+        timestamp.CACHE.clear()
+
+    def test_offset(self):
+        self.assertEqual(parse_offset('Z'), 0)
+        self.assertEqual(parse_offset(''), 0)
+        self.assertEqual(parse_offset('+04:00'), 4 * 3600)
+        self.assertEqual(parse_offset('-0330'), -(3 * 3600 + 30 * 60))
+
+    def test_iso8601(self):
+        self.assertEqual(parse_time_uncached('2013-06-01T12:00:00+04:00'),
+                         TIME)
+        self.assertEqual(parse_time_uncached('2013-06-01T08:00:00Z'), TIME)
+        self.assertEqual(parse_time_uncached('2013-06-01T05:00:00-03:00'),
+                         TIME)
+
+    def test_local(self):
+        self.assertEqual(parse_time_uncached('01/Jun/2013:12:00:00 +0400'),
+                         TIME)
+        self.assertEqual(parse_time_uncached('31/May/2013:23:00:00 -0900'),
+                         TIME)
+
+    def test_unknown(self):
+        for value in ('', 'garbage', '01/Foo/2013:12:00:00 +0400',
+                      '2013-06-01'):
+            self.assertRaises(ValueError, parse_time_uncached, value)
+            self.assertIsNone(parse_time(value))
+
+    def test_cache(self):
+        value = '2013-06-01T12:00:00+04:00'
+        self.assertEqual(parse_time(value), TIME)
+        self.assertEqual(timestamp.CACHE, {value: TIME})
+        self.assertEqual(parse_time(value), TIME)
+
+    def test_cache_limit(self):
+        for i in xrange(timestamp.MAX_CACHE + 1):
+            parse_time('2013-06-01T%02d:%02d:%02dZ' % (
+                i // 3600, i // 60 % 60, i % 60))
+        self.assertEqual(len(timestamp.CACHE), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
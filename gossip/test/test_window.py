@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of time windows.
+"""
+import unittest
+
+from gossip.window import Window
+
+
+def totals(window):
+    """
+    Get window totals as dict: {key: (count, sum, hits)}.
+    """
+    return dict((key, (count, value, hits))
+                for key, count, value, hits in window.totals())
+
+
+class WindowTest(unittest.TestCase):
+    """
+    Test 'gossip.window.Window'.
+    """
+    def test_invalid(self):
+        self.assertRaises(ValueError, Window, size=0)
+        self.assertRaises(ValueError, Window, slots=0)
+
+    def test_tumbling(self):
+        window = Window(size=10, now=0)
+        window.add('a', 1.5, 1)
+        window.add('a', 0.5)
+        window.add('b', 2.0, count=10)
+        self.assertFalse(window.advance(9.9))
+        self.assertTrue(window.advance(10))
+        self.assertEqual(totals(window),
+                         {'a': (2, 2.0, 1), 'b': (10, 2.0, 0)})
+        self.assertEqual(window.duration(), 10)
+
+    def test_starts_on_first_advance(self):
+        window = Window(size=10)
+        self.assertFalse(window.advance(100))
+        window.add('a')
+        self.assertFalse(window.advance(105))
+        self.assertTrue(window.advance(110))
+        self.assertEqual(totals(window), {'a': (1, 0, 0)})
+
+    def test_sliding(self):
+        window = Window(size=30, slots=3, now=0)
+        for now in (0, 10, 20):
+            window.advance(now)
+            window.add('a', now)
+        window.advance(30)
+        self.assertEqual(totals(window), {'a': (3, 30, 0)})
+        window.add('a', 30)
+        window.advance(40)
+        # slot of 0..10 left window
+        self.assertEqual(totals(window), {'a': (3, 60, 0)})
+        self.assertEqual(window.duration(), 30)
+
+    def test_duration_on_start(self):
+        window = Window(size=30, slots=3, now=0)
+        window.advance(10)
+        self.assertEqual(window.duration(), 10)
+        window.advance(25)
+        self.assertEqual(window.duration(), 20)
+
+    def test_expired_reported_once(self):
+        window = Window(size=10, now=0)
+        window.add('a')
+        window.add('b')
+        window.advance(10)
+        window.add('b')
+        window.advance(20)
+        self.assertEqual(totals(window), {'a': (0, 0, 0), 'b': (1, 0, 0)})
+        self.assertNotIn('a', window.keys)
+        window.advance(30)
+        self.assertEqual(totals(window), {'b': (0, 0, 0)})
+        window.advance(40)
+        self.assertEqual(totals(window), {})
+
+    def test_expired_after_gap(self):
+        window = Window(size=30, slots=3, now=0)
+        window.add('a')
+        window.add('b')
+        # whole window passed since last move
+        window.advance(100)
+        self.assertEqual(totals(window), {'a': (0, 0, 0), 'b': (0, 0, 0)})
+        window.add('a')
+        window.advance(110)
+        self.assertEqual(totals(window), {'a': (1, 0, 0)})
+
+    def test_max_keys(self):
+        window = Window(size=10, max_keys=2, now=0)
+        for key in ('a', 'b', 'c', 'd', 'a'):
+            window.add(key)
+        window.advance(10)
+        self.assertEqual(totals(window), {'a': (2, 0, 0), 'b': (1, 0, 0),
+                                          'other': (2, 0, 0)})
+        self.assertEqual(window.folded, 2)
+
+    def test_take_merge(self):
+        shards = [Window(size=10), Window(size=10)]
+        shards[0].add('a', 5, 1)
+        shards[1].add('a', 3)
+        shards[1].add('b', 2)
+        window = Window(size=10, now=0)
+        for shard in shards:
+            for key, count, total, hits in shard.take():
+                window.add(key, total, hits, count)
+            self.assertEqual(shard.keys, {})
+        window.advance(10)
+        # counts of shards are summed, not overwritten
+        self.assertEqual(totals(window), {'a': (2, 8, 1), 'b': (1, 2, 0)})
+
+
+if __name__ == '__main__':
+    unittest.main()
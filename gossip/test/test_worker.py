@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of worker.
+"""
+import os
+import Queue
+import shutil
+import tempfile
+import unittest
+
+from gossip.config import Config
+from gossip.tail import PollWatcher
+from gossip.worker import FileGlob, ShardPool, Worker, glob_name_re
+
+
+SOURCE = """file %s as %s
+    nginx.access_log.parse
+        nginx.access_log.send_to_statsd(prefix='%s')
+
+"""
+
+LINE = ('2013-06-01T12:00:00+04:00 10.0.0.1 512 0.500 1024 900 200 '
+        'GET /page/1.js HTTP/1.1')
+
+GLOB_SOURCE = """glob %s as nginx
+    nginx.access_log.parse
+        nginx.access_log.send_top(fields='base_url')
+"""
+
+
+class GlobNameTest(unittest.TestCase):
+    """
+    Test 'gossip.worker.glob_name_re'.
+    """
+    def test_wildcards(self):
+        name_re = glob_name_re('/var/log/*/access.?.log')
+        self.assertEqual(name_re.match('/var/log/site/access.1.log').groups(),
+                         ('site', '1'))
+        # '*' doesn't match '/'
+        self.assertIsNone(name_re.match('/var/log/a/b/access.1.log'))
+        self.assertIsNone(name_re.match('/var/log/site/access.1.log.gz'))
+
+    def test_chars(self):
+        name_re = glob_name_re('/logs/[ab]-[!0-9].log')
+        self.assertEqual(name_re.match('/logs/a-x.log').groups(), ('a', 'x'))
+        self.assertIsNone(name_re.match('/logs/c-x.log'))
+        self.assertIsNone(name_re.match('/logs/a-1.log'))
+        # not closed bracket is literal
+        name_re = glob_name_re('/logs/[a.log')
+        self.assertIsNotNone(name_re.match('/logs/[a.log'))
+
+
+class FileGlobTest(unittest.TestCase):
+    """
+    Test 'gossip.worker.FileGlob'.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='gossip-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def source(self, pattern, type='glob'):
+        """
+        Get glob source for pattern in test directory.
+        """
+        return FileGlob({'name': 'nginx', 'type': type, 'parsers': [],
+                         'path': os.path.join(self.dir, pattern)})
+
+    def test_tag(self):
+        source = self.source('*.gossip.log')
+        path = os.path.join(self.dir, 'example.com.gossip.log')
+        self.assertEqual(source.tag(path), 'example_com')
+        parser = source.file_parser(path)
+        self.assertEqual((parser['type'], parser['name'], parser['tag'],
+                          parser['glob']),
+                         ('file', 'nginx.example_com', 'example_com', 'nginx'))
+        # pattern without wildcards
+        source = self.source('access.log')
+        self.assertEqual(source.tag(os.path.join(self.dir, 'access.log')),
+                         'access_log')
+
+    def test_dir(self):
+        source = self.source('', type='dir')
+        self.assertEqual(source.pattern, os.path.join(self.dir, '*.log'))
+        self.assertEqual(source.dirs(), [self.dir])
+        for name in ('a.log', 'b.log', 'c.txt'):
+            open(os.path.join(self.dir, name), 'w').close()
+        os.mkdir(os.path.join(self.dir, 'd.log'))
+        self.assertEqual(source.scan(), set(
+            os.path.join(self.dir, name) for name in ('a.log', 'b.log')))
+
+    def test_scan(self):
+        config = os.path.join(self.dir, 'gossip.conf')
+        with open(config, 'w') as f:
+            f.write(GLOB_SOURCE % os.path.join(self.dir, '*.log'))
+        worker = Worker(Config(config).config, tail={'rotate_timeout': 0})
+        watcher = PollWatcher()
+        tails = worker.open_tails(watcher)
+        source = worker.globs['nginx']
+        ready = set()
+        path = os.path.join(self.dir, 'a.log')
+
+        # new file is tailed from the beginning
+        with open(path, 'w') as f:
+            f.write(LINE + '\n')
+        worker.scan_glob(source, watcher, tails, ready)
+        self.assertEqual(ready, set([path]))
+        self.assertEqual(tails[path].name, 'nginx.a')
+        self.assertEqual(tails[path].source.offset, 0)
+        self.assertEqual(len(worker.ticks), 1)
+
+        # removed file is closed after 'rotate_timeout'
+        os.remove(path)
+        worker.scan_glob(source, watcher, tails, ready)
+        self.assertEqual(tails, {})
+        self.assertEqual(ready, set())
+        self.assertEqual(source.paths, set())
+        self.assertEqual(watcher.paths, set())
+        self.assertEqual(worker.ticks, [])
+
+
+class Merged(object):
+    """
+    Stats sender or shared parser, which saves merged stats.
+    """
+    def __init__(self):
+        self.merged = []
+
+    def merge(self, *stats):
+        self.merged.append(stats)
+
+
+class ShardPoolTest(unittest.TestCase):
+    """
+    Test 'gossip.worker.ShardPool' results of shards.
+    """
+    def setUp(self):
+        self.positions = []
+        self.window = Merged()
+        self.pool = ShardPool({'name': 'nginx'}, 2, {},
+                              processed=self.positions.append,
+                              shared={'line3_base_window': self.window})
+        self.pool.batches.cancel_join_thread()
+        # results of shards without processes
+        self.pool.results = Queue.Queue()
+
+    def test_acks(self):
+        pool = self.pool
+        for offset in (10, 20, 30):
+            pool.put(['line'], ((1, 2), offset))
+        # batch 2 is processed, but batch 1 isn't
+        pool.results.put((None, None, [2], {}))
+        pool.collect(None, None)
+        self.assertEqual(self.positions, [])
+        pool.results.put((None, None, [1], {}))
+        pool.collect(None, None)
+        self.assertEqual(self.positions, [((1, 2), 20)])
+        self.assertEqual(list(pool.pending), [(3, ((1, 2), 30))])
+        self.assertEqual(pool.acked, set())
+
+        pool.results.put((None, None, [3], {}))
+        pool.collect(None, None)
+        self.assertEqual(self.positions[-1], ((1, 2), 30))
+
+    def test_merge(self):
+        statsd, graphite = Merged(), Merged()
+        self.pool.results.put(((1, 2, 3), ([], []), [], {
+            'line3_base_window': [('a', 1, 0, 0)], 'unknown': []}))
+        self.pool.collect(statsd, graphite)
+        self.assertEqual(statsd.merged, [(1, 2, 3)])
+        self.assertEqual(graphite.merged, [(([], []),)])
+        # state of shared parsers is merged by node name
+        self.assertEqual(self.window.merged, [([('a', 1, 0, 0)],)])
+        self.assertEqual(self.positions, [])
+
+
+class WorkerReloadTest(unittest.TestCase):
+    """
+    Test 'gossip.worker.Worker.reload'.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='gossip-test-')
+        self.config = os.path.join(self.dir, 'gossip.conf')
+        for name in 'abcd':
+            open(self.path(name), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        """
+        Get path of test log file.
+        """
+        return os.path.join(self.dir, '%s.log' % name)
+
+    def write(self, *sources):
+        """
+        Write config with file sources: (name, file name, prefix).
+        """
+        with open(self.config, 'w') as f:
+            for name, filename, prefix in sources:
+                f.write(SOURCE % (self.path(filename), name, prefix))
+
+    def test_in_place(self):
+        self.write(('a', 'a', 'one'), ('b', 'b', 'two'), ('c', 'c', 'three'))
+        config = Config(self.config)
+        worker = Worker(config.config, config_file=self.config)
+        watcher = PollWatcher()
+        worker.tails = worker.open_tails(watcher)
+        runs = dict((tail.name, tail.run) for tail in worker.tails.values())
+
+        # 'a' is removed, 'b' has another file, parsers of 'c' are changed
+        self.write(('b', 'd', 'two'), ('c', 'c', 'four'))
+        ready = set()
+        worker.reload(watcher, ready)
+        tails = dict((tail.name, tail) for tail in worker.tails.values())
+        self.assertEqual(sorted(tails), ['b', 'c'])
+        self.assertEqual(tails['b'].path, self.path('d'))
+        self.assertEqual(ready, set([self.path('d')]))
+        self.assertEqual(watcher.paths, set([self.path('c'),
+                                             self.path('d')]))
+        self.assertIsNot(tails['c'].run, runs['c'])
+        self.assertEqual(len(worker.ticks), 0)
+        self.assertEqual([parser['name'] for parser in worker.parsers],
+                         ['b', 'c'])
+
+    def test_unchanged(self):
+        self.write(('a', 'a', 'one'))
+        config = Config(self.config)
+        worker = Worker(config.config, config_file=self.config)
+        watcher = PollWatcher()
+        worker.tails = worker.open_tails(watcher)
+        tail = worker.tails[self.path('a')]
+        run = tail.run
+        worker.reload(watcher, set())
+        # parsers keep their state
+        self.assertIs(worker.tails[self.path('a')], tail)
+        self.assertIs(tail.run, run)
+
+
+if __name__ == '__main__':
+    unittest.main()
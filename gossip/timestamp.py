@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Fast parsing of log lines timestamps.
+
+Log has many lines per second, so timestamps are parsed once per distinct
+string (one second) and cached: parsing is one dict lookup for most lines.
+Supported formats are nginx '$time_iso8601' ('2013-06-01T12:00:00+04:00')
+and '$time_local' ('01/Jun/2013:12:00:00 +0400').
+"""
+import calendar
+
+
+MONTHS = dict(
+    (name, i + 1) for i, name in enumerate((
+        'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')))
+
+# parsed timestamps: {string: unix time}, cleared when it's full
+CACHE = {}
+MAX_CACHE = 4096
+
+
+def parse_offset(offset):
+    """
+    Parse timezone offset ('+04:00', '-0300', 'Z') into seconds.
+    """
+    if not offset or offset == 'Z':
+        return 0
+    sign = -1 if offset[0] == '-' else 1
+    offset = offset[1:].replace(':', '')
+    return sign * (int(offset[:2]) * 3600 + int(offset[2:4]) * 60)
+
+
+def parse_time_uncached(value):
+    """
+    Parse '$time_iso8601' or '$time_local' into unix time.
+
+    Raises ValueError for unknown format.
+    """
+    try:
+        if value[4:5] == '-':
+            date = (int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                    int(value[11:13]), int(value[14:16]), int(value[17:19]))
+            offset = value[19:]
+        else:
+            date = (int(value[7:11]), MONTHS[value[3:6]], int(value[0:2]),
+                    int(value[12:14]), int(value[15:17]), int(value[18:20]))
+            offset = value[21:]
+        return calendar.timegm(date) - parse_offset(offset)
+    except (KeyError, IndexError, ValueError):
+        raise ValueError("unknown time format: '%s'" % value)
+
+
+def parse_time(value):
+    """
+    Parse '$time_iso8601' or '$time_local' into unix time with cache.
+
+    Returns None for unknown format.
+    """
+    timestamp = CACHE.get(value)
+    if timestamp is not None:
+        return timestamp
+
+    try:
+        timestamp = parse_time_uncached(value)
+    except ValueError:
+        return None
+    if len(CACHE) >= MAX_CACHE:
+        CACHE.clear()
+    CACHE[value] = timestamp
+    return timestamp
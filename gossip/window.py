@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Time windows for in-process aggregation.
+
+Window counts items, sum of values and number of 'hits' (e.g. 5xx
+responses) by key in ring buffer of time slots. Every key has running
+totals, so adding item is O(1): slot and totals are incremented. When time
+moves to the next slot, the oldest slot is subtracted from totals and
+reused. Tumbling window has one slot (totals are for the last complete
+window), sliding window has several slots and totals move by one slot.
+Memory is bounded by 'max_keys': items of new keys go to 'other' key when
+window is full. Keys, which have no items in window anymore, are dropped,
+but reported with zero totals once, so senders' gauges go down to zero.
+Window of shard isn't moved: items counted since last 'take' are added to
+window of reader.
+"""
+
+
+class Window(object):
+    """
+    Windowed counters by key in ring buffer of 'slots' slots.
+
+    Ring has one slot more than window: current slot is being filled, and
+    totals of complete slots are read right after slot is moved.
+    """
+    def __init__(self, size=10.0, slots=1, max_keys=1000, now=None):
+        if size <= 0 or slots < 1:
+            raise ValueError("window 'size' and 'slots' must be positive")
+        self.size = float(size)
+        self.slots = slots
+        self.slot_size = self.size / slots
+        self.max_keys = max_keys
+        self.ring = slots + 1
+        # index of current slot and time when it ends (window starts on
+        # first 'advance' if 'now' isn't set)
+        self.current = 0
+        self.slot_end = None if now is None else now + self.slot_size
+        # number of complete slots in window, less than 'slots' on start
+        self.filled = 0
+        # key -> [counts, sums, hits, count, sum, hits]: slots and totals
+        self.keys = {}
+        # items of keys, which didn't fit in window
+        self.folded = 0
+        # keys gone from window on last move
+        self.expired = set()
+
+    def add(self, key, value=0, hit=0, count=1):
+        """
+        Count item of 'key' with 'value' in current slot ('count' items of
+        sampled lines, 'value' and 'hit' are scaled by caller).
+        """
+        state = self.keys.get(key)
+        if state is None:
+            if len(self.keys) >= self.max_keys:
+                self.folded += 1
+                key = 'other'
+                state = self.keys.get(key)
+            if state is None:
+                ring = self.ring
+                state = self.keys[key] = [[0] * ring, [0] * ring, [0] * ring,
+                                          0, 0, 0]
+        i = self.current
+        state[0][i] += count
+        state[1][i] += value
+        state[2][i] += hit
+        state[3] += count
+        state[4] += value
+        state[5] += hit
+
+    def advance(self, now):
+        """
+        Move window to time 'now'.
+
+        Returns True if slot is changed, i.e. totals are for new window.
+        """
+        if self.slot_end is None:
+            self.slot_end = now + self.slot_size
+            return False
+        if now < self.slot_end:
+            return False
+
+        steps = int((now - self.slot_end) / self.slot_size) + 1
+        self.slot_end += steps * self.slot_size
+        self.filled = min(self.filled + steps, self.slots)
+        self.expired = set()
+        if steps >= self.ring:
+            # whole window passed since last move
+            self.expired.update(self.keys)
+            self.keys = {}
+            self.current = (self.current + steps) % self.ring
+            return True
+
+        ring = self.ring
+        for _ in xrange(steps):
+            self.current = i = (self.current + 1) % ring
+            for key, state in self.keys.items():
+                counts, sums, hits = state[0], state[1], state[2]
+                if counts[i]:
+                    state[3] -= counts[i]
+                    state[4] -= sums[i]
+                    state[5] -= hits[i]
+                    counts[i] = sums[i] = hits[i] = 0
+                if not state[3]:
+                    # key is gone from window, free its slot
+                    del self.keys[key]
+                    self.expired.add(key)
+        return True
+
+    def duration(self):
+        """
+        Get length of complete slots in window, seconds.
+        """
+        return self.filled * self.slot_size
+
+    def totals(self):
+        """
+        Get totals of window: [(key, count, sum, hits)], keys gone from
+        window on last move have zero totals.
+        """
+        totals = [(key, state[3], state[4], state[5])
+                  for key, state in self.keys.iteritems()]
+        totals.extend((key, 0, 0, 0) for key in self.expired
+                      if key not in self.keys)
+        return totals
+
+    def take(self):
+        """
+        Get totals of items counted since last call: [(key, count, sum,
+        hits)], and forget them.
+        """
+        totals = [(key, state[3], state[4], state[5])
+                  for key, state in self.keys.iteritems()]
+        self.keys = {}
+        return totals
@@ -3,12 +3,22 @@
 Gossip workers.
 """
 import os
+import re
+import glob
 import time
 import fcntl
+import signal
 import socket
-from multiprocessing import Process
+from Queue import Empty
+from collections import deque
+from multiprocessing import Process, Queue
 
-from gossip.stats import StaticticStatsD, StaticticGraphite
+from gossip.checkpoint import Checkpoint
+from gossip.config import Config, parsers_signature
+from gossip.listen import LISTENERS, get_listener
+from gossip.pipeline import Pipeline
+from gossip.stats import StaticticStatsD, StaticticGraphite, TaggedStats
+from gossip.tail import WatcherError, FileSource, get_watcher
 
 
 class PidFile(object):
@@ -50,9 +60,18 @@ class PidFile(object):
         os.remove(self.path)
 
 
-def worker_setup(setup):
+def terminate(signum, frame):
+    """
+    Signal handler: exit process.
+    """
+    raise SystemExit(0)
+
+
+def worker_setup(setup, aggregate=False):
     """
     Setup workers: parse global settings.
+
+    With 'aggregate' stats senders only aggregate stats in memory.
     """
     # local hostname
     worker_kwargs = {'hostname': socket.gethostname()}
@@ -62,6 +81,7 @@ def worker_setup(setup):
         statsd_kwargs = setup['statsd']
         worker_kwargs['statsd'] = StaticticStatsD(
             hostname=worker_kwargs['hostname'],
+            aggregate=aggregate,
             **statsd_kwargs
         )
 
@@ -70,103 +90,1121 @@ def worker_setup(setup):
         graphite_kwargs = setup['graphite']
         worker_kwargs['graphite'] = StaticticGraphite(
             hostname=worker_kwargs['hostname'],
+            aggregate=aggregate,
             **graphite_kwargs
         )
 
+    # tail engine
+    worker_kwargs['tail'] = setup.get('tail', {})
+    worker_kwargs['listen'] = setup.get('listen', {})
+
+    # read offsets checkpoints
+    if 'checkpoint' in setup:
+        worker_kwargs['checkpoint'] = setup['checkpoint']
+
+    # report reader lag and senders queues every 'report_interval' seconds
+    report_interval = setup.get('runtime', {}).get('report_interval')
+    if report_interval:
+        worker_kwargs['report_interval'] = report_interval
+
+    # sharded sources: parsed in several processes
+    shards = setup.get('runtime', {}).get('shards')
+    if shards:
+        worker_kwargs['shards'] = shards
+        worker_kwargs['setup'] = setup
+
     return worker_kwargs
 
 
-class Worker(Process):
+class FileTail(object):
     """
-    Separate process for every log file.
+    Tailed file of worker: file source with its parsers and checkpoint.
+    """
+    def __init__(self, parser, tail, checkpoint=None, logger=None):
+        self.parser = parser
+        self.name = parser.get('name', None)
+        self.path = parser['path']
+        self.source = FileSource(self.path,
+                                 tail.get('block_size', 262144),
+                                 tail.get('rotate_timeout', 5.0))
+        self.checkpoint = None
+        if checkpoint is not None:
+            self.checkpoint = Checkpoint(name=self.name, logger=logger,
+                                         **checkpoint)
+        # inode of watched file
+        self.inode = None
+        # compiled parsers, bound to worker
+        self.run = None
+        # lines read since last report
+        self.lines_read = 0
+
+    def open(self, from_start=False):
+        """
+        Open file: resume from checkpoint or seek to the end (to the
+        beginning if 'from_start' is set).
+        """
+        position = None
+        if self.checkpoint is not None:
+            position = self.checkpoint.load()
+
+        if position is not None:
+            self.source.resume(position[0], position[1],
+                               self.checkpoint.max_backlog)
+        else:
+            self.source.open(0 if from_start else None)
 
-    Overhead? May be...
+    def watch(self, watcher):
+        """
+        Start watching file.
+        """
+        watcher.add(self.path)
+
+    def unwatch(self, watcher):
+        """
+        Stop watching file.
+        """
+        watcher.remove(self.path)
+
+    def processed(self, position=None):
+        """
+        Batch is processed: update checkpoint to 'position' (inode,
+        offset), current position of file by default.
+        """
+        if self.checkpoint is not None:
+            if position is None:
+                position = self.source.position()
+            self.checkpoint.update(*position)
+
+    def close(self):
+        """
+        Save position of last processed batch and close file.
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.save()
+        self.source.close()
+
+
+# chars not allowed in tag of file
+TAG_RE = re.compile(r'[^a-zA-Z0-9_-]+')
+
+
+def glob_name_re(pattern):
+    """
+    Compile glob pattern into regexp, which captures parts of path matched
+    by wildcards.
     """
-    def __init__(self, parser, hostname=None, statsd=None, graphite=None,
-                 daemonize=False, logger=None, parent_pid=None):
+    regexp = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '*':
+            regexp.append('([^/]*)')
+        elif char == '?':
+            regexp.append('([^/])')
+        elif char == '[' and pattern.find(']', i + 2) != -1:
+            end = pattern.find(']', i + 2)
+            chars = pattern[i + 1:end].replace('\\', '\\\\')
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            regexp.append('([%s])' % chars)
+            i = end
+        else:
+            regexp.append(re.escape(char))
+        i += 1
+    return re.compile(''.join(regexp) + '$')
+
+
+class ListenerTail(FileTail):
+    """
+    Network source of worker: listener with its parsers.
+
+    Listener ('gossip.listen') is read like tailed file, but it has no
+    checkpoint: lines sent while gossip is down are lost.
+    """
+    def __init__(self, parser, listen, checkpoint=None, logger=None):
         self.parser = parser
+        self.name = parser.get('name', None)
+        self.path = parser['path']
+        self.source = get_listener(parser['type'], self.path, **listen)
+        self.checkpoint = None
+        self.inode = None
+        self.run = None
+        self.lines_read = 0
+
+    def open(self, from_start=False):
+        """
+        Start listening.
+        """
+        self.source.open()
+
+    def watch(self, watcher):
+        """
+        Start watching socket.
+        """
+        self.source.watch(watcher, self.path)
+
+    def unwatch(self, watcher):
+        """
+        Stop watching socket.
+        """
+        if self.source.sock is not None:
+            watcher.remove_fd(self.source.sock.fileno())
+
+
+class FileGlob(object):
+    """
+    Glob or dir source of worker: files, which match pattern, are found at
+    runtime and tailed by the same worker.
+
+    Source 'dir <path>' is 'glob <path>/*.log'. Every file is tailed as
+    separate file source named '<source name>.<tag>', where tag is made of
+    parts of file path matched by wildcards (e.g. 'example_com' for
+    '/var/log/nginx/example.com.gossip.log' and '/var/log/nginx/*.gossip.log'),
+    and its metrics are tagged too (see 'gossip.stats.TaggedStats').
+    """
+    def __init__(self, parser):
+        self.parser = parser
+        self.name = parser['name']
+        if parser['type'] == 'dir':
+            self.pattern = os.path.join(parser['path'], '*.log')
+        else:
+            self.pattern = parser['path']
+        self.name_re = glob_name_re(self.pattern)
+        # tailed files
+        self.paths = set()
+        # tailed files, which aren't found by last scan: {path: time}
+        self.missing = {}
+
+    def dirs(self):
+        """
+        Get directories to watch for new files.
+        """
+        dirname = os.path.dirname(self.pattern)
+        if glob.has_magic(dirname):
+            return [path for path in glob.glob(dirname)
+                    if os.path.isdir(path)]
+        return [dirname]
+
+    def scan(self):
+        """
+        Get set of files, which match pattern now.
+        """
+        return set(path for path in glob.glob(self.pattern)
+                   if os.path.isfile(path))
+
+    def tag(self, path):
+        """
+        Get tag of file: parts of path matched by wildcards, file name if
+        pattern has no wildcards.
+        """
+        match = self.name_re.match(path)
+        parts = [part for part in match.groups() if part] if match else []
+        if not parts:
+            parts = [os.path.basename(path)]
+        return TAG_RE.sub('_', '_'.join(parts)).strip('_') or 'file'
+
+    def file_parser(self, path):
+        """
+        Get file source for file of glob.
+        """
+        tag = self.tag(path)
+        return dict(self.parser, type='file', path=path, tag=tag,
+                    name='%s.%s' % (self.name, tag), glob=self.name)
+
+
+class ShardWorker(Process):
+    """
+    Parser process of sharded source.
+
+    Run parsers for batches of lines read by reader worker and send stats
+    aggregated in memory back to reader every 'flush_interval' seconds,
+    with numbers of batches processed since last send (reader saves
+    checkpoint of batch only when its stats are merged) and state of parsers
+    merged by reader (see 'gossip.parsers.taker_of').
+    """
+    def __init__(self, parser, setup, batches, results, flush_interval=1.0,
+                 logger=None):
+        self.parser = parser
+        self.setup = setup
+        self.batches = batches
+        self.results = results
+        self.flush_interval = flush_interval
+        self.logger = logger
+        # numbers of batches processed since last send
+        self.done = []
+        # parsers with state merged by reader: {node name: parser}
+        self.shared = {}
+
+        super(ShardWorker, self).__init__()
+
+    def send(self, worker):
+        """
+        Send aggregated stats, numbers of processed batches and state of
+        shared parsers to reader.
+        """
+        if worker.report_interval:
+            worker.report()
+
+        statsd = graphite = None
+        if worker.statsd is not None:
+            statsd = worker.statsd.take()
+        if worker.graphite is not None:
+            graphite = worker.graphite.take()
+        states = {}
+        for node, parser in self.shared.iteritems():
+            state = parser.take()
+            if state:
+                states[node] = state
+        if ((statsd and any(statsd)) or (graphite and any(graphite)) or
+                self.done or states):
+            self.results.put((statsd, graphite, self.done, states))
+            self.done = []
+
+    def run(self):
+        """
+        Run shard worker.
+        """
+        signal.signal(signal.SIGTERM, terminate)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        parent_pid = os.getppid()
+
+        worker_kwargs = worker_setup(self.setup, aggregate=True)
+        worker_kwargs.pop('shards', None)
+        worker_kwargs.pop('setup', None)
+        worker = Worker([self.parser], logger=self.logger, **worker_kwargs)
+        run = worker.bind(self.parser, shard=True)
+        self.shared = run.shared
+
+        flush_time = time.time() + self.flush_interval
+        try:
+            while True:
+                try:
+                    batch = self.batches.get(timeout=self.flush_interval)
+                except Empty:
+                    # reader is dead
+                    if os.getppid() != parent_pid:
+                        break
+                    batch = ()
+                if batch is None:
+                    break
+                if batch:
+                    seq, lines = batch
+                    run(lines)
+                    self.done.append(seq)
+
+                now = time.time()
+                for tick in worker.ticks:
+                    tick(now)
+                if now >= flush_time:
+                    flush_time = now + self.flush_interval
+                    self.send(worker)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.send(worker)
+
+
+class ShardPool(object):
+    """
+    Parser processes of sharded source.
+
+    Reader puts batches of lines into bounded queue, shard workers take
+    them, and aggregated stats are merged by reader before sending. Batches
+    are numbered: when stats of all batches up to some one are merged,
+    'processed' is called with file position after that batch (to update
+    checkpoint), so lines of batches in flight are read again after crash.
+    State of shared parsers is merged into 'shared' parsers of reader
+    ({node name: parser}).
+    """
+    def __init__(self, parser, count, setup, logger=None, processed=None,
+                 shared=None):
+        self.batches = Queue(maxsize=count * 4)
+        self.results = Queue()
+        self.processed = processed
+        self.shared = shared or {}
+        self.seq = 0
+        # batches not acknowledged by shards: [(number, position)]
+        self.pending = deque()
+        self.acked = set()
+        flush_interval = setup.get('runtime', {}).get('flush_interval', 1.0)
+        self.workers = [
+            ShardWorker(parser, setup, self.batches, self.results,
+                        flush_interval=flush_interval, logger=logger)
+            for _ in range(count)
+        ]
+
+    def start(self):
+        """
+        Start shard workers.
+        """
+        for worker in self.workers:
+            worker.start()
+
+    def put(self, lines, position=None):
+        """
+        Put batch of lines (which ends at file 'position') for parsing,
+        block if all shards are busy.
+        """
+        self.seq += 1
+        self.pending.append((self.seq, position))
+        self.batches.put((self.seq, lines))
+
+    def collect(self, statsd, graphite):
+        """
+        Merge stats aggregated by shard workers into stats senders and
+        state of shared parsers, and report position of the last batch,
+        which is processed with all batches before it.
+        """
+        position = None
+        while True:
+            try:
+                statsd_stats, graphite_stats, done, states = \
+                    self.results.get_nowait()
+            except Empty:
+                break
+            if statsd is not None and statsd_stats is not None:
+                statsd.merge(*statsd_stats)
+            if graphite is not None and graphite_stats is not None:
+                graphite.merge(graphite_stats)
+            for node, state in states.iteritems():
+                if node in self.shared:
+                    self.shared[node].merge(state)
+            self.acked.update(done)
+
+        pending = self.pending
+        while pending and pending[0][0] in self.acked:
+            seq, position = pending.popleft()
+            self.acked.discard(seq)
+        if position is not None and self.processed is not None:
+            self.processed(position)
+
+    def stop(self, statsd, graphite):
+        """
+        Stop shard workers and collect their last stats.
+        """
+        # count workers first: one of them may take 'None' and exit
+        # before the next one is checked
+        alive = [worker for worker in self.workers if worker.is_alive()]
+        for _ in alive:
+            self.batches.put(None)
+        # results should be read before join, or workers could hang
+        while any(worker.is_alive() for worker in self.workers):
+            self.collect(statsd, graphite)
+            for worker in self.workers:
+                worker.join(0.1)
+        self.collect(statsd, graphite)
+
+
+class Worker(Process):
+    """
+    Process which tails one or more log files.
+
+    By default there is separate process for every log file, see 'do_work'.
+    """
+    def __init__(self, parsers, hostname=None, statsd=None, graphite=None,
+                 tail=None, listen=None, checkpoint=None, shards=None,
+                 setup=None,
+                 report_interval=None, config_file=None, daemonize=False,
+                 logger=None, parent_pid=None):
+        self.parsers = parsers
         self.hostname = hostname
         self.statsd = statsd
         self.graphite = graphite
+        self.tail = tail or {}
+        self.listen = listen or {}
+        self.checkpoint = checkpoint
+        self.shards = shards or {}
+        self.setup = setup or {}
+        # shard pools of sharded sources
+        self.pools = {}
+        # tickers of bound parsers
+        self.ticks = []
+        # tailed files, to report their lag
+        self.tails = {}
+        # glob and dir sources by name, and their watched directories
+        self.globs = {}
+        self.dirs = {}
+        self.report_interval = report_interval
+        self.report_time = time.time() + (report_interval or 0)
+        self.reported_dropped = 0
+        # parser nodes counters by source, see 'gossip.pipeline.instrument'
+        self.counters = {}
+        # config is parsed again on SIGHUP, see 'reload'
+        self.config_file = config_file
+        self.reload_requested = False
         self.daemonize = daemonize
         self.logger = logger
         self.parent_pid = parent_pid
-        self.logname = parser.get('name', None)
 
         super(Worker, self).__init__()
 
-    def do_action(self, data, parser):
-        """
-        Run parsers.
-        """
-        if 'cmd' in parser:
-            data = parser['cmd'](
-                data=data,
-                logname=self.logname,
-                hostname=self.hostname,
-                statsd=self.statsd,
-                graphite=self.graphite,
-                logger=self.logger,
-                **parser.get('args', {})
-            )
-        if data is None:
+    def error(self, message):
+        """
+        Log error message.
+        """
+        if self.logger is not None:
+            self.logger.error(message)
+        else:
+            print "ERROR: %s" % message
+
+    def bind(self, parser, shard=False):
+        """
+        Bind compiled parsers of source to worker.
+
+        Returns function, which runs all parsers for batch of lines. In
+        'shard' parsers with state merged by reader aren't ticked.
+        """
+        pipeline = parser.get('pipeline')
+        if pipeline is None:
+            pipeline = Pipeline(parser['parsers'])
+
+        counters = None
+        if self.report_interval:
+            counters = self.counters[parser.get('name', None)] = {}
+
+        # metrics of files of glob sources are tagged by file
+        statsd, graphite = self.statsd, self.graphite
+        tag = parser.get('tag')
+        if tag is not None:
+            if statsd is not None:
+                statsd = TaggedStats(statsd, tag)
+            if graphite is not None:
+                graphite = TaggedStats(graphite, tag)
+
+        run = pipeline.bind(
+            logname=parser.get('name', None),
+            hostname=self.hostname,
+            statsd=statsd,
+            graphite=graphite,
+            logger=self.logger,
+            counters=counters,
+            shard=shard,
+        )
+        self.ticks.extend(run.ticks)
+        return run
+
+    def tick(self):
+        """
+        Let parsers and stats senders send aggregated stats.
+        """
+        for pool in self.pools.itervalues():
+            pool.collect(self.statsd, self.graphite)
+
+        now = time.time()
+        for tick in self.ticks:
+            tick(now)
+        if self.report_interval and now >= self.report_time:
+            self.report_time = now + self.report_interval
+            self.report()
+        if self.statsd is not None:
+            self.statsd.tick(now)
+        if self.graphite is not None:
+            self.graphite.tick(now)
+
+    def report(self):
+        """
+        Send worker counters as 'gossip.self.*' metrics.
+
+        For every source: lines and bytes read, lag in bytes behind end of
+        file, calls, items and time in ms of every parser node. Graphite
+        queue depth and dropped metrics also. Counters are sent as deltas
+        since last report.
+        """
+        if self.statsd is not None:
+            gauge, incr = self.statsd.gauge, self.statsd.incr
+        elif self.graphite is not None:
+            gauge, incr = self.graphite.send, self.graphite.incr
+        else:
             return
-        for p in parser.get('parsers', ()):
-            self.do_action(data, p)
 
-    def tail_file(self):
+        prefix = 'gossip.self'
+        for tail in self.tails.itervalues():
+            incr('%s.lines_read' % tail.name, tail.lines_read, prefix=prefix)
+            incr('%s.bytes_read' % tail.name, tail.source.bytes_read,
+                 prefix=prefix)
+            gauge('%s.lag_bytes' % tail.name, tail.source.lag(),
+                  prefix=prefix)
+            tail.lines_read = tail.source.bytes_read = 0
+
+        for name, nodes in self.counters.iteritems():
+            for node, counter in nodes.iteritems():
+                calls, items, seconds = counter
+                if not calls:
+                    continue
+                metric = '%s.parser.%s' % (name, node)
+                incr('%s.calls' % metric, calls, prefix=prefix)
+                incr('%s.items' % metric, items, prefix=prefix)
+                incr('%s.time' % metric, int(seconds * 1000), prefix=prefix)
+                counter[:] = [0, 0, 0]
+
+        if self.graphite is not None and not self.graphite.aggregate:
+            counters = self.graphite.counters()
+            gauge('graphite.queue_depth', counters['depth'], prefix=prefix)
+            incr('graphite.dropped', counters['dropped'] -
+                 self.reported_dropped, prefix=prefix)
+            self.reported_dropped = counters['dropped']
+
+    def flush(self):
+        """
+        Send all aggregated stats.
+        """
+        if self.statsd is not None:
+            self.statsd.flush()
+        if self.graphite is not None:
+            self.graphite.flush()
+
+    def request_reload(self, signum, frame):
+        """
+        SIGHUP handler: reload parsers after current batch.
+        """
+        self.reload_requested = True
+
+    def reload(self, watcher, ready):
         """
-        Tail file.
+        Parse config file again and apply changes of worker sources in
+        place: files stay opened and read from the same offsets.
+
+        Only changed parsers are compiled again, parsers of unchanged
+        sources keep their state (e.g. 'send_top' counts, windows, sampling
+        rate). Files of removed sources are read till the end and closed,
+        sources with another file (or type) are closed and opened again.
+        New sources get new workers and sharded sources are restarted by
+        'Supervisor'.
         """
-        filename = self.parser['path']
+        self.reload_requested = False
+        if self.config_file is None:
+            return
+        config = Config(self.config_file)
+        if config.error is not None:
+            self.error("config is not reloaded: %s" % config.error)
+            return
+
+        sources = dict((source['name'], source) for source in config.config)
+        old = dict((parser['name'], parser) for parser in self.parsers)
+        moved = set(
+            name for name, parser in old.iteritems()
+            if name not in self.pools and (
+                name not in sources or
+                sources[name]['type'] != parser['type'] or
+                sources[name]['path'] != parser['path']))
+        for path, tail in self.tails.items():
+            if tail.parser.get('glob', tail.name) in moved:
+                self.close_tail(self.tails.pop(path), watcher)
+                ready.discard(path)
+        for name in moved & set(self.globs):
+            del self.globs[name]
+            for path, names in self.dirs.items():
+                names.discard(name)
+                if not names:
+                    del self.dirs[path]
+                    watcher.remove(path)
+        self.parsers = [sources[parser['name']] for parser in self.parsers
+                        if parser['name'] in sources]
+        for name in moved:
+            if name in sources:
+                self.open_source(sources[name], watcher, self.tails, ready)
+
+        reloaded = set()
+        for name, source in self.globs.iteritems():
+            parser = sources.get(name)
+            if (parser is not None and
+                    parser['type'] == source.parser['type'] and
+                    parser['path'] == source.parser['path']):
+                if (parsers_signature(parser['parsers']) !=
+                        parsers_signature(source.parser['parsers'])):
+                    reloaded.add(name)
+                source.parser = parser
+
+        self.ticks = []
+        for tail in self.tails.itervalues():
+            if tail.parser.get('glob', tail.name) in moved:
+                # bound on open
+                parser = None
+            elif tail.parser.get('glob') in reloaded:
+                parser = self.globs[tail.parser['glob']].file_parser(
+                    tail.path)
+            else:
+                parser = sources.get(tail.name)
+                if parser is not None and (
+                        parser['path'] != tail.path or
+                        tail.name in self.pools or
+                        parsers_signature(parser['parsers']) ==
+                        parsers_signature(tail.parser['parsers'])):
+                    parser = None
+            if parser is not None:
+                tail.parser = parser
+                tail.run = self.bind(parser)
+            else:
+                self.ticks.extend(tail.run.ticks)
+        if self.logger is not None:
+            self.logger.info("parsers are reloaded from '%s'" %
+                             self.config_file)
+
+    def open_tail(self, parser, watcher, from_start=False):
+        """
+        Open file source and start watching it.
+
+        Returns None if file can't be opened.
+        """
+        if parser['type'] in LISTENERS:
+            try:
+                tail = ListenerTail(parser, self.listen)
+            except ValueError, e:
+                self.error(str(e))
+                return None
+        else:
+            tail = FileTail(parser, self.tail, self.checkpoint, self.logger)
         try:
-            with open(filename, 'r') as f:
-                f.seek(0, 2)
-                while True:
-                    # see if I am a daemon and my Parent is at home
-                    if self.daemonize and os.getppid() != self.parent_pid:
-                        # woe is me! My Parent has died!
-                        break
-                    line = f.readline()
-                    if line:
-                        self.do_action(line.strip(), self.parser)
-                    else:
-                        time.sleep(0.1)
-        except IOError, e:
-            if self.logger is not None:
-                self.logger.error("can't read from config file"
-                                  " '%s': %s" % (filename, e))
+            tail.open(from_start)
+            tail.watch(watcher)
+        except (IOError, OSError, socket.error, WatcherError), e:
+            self.error("can't read from %s '%s': %s" % (
+                'socket' if parser['type'] in LISTENERS else 'log file',
+                tail.path, e))
+            tail.close()
+            return None
+        tail.inode = tail.source.inode
+        tail.run = self.bind(parser)
+        return tail
+
+    def close_tail(self, tail, watcher):
+        """
+        Drain file source of removed file, close it and stop watching.
+        """
+        while self.read_tail(tail, watcher):
+            pass
+        tail.close()
+        tail.unwatch(watcher)
+        for tick in tail.run.ticks:
+            self.ticks.remove(tick)
+        self.counters.pop(tail.name, None)
+
+    def scan_glob(self, source, watcher, tails, ready, from_start=True):
+        """
+        Find files of glob source: start tailing new files (from the
+        beginning, if 'from_start' is set) and stop tailing files, which are
+        missing for 'rotate_timeout' seconds (rotated file is recreated
+        meanwhile).
+        """
+        for path in source.dirs():
+            if path not in self.dirs:
+                try:
+                    watcher.add_dir(path)
+                except WatcherError, e:
+                    self.error(str(e))
+                    continue
+                self.dirs[path] = set()
+            self.dirs[path].add(source.name)
+
+        found = source.scan()
+        for path in found - source.paths:
+            if path in tails:
+                # file is tailed by another source
+                continue
+            tail = self.open_tail(source.file_parser(path), watcher,
+                                  from_start)
+            if tail is None:
+                continue
+            tails[path] = tail
+            source.paths.add(path)
+            ready.add(path)
+
+        now = time.time()
+        timeout = self.tail.get('rotate_timeout', 5.0)
+        for path in source.paths - found:
+            missing = source.missing.setdefault(path, now)
+            if now - missing >= timeout:
+                self.close_tail(tails.pop(path), watcher)
+                source.paths.discard(path)
+                source.missing.pop(path)
+                ready.discard(path)
+        for path in found:
+            source.missing.pop(path, None)
+
+    def open_tails(self, watcher):
+        """
+        Open all file sources of worker and start watching them.
+
+        Files of glob sources are found by first scan.
+        """
+        tails = {}
+        for parser in self.parsers:
+            self.open_source(parser, watcher, tails)
+        return tails
+
+    def open_source(self, parser, watcher, tails, ready=None):
+        """
+        Open source of worker: add it to 'tails' (and 'ready' set), or to
+        glob sources, which files are found by scan.
+        """
+        if parser['type'] in ('glob', 'dir'):
+            source = self.globs[parser['name']] = FileGlob(parser)
+            if ready is not None:
+                self.scan_glob(source, watcher, tails, ready, False)
+            return
+        if parser['type'] != 'file' and parser['type'] not in LISTENERS:
+            return
+        if parser['path'] in tails:
+            self.error("'%s' is tailed by another source" % parser['path'])
+            return
+        tail = self.open_tail(parser, watcher)
+        if tail is None:
+            return
+        tails[tail.path] = tail
+        if ready is not None:
+            ready.add(tail.path)
+
+        if tail.name in self.shards:
+            pool = ShardPool(parser, self.shards[tail.name], self.setup,
+                             self.logger, processed=tail.processed,
+                             shared=tail.run.shared)
+            pool.start()
+            self.pools[tail.name] = pool
+
+    def read_tail(self, tail, watcher):
+        """
+        Read next block from tailed file and process it.
+
+        Returns False if end of file is reached.
+        """
+        try:
+            lines = tail.source.read_lines()
+        except (IOError, OSError), e:
+            self.error("can't read from log file '%s': %s" % (tail.path, e))
+            return False
+
+        if lines:
+            tail.lines_read += len(lines)
+            if tail.name in self.pools:
+                # checkpoint is updated when shards have processed batch
+                self.pools[tail.name].put(lines, tail.source.position())
             else:
-                print ("ERROR: can't read from config file"
-                       " '%s': %s" % (filename, e))
+                tail.run(lines)
+                tail.processed()
+
+        # file is rotated: watch new one
+        if tail.source.inode != tail.inode:
+            tail.inode = tail.source.inode
+            watcher.add(tail.path)
+
+        return lines is not None
+
+    def tail_files(self):
+        """
+        Tail all files of worker in one loop.
+
+        Read one block from every file which has new data, and wait for
+        changes when all files are read till the end.
+        """
+        # wake up from time to time even if nothing happens with files
+        timeout = self.tail.get('timeout', 1.0)
+        watcher = None
+        tails = {}
+        try:
+            watcher = get_watcher(self.tail.get('engine', 'auto'),
+                                  self.tail.get('interval', 0.1))
+            tails = self.tails = self.open_tails(watcher)
+            ready = set(tails)
+
+            # files of glob sources: existing files are read like file
+            # sources, new ones are found every 'scan_interval' seconds (or
+            # when inotify reports changes in directory)
+            scan_interval = self.tail.get('scan_interval', 10.0)
+            scan_time = time.time() + scan_interval
+            for source in self.globs.itervalues():
+                self.scan_glob(source, watcher, tails, ready, False)
+            scan = set()
+            # all files are checked for rotation at least every 'timeout'
+            # seconds, even if other files keep watcher busy
+            check_time = time.time() + timeout
+
+            while tails or self.globs:
+                # see if I am a daemon and my Parent is at home
+                if self.daemonize and os.getppid() != self.parent_pid:
+                    # woe is me! My Parent has died!
+                    break
+
+                for path in list(ready):
+                    if not self.read_tail(tails[path], watcher):
+                        ready.discard(path)
+                self.tick()
+                if self.reload_requested:
+                    self.reload(watcher, ready)
+
+                if self.globs and time.time() >= scan_time:
+                    scan_time = time.time() + scan_interval
+                    scan.update(self.globs)
+                for name in scan:
+                    if name in self.globs:
+                        self.scan_glob(self.globs[name], watcher, tails,
+                                       ready)
+                scan.clear()
+
+                if not ready:
+                    changed = watcher.wait(timeout)
+                    for path in changed & set(self.dirs):
+                        scan.update(self.dirs[path])
+                    ready = changed & set(tails)
+                    if not changed:
+                        # timeout: check all files for rotation
+                        check_time = 0
+                if time.time() >= check_time:
+                    check_time = time.time() + timeout
+                    ready.update(tails)
+        except WatcherError, e:
+            self.error(str(e))
         except KeyboardInterrupt:
             pass
+        finally:
+            # send stats and save position of last processed batches
+            for pool in self.pools.itervalues():
+                pool.stop(self.statsd, self.graphite)
+            self.flush()
+            if self.graphite is not None:
+                self.graphite.stop()
+            for tail in tails.itervalues():
+                tail.close()
+            if watcher is not None:
+                watcher.close()
 
     def run(self):
         """
         Run worker.
         """
-        if self.parser['type'] == 'file':
-            self.tail_file()
+        # exit gracefully on terminate, so checkpoints are saved
+        signal.signal(signal.SIGTERM, terminate)
+        signal.signal(signal.SIGHUP, self.request_reload)
 
+        self.tail_files()
 
-def do_work(config, args, logger, daemonize=False):
+
+def source_groups(config):
+    """
+    Group sources of config by worker processes.
+
+    Runtime mode is defined in 'runtime' setup section:
+     - 'process': separate process for every log file (default);
+     - 'single': one process for all log files;
+     - 'pool': log files are distributed among 'workers' processes.
+
+    Sources from 'shards' ({source name: number of parser processes}) are
+    always tailed by separate reader process.
+    """
+    runtime = config.setup.get('runtime', {})
+    mode = runtime.get('mode', 'process')
+    shards = runtime.get('shards', {})
+    sources = [p for p in config.config if p['name'] not in shards]
+    if mode == 'process':
+        groups = [[parser] for parser in sources]
+    elif mode == 'single':
+        groups = [sources] if sources else []
+    elif mode == 'pool':
+        workers = max(1, min(runtime.get('workers', 2), len(sources)))
+        groups = ([sources[i::workers] for i in range(workers)]
+                  if sources else [])
+    else:
+        raise ValueError("unknown runtime mode '%s'" % mode)
+    groups.extend([p] for p in config.config if p['name'] in shards)
+    return groups
+
+
+def unsharded_setup(setup):
     """
-    Run process for every log file from config.
+    Get 'setup' section without 'shards' of 'runtime'.
     """
-    worker_kwargs = worker_setup(config.setup)
+    runtime = dict(setup.get('runtime', {}))
+    runtime.pop('shards', None)
+    return dict(setup, runtime=runtime)
 
-    jobs = []
-    for parser in config.config:
-        job = Worker(parser, daemonize=daemonize, parent_pid=os.getpid(),
-                     logger=logger, **worker_kwargs)
-        jobs.append(job)
+
+class Supervisor(object):
+    """
+    Run workers for sources of config and reload config on SIGHUP.
+
+    On reload sources are compared by name: workers of changed, moved (to
+    another file) or removed sources reload them in place, new sources get
+    new workers. Workers of sharded sources are restarted, if sources are
+    changed or their number of shards is changed. If the rest of 'setup'
+    section is changed, all workers are restarted.
+    """
+    def __init__(self, config, logger=None, daemonize=False):
+        self.config = config
+        self.logger = logger
+        self.daemonize = daemonize
+        self.worker_kwargs = worker_setup(config.setup)
+        # [(worker, names of its sources)]
+        self.jobs = []
+        self.reload_requested = False
+
+    def info(self, message):
+        """
+        Log info message.
+        """
+        if self.logger is not None:
+            self.logger.info(message)
+
+    def start(self, sources):
+        """
+        Start worker for sources.
+        """
+        job = Worker(sources, daemonize=self.daemonize,
+                     parent_pid=os.getpid(), logger=self.logger,
+                     config_file=self.config.filename, **self.worker_kwargs)
         job.start()
+        self.jobs.append((job, [source['name'] for source in sources]))
+
+    def stop(self, job):
+        """
+        Stop worker: it saves checkpoints and sends stats before exit.
+        """
+        job.terminate()
+        job.join()
+
+    def request_reload(self, signum, frame):
+        """
+        SIGHUP handler: reload config in main loop.
+        """
+        self.reload_requested = True
+
+    def reload(self):
+        """
+        Parse config file again and apply changes.
+        """
+        self.reload_requested = False
+        config = Config(self.config.filename)
+        if config.error is not None:
+            message = "config is not reloaded: %s" % config.error
+            if self.logger is not None:
+                self.logger.error(message)
+            else:
+                print "ERROR: %s" % message
+            return
+
+        old = dict((s['name'], s) for s in self.config.config)
+        new = dict((s['name'], s) for s in config.config)
+        old_shards = self.config.setup.get('runtime', {}).get('shards', {})
+        shards = config.setup.get('runtime', {}).get('shards', {})
+        restart_all = (unsharded_setup(config.setup) !=
+                       unsharded_setup(self.config.setup))
+        if config.setup != self.config.setup:
+            self.worker_kwargs = worker_setup(config.setup)
+        self.config = config
+
+        jobs = self.jobs
+        self.jobs = []
+        for job, names in jobs:
+            moved = [
+                name for name in names
+                if name not in new or
+                new[name]['type'] != old[name]['type'] or
+                new[name]['path'] != old[name]['path']
+            ]
+            changed = [
+                name for name in names
+                if name in new and
+                parsers_signature(new[name]['parsers']) !=
+                parsers_signature(old[name]['parsers'])
+            ]
+            resharded = [name for name in names
+                         if shards.get(name) != old_shards.get(name)]
+            if (restart_all or resharded or
+                    set(moved + changed) & set(shards)):
+                self.stop(job)
+                # sharded sources have their own reader
+                sources = [new[name] for name in names
+                           if name in new and name not in shards]
+                if sources:
+                    self.start(sources)
+                for name in names:
+                    if name in new and name in shards:
+                        self.start([new[name]])
+                continue
+            if not any(name in new for name in names):
+                self.stop(job)
+                continue
+
+            if moved or changed:
+                os.kill(job.pid, signal.SIGHUP)
+            names = [name for name in names if name in new]
+            self.jobs.append((job, names))
+
+        added = [s for s in config.config if s['name'] not in old]
+        if added:
+            for sources in source_groups(config):
+                sources = [s for s in sources if s['name'] not in old]
+                if sources:
+                    self.start(sources)
+        self.info("config '%s' is reloaded" % config.filename)
+
+    def run(self):
+        """
+        Run workers till all of them exit.
+        """
+        signal.signal(signal.SIGHUP, self.request_reload)
+        for sources in source_groups(self.config):
+            self.start(sources)
+
+        try:
+            # one short wait for all workers (SIGHUP interrupts it), dead
+            # ones are reaped by 'is_alive'
+            while any(job.is_alive() for job, _ in self.jobs):
+                time.sleep(0.5)
+                if self.reload_requested:
+                    self.reload()
+        except KeyboardInterrupt:
+            for job, _ in self.jobs:
+                job.terminate()
+                job.join()
+
+
+def do_work(config, args, logger, daemonize=False):
+    """
+    Run workers for log files from config, see 'Supervisor'.
+    """
+    Supervisor(config, logger, daemonize).run()
+
+
+def count_parsers(parsers):
+    """
+    Count parsers in parsers tree.
+    """
+    return sum(1 + count_parsers(parser.get('parsers', ()))
+               for parser in parsers)
+
+
+def do_check(filename, started=None):
+    """
+    Check config file without starting workers: parse it, import and
+    compile parsers, check runtime mode and listeners addresses. Prints
+    sources and time of config load ('started' is time of process start).
+
+    Returns True if config is valid.
+    """
+    loaded = time.time()
+    config = Config(filename)
+    elapsed = time.time() - loaded
+    if config.error is not None:
+        # error is printed by config parser
+        return False
 
     try:
-        for job in jobs:
-            job.join()
-    except KeyboardInterrupt:
-        for job in jobs:
-            job.terminate()
-            job.join()
+        groups = source_groups(config)
+        for source in config.config:
+            if source['type'] in LISTENERS:
+                get_listener(source['type'], source['path'],
+                             **config.setup.get('listen', {}))
+    except (TypeError, ValueError), e:
+        print "ERROR: %s" % e
+        return False
+
+    for source in config.config:
+        print "%s '%s' as %s: %d parsers" % (
+            source['type'], source['path'], source['name'],
+            count_parsers(source['parsers']))
+    print "config '%s' is OK: %d sources in %d processes" % (
+        config.filename, len(config.config), len(groups))
+    if started is not None:
+        print "startup: %.1f ms" % ((loaded - started) * 1000)
+    print "config load: %.1f ms (parsers import: %.1f ms)" % (
+        elapsed * 1000, config.import_time * 1000)
+    return True